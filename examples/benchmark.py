@@ -0,0 +1,220 @@
+#! /usr/bin/env python
+
+"""
+benchmark
+Time every phase of xsd_to_django_model over the examples.
+
+Usage:
+    benchmark.py [-o <results_filename>] [-b <baseline_filename>]
+                 [-r <repeat>] [-t <tolerance>] [-d <min_delta>]
+                 [--save-baseline] [<example>...]
+    benchmark.py --run <example_dir>
+    benchmark.py -h | --help
+
+Options:
+    -h --help                Show this screen.
+    -o <results_filename>    Output JSON results filename.
+    -b <baseline_filename>   Baseline JSON results filename
+                             [default: benchmark_baseline.json].
+    -r <repeat>              Number of runs of every example, the fastest
+                             one is kept [default: 3].
+    -t <tolerance>           Relative slowdown of a phase, or growth of the
+                             peak memory, reported as a regression
+                             [default: 0.25].
+    -d <min_delta>           Smallest slowdown in seconds reported as a
+                             regression [default: 0.05].
+    --save-baseline          Save the results as the new baseline instead of
+                             comparing them with it.
+    --run <example_dir>      Run a single example and print its timings.
+    <example>                Example directories to run, relative to this
+                             directory; all of them by default.
+
+Every example is run in a process of its own, on a copy of its directory,
+with the arguments found in its README.md. The phases are: schema load
+(cold, then from the pickled cache), make_models, merge_models, build_code
+(rendering the code of every model again) and write. For every phase, wall
+and CPU time and the peak resident memory of the process so far are
+reported. The baseline depends on the machine it was recorded on, so it is
+not part of the repository: save your own before changing the code.
+"""
+
+
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+
+EXAMPLES_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(EXAMPLES_DIR)
+PHASES = ('load_cold', 'load_cached', 'make_models', 'merge_models',
+          'build_code', 'write')
+MIN_MEMORY_DELTA_KB = 10240
+
+
+def get_examples():
+    examples = {}
+    for readme in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '**',
+                                                'README.md'),
+                                   recursive=True)):
+        with open(readme, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('PYTHONPATH'):
+                    argv = line.split()[2:]
+                    examples[os.path.relpath(os.path.dirname(readme),
+                                             EXAMPLES_DIR)] = argv
+                    break
+    return examples
+
+
+def run_phases(argv):
+    # Runs in a process of its own, with the schema directory as the current
+    # directory, so that its settings are imported
+    sys.path[:0] = [os.getcwd(), PACKAGE_DIR]
+    from xsd_to_django_model import xsd_to_django_model as x2d
+
+    args = docopt(x2d.__doc__, argv=argv)
+    # Imported before timing, so that load_cold measures schema loading
+    # alone, like it did when the module imported xmlschema eagerly
+    x2d.import_xmlschema()
+    results = {}
+
+    def phase(name, func, *func_args, **kwargs):
+        wall, cpu = time.perf_counter(), time.process_time()
+        value = func(*func_args, **kwargs)
+        results[name] = {
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu,
+            'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        return value
+
+    def make_builder():
+        return x2d.XSDModelBuilder(args['<xsd_filename>'], args['-f'],
+                                   string_refs=bool(args['-p']))
+
+    def build_code():
+        for model in builder.models.values():
+            model.build_code()
+
+    def write():
+        builder.write(
+            None if args['-p'] else open(args['-m'], 'w', encoding='utf-8'),
+            open(args['-f'], 'w', encoding='utf-8') if args['-f'] else None,
+            open(args['-j'], 'w', encoding='utf-8'),
+            models_package=args['-p'],
+            grouping=args['-g'])
+
+    phase('load_cold', make_builder)
+    builder = phase('load_cached', make_builder)
+    phase('make_models', builder.make_models, args['<xsd_type>'])
+    phase('merge_models', builder.merge_models)
+    phase('build_code', build_code)
+    phase('write', write)
+    return results
+
+
+def run(example, repeat):
+    best = None
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            workdir = os.path.join(tmpdir, 'example')
+            shutil.copytree(os.path.join(EXAMPLES_DIR, example), workdir,
+                            ignore=shutil.ignore_patterns('*.pickle',
+                                                          '__pycache__'))
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', example],
+                cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+        if process.returncode:
+            return {'error': process.stderr.strip().splitlines()[-1]}
+        results = json.loads(process.stdout)
+        if best is None:
+            best = results
+            continue
+        for name, timings in results.items():
+            if timings['wall'] < best[name]['wall']:
+                best[name] = timings
+    return best
+
+
+def compare(results, baseline, tolerance, min_delta):
+    regressions = []
+    for example, phases in sorted(results['examples'].items()):
+        base_phases = baseline['examples'].get(example)
+        if not base_phases or 'error' in phases or 'error' in base_phases:
+            continue
+        for name in PHASES:
+            wall = phases[name]['wall']
+            base_wall = base_phases[name]['wall']
+            if wall > base_wall * (1 + tolerance) and \
+                    wall - base_wall > min_delta:
+                regressions.append('%s %s: %.3fs -> %.3fs (%+.0f%%)' % (
+                    example, name, base_wall, wall,
+                    (wall / base_wall - 1) * 100))
+        memory = max(p['maxrss_kb'] for p in phases.values())
+        base_memory = max(p['maxrss_kb'] for p in base_phases.values())
+        if memory > base_memory * (1 + tolerance) and \
+                memory - base_memory > MIN_MEMORY_DELTA_KB:
+            regressions.append('%s peak memory: %d MB -> %d MB' % (
+                example, base_memory // 1024, memory // 1024))
+    return regressions
+
+
+def main():
+    args = docopt(__doc__)
+    if args['--run']:
+        json.dump(run_phases(get_examples()[args['--run']]), sys.stdout)
+        return
+
+    examples = get_examples()
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'examples': {},
+    }
+    for example in args['<example>'] or sorted(examples):
+        example = os.path.normpath(example)
+        if example not in examples:
+            sys.exit("Unknown example: %s" % example)
+        phases = results['examples'][example] = run(example, int(args['-r']))
+        if 'error' in phases:
+            print('%-30s error: %s' % (example, phases['error']))
+            continue
+        print('%-30s %s' % (example, '  '.join(
+            '%s %.3fs' % (name, phases[name]['wall']) for name in PHASES)))
+        print('%-30s peak memory %d MB' % (
+            '', max(p['maxrss_kb'] for p in phases.values()) // 1024))
+
+    if args['-o']:
+        with open(args['-o'], 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    baseline_filename = os.path.join(EXAMPLES_DIR, args['-b'])
+    if args['--save-baseline']:
+        with open(baseline_filename, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        return
+    if not os.path.exists(baseline_filename):
+        print('No baseline to compare with, save one with --save-baseline')
+        return
+    with open(baseline_filename) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, float(args['-t']),
+                          float(args['-d']))
+    for regression in regressions:
+        print('REGRESSION %s' % regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,36 @@ from django.contrib.postgres.fields import ArrayField
 
 
 
+CATEGORY_CHOICES = [
+    ("Anatomy/cell type resources", "Anatomy/cell type resources"),
+    ("Biological sample resources", "Biological sample resources"),
+    ("Cell line collections (Providers)", "Cell line collections (Providers)"),
+    ("Cell line databases/resources", "Cell line databases/resources"),
+    ("Chemistry resources", "Chemistry resources"),
+    ("CRISP screens repositories", "CRISP screens repositories"),
+    ("Encyclopedic resources", "Encyclopedic resources"),
+    ("Experimental variables resources", "Experimental variables resources"),
+    ("Gene expression databases", "Gene expression databases"),
+    ("Medical resources", "Medical resources"),
+    ("Metabolomic databases", "Metabolomic databases"),
+    ("Organism-specific databases", "Organism-specific databases"),
+    ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
+    ("Proteomic databases", "Proteomic databases"),
+    ("Reference resources", "Reference resources"),
+    ("Sequence databases", "Sequence databases"),
+    ("Taxonomy", "Taxonomy")
+]
+CV_TERM_TERMINOLOGY_CHOICES = [
+    ("Cellosaurus", "Cellosaurus"),
+    ("ChEBI", "ChEBI"),
+    ("DrugBank", "DrugBank"),
+    ("NCBI-Taxonomy", "NCBI-Taxonomy"),
+    ("NCIt", "NCIt"),
+    ("ORDO", "ORDO"),
+    ("PubChem", "PubChem"),
+    ("UBERON", "UBERON"),
+    ("CL", "CL")
+]
 
 
 # Corresponds to XSD type[s]:
@@ -158,24 +188,7 @@ class HlaTyping(models.Model):
         "Describes the HLA source for a cell line and a HLA typing list.::\n"
         "Describes a cross-reference.::\n"
         "hlaTypingSource_xref_category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35,
         null=True
     )
@@ -335,6 +348,92 @@ class SequenceVariation(models.Model):
     # )
 
 
+# Corresponds to XSD type[s]: typename1.cellLineList_cell-
+#  line.resistanceList_resistance.xref_propertyList
+class typename1.cellLineList_cell-line.resistanceList_resistance.xref_propertyList(models.Model):
+    AUTO_ONE_TO_MANY_FIELDS = {
+        "property": "",
+    }
+    # property is declared as a reverse relation
+    #  from typename1.cellLineList_cell-line.resistanceList_resistance.xref_propertyList.property
+    # property = OneToManyField(
+    #     typename1.cellLineList_cell-line.resistanceList_resistance.xref_propertyList.property,
+    #     verbose_name="property"
+    # )
+
+    class Meta:
+        verbose_name = "Describes the collection of properties."
+
+
+# Corresponds to XSD type[s]: typename1.cellLineList_cell-
+#  line.resistanceList_resistance
+class typename1.cellLineList_cell-line.resistanceList_resistance(models.Model):
+    # xs:choice start
+    # cv-term.@terminology => cvTerm_terminology
+    cvTerm_terminology = models.CharField(
+        "cvTerm::cvTerm_terminology",
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
+        max_length=13,
+        null=True
+    )
+    # cv-term.@accession => cvTerm_accession
+    cvTerm_accession = models.TextField("cvTerm::cvTerm_accession", null=True)
+    # cv-term => cvTerm
+    cvTerm = models.TextField("cvTerm", null=True)
+    # xref.@database => xref_database
+    xref_database = models.TextField(
+        "Describes a cross-reference.::xref_database",
+        null=True
+    )
+    # xref.@category => xref_category
+    xref_category = models.CharField(
+        "Describes a cross-reference.::xref_category",
+        choices=CATEGORY_CHOICES,
+        max_length=35,
+        null=True
+    )
+    # xref.@accession => xref_accession
+    xref_accession = models.TextField(
+        "Describes a cross-reference.::xref_accession",
+        null=True
+    )
+    # xref.property-list => xref_propertyList
+    xref_propertyList = models.ManyToManyField(
+        typename1.cellLineList_cell-line.resistanceList_resistance.xref_propertyList,
+        verbose_name="Describes a cross-reference.::Describes the "
+        "collection of properties."
+    )
+    xref_url = models.TextField(
+        "Describes a cross-reference.::xref_url",
+        null=True
+    )
+    # xs:choice end
+
+    class Meta:
+        verbose_name = "Describes a resistance of the cell line."
+
+
+# Corresponds to XSD type[s]: typename1.cellLineList_cell-
+#  line.transformantList_transformant
+class typename1.cellLineList_cell-line.transformantList_transformant(models.Model):
+    # cv-term.@terminology => cvTerm_terminology
+    cvTerm_terminology = models.CharField(
+        "cvTerm::cvTerm_terminology",
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
+        max_length=13,
+        null=True
+    )
+    # cv-term.@accession => cvTerm_accession
+    cvTerm_accession = models.TextField("cvTerm::cvTerm_accession", null=True)
+    # cv-term => cvTerm
+    cvTerm = models.TextField("cvTerm", null=True)
+    # transformant-note => transformantNote
+    transformantNote = models.TextField("transformantNote", null=True)
+
+    class Meta:
+        verbose_name = "Describes a transformant."
+
+
 # Corresponds to XSD type[s]: typename1.cellLineList_cell-line
 class CellLine(models.Model):
     AUTO_ONE_TO_MANY_FIELDS = {
@@ -542,17 +641,7 @@ class CellLine(models.Model):
         "Describes the cell-type the cell line is derived from.::\n"
         "cellType_cvTerm::\n"
         "cellType_cvTerm_terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13,
         null=True
     )
@@ -599,6 +688,17 @@ class CellLine(models.Model):
         null=True
     )
     # xs:choice end
+    # transformant-list => transformantList
+    transformantList = models.ManyToManyField(
+        typename1.cellLineList_cell-line.transformantList_transformant,
+        verbose_name="Describes the collection of transformants of a cell "
+        "line."
+    )
+    # resistance-list => resistanceList
+    resistanceList = models.ManyToManyField(
+        typename1.cellLineList_cell-line.resistanceList_resistance,
+        verbose_name="Describes the list of resistances of a cell line."
+    )
     # misspelling-list => misspellingList
     misspellingList = models.ManyToManyField(
         Misspelling,
@@ -686,24 +786,7 @@ class CellLineXref(models.Model):
     # @category => category
     category = models.CharField(
         "category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35
     )
     # @accession => accession
@@ -855,10 +938,8 @@ class Comment(models.Model):
             ("Part of", "Part of"),
             ("Population", "Population"),
             ("Problematic cell line", "Problematic cell line"),
-            ("Selected for resistance to", "Selected for resistance to"),
             ("Senescence", "Senescence"),
             ("Transfected with", "Transfected with"),
-            ("Transformant", "Transformant"),
             ("Virology", "Virology")
         ],
         max_length=27
@@ -876,17 +957,7 @@ class Comment(models.Model):
     # cv-term.@terminology => cvTerm_terminology
     cvTerm_terminology = models.CharField(
         "cvTerm::cvTerm_terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13,
         null=True
     )
@@ -918,24 +989,7 @@ class CommentXref(models.Model):
     # @category => category
     category = models.CharField(
         "category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35
     )
     # @accession => accession
@@ -985,17 +1039,7 @@ class DerivedFrom(models.Model):
     # @terminology => terminology
     terminology = models.CharField(
         "terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13
     )
     # @accession => accession
@@ -1016,17 +1060,7 @@ class Disease(models.Model):
     # @terminology => terminology
     terminology = models.CharField(
         "terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13
     )
     # @accession => accession
@@ -1054,24 +1088,7 @@ class DoublingTimeSourceXref(models.Model):
     # @category => category
     category = models.CharField(
         "category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35
     )
     # @accession => accession
@@ -1218,24 +1235,7 @@ class MisspellingXref(models.Model):
     # @category => category
     category = models.CharField(
         "category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35
     )
     # @accession => accession
@@ -1411,24 +1411,7 @@ class PublicationXref(models.Model):
     # @category => category
     category = models.CharField(
         "category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35
     )
     # @accession => accession
@@ -1493,17 +1476,7 @@ class SameOriginAs(models.Model):
     # @terminology => terminology
     terminology = models.CharField(
         "terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13
     )
     # @accession => accession
@@ -1556,24 +1529,7 @@ class SequenceVariationXref(models.Model):
     # @category => category
     category = models.CharField(
         "category",
-        choices=[
-            ("Anatomy/cell type resources", "Anatomy/cell type resources"),
-            ("Biological sample resources", "Biological sample resources"),
-            ("Cell line collections (Providers)", "Cell line collections (Providers)"),
-            ("Cell line databases/resources", "Cell line databases/resources"),
-            ("Chemistry resources", "Chemistry resources"),
-            ("Encyclopedic resources", "Encyclopedic resources"),
-            ("Experimental variables resources", "Experimental variables resources"),
-            ("Gene expression databases", "Gene expression databases"),
-            ("Medical resources", "Medical resources"),
-            ("Metabolomic databases", "Metabolomic databases"),
-            ("Organism-specific databases", "Organism-specific databases"),
-            ("Polymorphism and mutation databases", "Polymorphism and mutation databases"),
-            ("Proteomic databases", "Proteomic databases"),
-            ("Reference resources", "Reference resources"),
-            ("Sequence databases", "Sequence databases"),
-            ("Taxonomy", "Taxonomy")
-        ],
+        choices=CATEGORY_CHOICES,
         max_length=35
     )
     # @accession => accession
@@ -1655,17 +1611,7 @@ class SiteCvTerm(models.Model):
     # @terminology => terminology
     terminology = models.CharField(
         "terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13
     )
     # @accession => accession
@@ -1686,17 +1632,7 @@ class Species(models.Model):
     # @terminology => terminology
     terminology = models.CharField(
         "terminology",
-        choices=[
-            ("Cellosaurus", "Cellosaurus"),
-            ("ChEBI", "ChEBI"),
-            ("DrugBank", "DrugBank"),
-            ("NCBI-Taxonomy", "NCBI-Taxonomy"),
-            ("NCIt", "NCIt"),
-            ("ORDO", "ORDO"),
-            ("PubChem", "PubChem"),
-            ("UBERON", "UBERON"),
-            ("CL", "CL")
-        ],
+        choices=CV_TERM_TERMINOLOGY_CHOICES,
         max_length=13
     )
     # @accession => accession
@@ -1777,3 +1713,26 @@ class StrMarkerData(models.Model):
 
     class Meta:
         verbose_name = "Describes the STR marker data for a cell line."
+
+
+# Corresponds to XSD type[s]: typename1.cellLineList_cell-
+#  line.resistanceList_resistance.xref_propertyList.property
+class typename1.cellLineList_cell-line.resistanceList_resistance.xref_propertyList.property(models.Model):
+    # @name => name
+    name = models.TextField("name")
+    # @value => value
+    value = models.TextField("value")
+    # @value-type => valueType
+    valueType = models.TextField("valueType", null=True)
+    # @accession => accession
+    accession = models.TextField("accession", null=True)
+    # FIXME: typename1.cell_line_list_cell-
+    #  line.resistance_list_resistance.xref_property_list hits PostgreSQL column
+    #  name 63 char limit!
+    typename1.cell_line_list_cell-line.resistance_list_resistance.xref_property_list = \
+        models.ForeignKey(
+            'typename1.cellLineList_cell-line.resistanceList_resistance.xref_propertyList',
+            on_delete=models.CASCADE,
+            related_name="property",
+            verbose_name="Describes the collection of properties."
+        )
@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+
+"""
+scaling
+Time every phase of xsd_to_django_model over synthetic schemas of growing
+size, to see how each phase scales.
+
+Usage:
+    scaling.py [-s <sizes>] [-r <repeat>] [-o <results_filename>]
+               [-f <fanout>] [-d <depth>] [-a <anonymous_share>]
+               [-k <fields>] [-e <enum_size>] [-w <doc_words>]
+               [-x <chains>] [-l <chain_length>] [-g <groups>]
+               [-G <group_size>]
+    scaling.py --run <xsd_filename> <xsd_type>
+    scaling.py -h | --help
+
+Options:
+    -h --help              Show this screen.
+    -s <sizes>             Comma separated numbers of complex types
+                           [default: 100,200,400,800].
+    -r <repeat>            Number of runs of every size, the fastest one is
+                           kept [default: 1].
+    -o <results_filename>  Output JSON results filename.
+    -f <fanout>            See synthetic_schema.py [default: 3].
+    -d <depth>             See synthetic_schema.py [default: 2].
+    -a <anonymous_share>   See synthetic_schema.py [default: 0.3].
+    -k <fields>            See synthetic_schema.py [default: 6].
+    -e <enum_size>         See synthetic_schema.py [default: 10].
+    -w <doc_words>         See synthetic_schema.py [default: 8].
+    -x <chains>            See synthetic_schema.py [default: 2].
+    -l <chain_length>      See synthetic_schema.py [default: 3].
+    -g <groups>            See synthetic_schema.py [default: 2].
+    -G <group_size>        See synthetic_schema.py [default: 3].
+
+For every phase, the growth exponent between successive sizes is printed:
+about 1 for a phase which scales linearly, about 2 for a quadratic one.
+"""
+
+
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+
+from docopt import docopt
+
+from benchmark import PHASES, run_phases
+from synthetic_schema import generate
+
+
+SUPERLINEAR_EXPONENT = 1.5
+MIN_TIME = 0.05
+
+
+def run(size, repeat, params):
+    best = None
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            xsd_filename, xsd_type = generate(tmpdir, size, **params)
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run',
+                 xsd_filename, xsd_type],
+                cwd=tmpdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+        if process.returncode:
+            return {'error': process.stderr.strip().splitlines()[-1]}
+        results = json.loads(process.stdout)
+        if best is None:
+            best = results
+            continue
+        for name, timings in results.items():
+            if timings['wall'] < best[name]['wall']:
+                best[name] = timings
+    return best
+
+
+def main():
+    args = docopt(__doc__)
+    if args['--run']:
+        json.dump(run_phases([args['<xsd_filename>'], args['<xsd_type>']]),
+                  sys.stdout)
+        return
+
+    params = {
+        'fanout': int(args['-f']),
+        'depth': int(args['-d']),
+        'anonymous_share': float(args['-a']),
+        'fields': int(args['-k']),
+        'enum_size': int(args['-e']),
+        'doc_words': int(args['-w']),
+        'chains': int(args['-x']),
+        'chain_length': int(args['-l']),
+        'groups': int(args['-g']),
+        'group_size': int(args['-G']),
+    }
+    sizes = [int(size) for size in args['-s'].split(',')]
+    results = {'params': params, 'sizes': {}}
+    print('%8s %s' % ('types', ' '.join('%12s' % name for name in PHASES)))
+    for size in sizes:
+        phases = results['sizes'][size] = run(size, int(args['-r']), params)
+        if 'error' in phases:
+            print('%8d error: %s' % (size, phases['error']))
+            continue
+        print('%8d %s' % (size, ' '.join('%11.3fs' % phases[name]['wall']
+                                          for name in PHASES)))
+
+    print('\nGrowth exponents:')
+    done = [size for size in sizes if 'error' not in results['sizes'][size]]
+    for prev, size in zip(done, done[1:]):
+        exponents = []
+        for name in PHASES:
+            before = results['sizes'][prev][name]['wall']
+            after = results['sizes'][size][name]['wall']
+            exponent = (math.log(after / before) / math.log(size / prev)
+                        if before > 0 and after > 0 else 0)
+            flag = '!' if exponent > SUPERLINEAR_EXPONENT and \
+                after > MIN_TIME else ' '
+            exponents.append('%11.2f%s' % (exponent, flag))
+        print('%8s %s' % ('%d>%d' % (prev, size), ' '.join(exponents)))
+
+    if args['-o']:
+        with open(args['-o'], 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
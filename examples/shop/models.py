@@ -0,0 +1,92 @@
+# THIS FILE IS GENERATED AUTOMATICALLY. DO NOT EDIT
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import models
+
+
+
+
+
+
+# Corresponds to XSD type[s]: tCustomer
+class Customer(models.Model):
+    name = models.CharField("Name", max_length=100)
+    email = models.CharField("Email", max_length=100, null=True)
+
+    class Meta:
+        verbose_name = "A customer"
+
+
+# Corresponds to XSD type[s]: tItem
+class Item(models.Model):
+    sku = models.CharField("Stock keeping unit", max_length=20)
+    quantity = models.PositiveIntegerField("Quantity")
+    price = models.DecimalField("Price", decimal_places=2, max_digits=10)
+    order = models.ForeignKey(
+        'Order',
+        on_delete=models.CASCADE,
+        related_name="item",
+        verbose_name="An order"
+    )
+
+    class Meta:
+        verbose_name = "An order item"
+
+
+# Corresponds to XSD type[s]: tOrder
+class Order(models.Model):
+    AUTO_ONE_TO_MANY_FIELDS = {
+        "delivery_parcel": "Delivery::Parcel",
+        "item": "Item",
+    }
+    # @currency => currency
+    currency = models.CharField(
+        "Currency:\n"
+        "EUR\n"
+        "USD",
+        choices=[
+            ("EUR", "EUR"),
+            ("USD", "USD")
+        ],
+        max_length=3,
+        null=True
+    )
+    number = models.CharField("Order number", max_length=20)
+    date = models.DateField("Order date")
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.PROTECT,
+        verbose_name="Customer"
+    )
+    note = models.TextField("Note", null=True)
+    # Dropping signature
+    # item is declared as a reverse relation
+    #  from Item
+    # item = OneToManyField(Item, verbose_name="Item")
+    delivery_address = models.CharField(
+        "Delivery::Address",
+        max_length=100,
+        null=True
+    )
+    # delivery_parcel is declared as a reverse relation
+    #  from Parcel
+    # delivery_parcel = OneToManyField(Parcel, verbose_name="Delivery::Parcel")
+
+    class Meta:
+        verbose_name = "An order"
+
+
+# Corresponds to XSD type[s]: tParcel
+class Parcel(models.Model):
+    weight = models.DecimalField("Weight", decimal_places=2, max_digits=10)
+    order = models.ForeignKey(
+        'Order',
+        on_delete=models.CASCADE,
+        related_name="delivery_parcel",
+        verbose_name="An order"
+    )
+
+    class Meta:
+        verbose_name = "A parcel"
@@ -0,0 +1,11 @@
+TYPE_MODEL_MAP = {
+    r't(.+)': r'\1',
+}
+
+MODEL_OPTIONS = {
+    'Order': {
+        'drop_fields': ['signature'],
+        'flatten_fields': ['delivery'],
+        'one_to_many_fields': ['item', 'delivery_parcel'],
+    },
+}
@@ -0,0 +1,219 @@
+#! /usr/bin/env python
+
+"""
+synthetic_schema
+Generate a synthetic XSD schema with matching settings, to test how
+xsd_to_django_model scales with the size and shape of a schema.
+
+Usage:
+    synthetic_schema.py [-n <types>] [-f <fanout>] [-d <depth>]
+                        [-a <anonymous_share>] [-k <fields>] [-e <enum_size>]
+                        [-w <doc_words>] [-x <chains>] [-l <chain_length>]
+                        [-g <groups>] [-G <group_size>] <output_dir>
+    synthetic_schema.py -h | --help
+
+Options:
+    -h --help              Show this screen.
+    -n <types>             Number of complex types [default: 100].
+    -f <fanout>            Number of named complex types every named type
+                           refers to [default: 3].
+    -d <depth>             Nesting depth of anonymous complex types
+                           [default: 2].
+    -a <anonymous_share>   Share of anonymous complex types among all the
+                           complex types [default: 0.3].
+    -k <fields>            Number of simple fields of every complex type
+                           [default: 6].
+    -e <enum_size>         Number of values of enumerations [default: 10].
+    -w <doc_words>         Number of words of every documentation
+                           [default: 8].
+    -x <chains>            Number of extension chains [default: 2].
+    -l <chain_length>      Number of types of every extension chain
+                           [default: 3].
+    -g <groups>            Number of groups of types merged into a single
+                           model with `+` [default: 2].
+    -G <group_size>        Number of types of every merged group
+                           [default: 3].
+    <output_dir>           Directory to write synthetic.xsd and
+                           xsd_to_django_model_settings.py to.
+
+The named complex types form a tree under RootType, which is the type to
+generate the models for. Extension chains and merged groups count as
+named complex types, and are referred to from the tree.
+"""
+
+
+import os
+import random
+
+from docopt import docopt
+
+
+SCHEMA_FILENAME = 'synthetic.xsd'
+SETTINGS_FILENAME = 'xsd_to_django_model_settings.py'
+ROOT_TYPE = 'RootType'
+SIMPLE_TYPES = ('xs:string', 'xs:int', 'xs:decimal', 'xs:date',
+                'xs:boolean', 'enum')
+WORDS = ('alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta',
+         'theta', 'iota', 'kappa', 'lambda', 'mu')
+
+SETTINGS = '''from collections import OrderedDict
+
+
+TYPE_MODEL_MAP = OrderedDict([
+    (r'Merged(\\d+)_\\d+Type', r'+Merged\\1'),
+%s    (r'(.+)Type', r'\\1'),
+])
+'''
+
+
+class SchemaWriter:
+
+    def __init__(self, fields, enum_size, doc_words, seed=0):
+        self.fields = fields
+        self.enum_size = enum_size
+        self.doc_words = doc_words
+        self.random = random.Random(seed)
+        self.parts = []
+        self.n_enums = 0
+
+    def doc(self, indent):
+        if not self.doc_words:
+            return ''
+        words = ' '.join(self.random.choice(WORDS)
+                         for i in range(self.doc_words))
+        return ('%s<xs:annotation><xs:documentation>%s</xs:documentation>'
+                '</xs:annotation>\n' % (indent, words.capitalize()))
+
+    def enum(self):
+        name = 'Enum%dType' % self.n_enums
+        self.n_enums += 1
+        self.parts.append(
+            '  <xs:simpleType name="%s">\n%s'
+            '    <xs:restriction base="xs:string">\n%s'
+            '    </xs:restriction>\n  </xs:simpleType>\n'
+            % (name, self.doc('    '),
+               ''.join('      <xs:enumeration value="v%d">\n%s'
+                       '      </xs:enumeration>\n'
+                       % (i, self.doc('        '))
+                       for i in range(self.enum_size))))
+        return name
+
+    def simple_fields(self, prefix, indent):
+        lines = []
+        for i in range(self.fields):
+            simple_type = SIMPLE_TYPES[i % len(SIMPLE_TYPES)]
+            if simple_type == 'enum':
+                simple_type = self.enum() if self.enum_size else 'xs:string'
+            lines.append('%s<xs:element name="%s%d" type="%s"'
+                         ' minOccurs="0">\n%s%s</xs:element>\n'
+                         % (indent, prefix, i, simple_type,
+                            self.doc(indent + '  '), indent))
+        return ''.join(lines)
+
+    def anonymous(self, name, depth, indent):
+        # An element with an anonymous complex type nested depth deep
+        inner = self.anonymous(name + 'i', depth - 1, indent + '      ') \
+            if depth > 1 else ''
+        return ('%s<xs:element name="%s" minOccurs="0">\n%s'
+                '%s  <xs:complexType>\n%s    <xs:sequence>\n%s%s'
+                '%s    </xs:sequence>\n%s  </xs:complexType>\n'
+                '%s</xs:element>\n'
+                % (indent, name, self.doc(indent + '  '), indent, indent,
+                   self.simple_fields(name + 'f', indent + '      '), inner,
+                   indent, indent, indent))
+
+    def complex_type(self, name, refs=(), anonymous=(), base=None,
+                     extra=(), prefix='f'):
+        indent = '        ' if base else '      '
+        body = (self.simple_fields(prefix, indent) +
+                ''.join('%s<xs:element name="r%d" type="%s"'
+                        ' minOccurs="0"/>\n' % (indent, i, ref)
+                        for i, ref in enumerate(refs)) +
+                ''.join(self.anonymous('a%d' % i, depth, indent)
+                        for i, depth in enumerate(anonymous)) +
+                ''.join('%s<xs:element name="%s" type="xs:string"'
+                        ' minOccurs="0"/>\n' % (indent, name)
+                        for name in extra))
+        content = '%s<xs:sequence>\n%s%s</xs:sequence>\n' % (
+            indent[:-2], body, indent[:-2])
+        if base:
+            content = ('    <xs:complexContent>\n'
+                       '      <xs:extension base="%s">\n%s'
+                       '      </xs:extension>\n'
+                       '    </xs:complexContent>\n' % (base, content))
+        self.parts.append('  <xs:complexType name="%s">\n%s%s'
+                          '  </xs:complexType>\n'
+                          % (name, self.doc('    '), content))
+
+    def write(self, f):
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">\n')
+        f.writelines(self.parts)
+        f.write('</xs:schema>\n')
+
+
+def generate(output_dir, types=100, fanout=3, depth=2, anonymous_share=0.3,
+             fields=6, enum_size=10, doc_words=8, chains=2, chain_length=3,
+             groups=2, group_size=3):
+    writer = SchemaWriter(fields, enum_size, doc_words)
+    n_anonymous = int(round(types * anonymous_share))
+    n_named = max(types - n_anonymous, 1)
+
+    # Extension chains and merged groups, referred to from the tree
+    extras = []
+    for c in range(chains):
+        for i in range(chain_length):
+            writer.complex_type('Ext%d_%dType' % (c, i),
+                                base='Ext%d_%dType' % (c, i - 1) if i
+                                else None,
+                                prefix='x%d_' % i)
+        extras.append('Ext%d_%dType' % (c, chain_length - 1))
+    for g in range(groups):
+        for i in range(group_size):
+            # The members differ by a field, so that merging has work to do
+            writer.complex_type('Merged%d_%dType' % (g, i),
+                                extra=['only%d' % i])
+            extras.append('Merged%d_%dType' % (g, i))
+    n_tree = max(n_named - chains * chain_length - groups * group_size, 1)
+
+    # Anonymous complex types in chains of depth, spread over the tree
+    anonymous = [[] for i in range(n_tree)]
+    left = n_anonymous
+    i = 0
+    while left > 0:
+        anonymous[i % n_tree].append(min(depth, left))
+        left -= depth
+        i += 1
+
+    names = [ROOT_TYPE] + ['T%dType' % i for i in range(1, n_tree)]
+    for i, name in enumerate(names):
+        refs = names[i * fanout + 1:i * fanout + fanout + 1]
+        refs += extras[i::n_tree]
+        writer.complex_type(name, refs, anonymous[i])
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, SCHEMA_FILENAME), 'w',
+              encoding='utf-8') as f:
+        writer.write(f)
+    with open(os.path.join(output_dir, SETTINGS_FILENAME), 'w',
+              encoding='utf-8') as f:
+        # Anonymous types are named after the path to them, for example
+        # T1Type.a0.a0i, make valid model names of them
+        f.write(SETTINGS % ''.join(
+            "    (r'(\\w+)Type%s', r'\\1%s'),\n"
+            % (r'\.(\w+)' * level,
+               ''.join(r'_\%d' % (i + 2) for i in range(level)))
+            for level in range(depth, 0, -1)))
+    return SCHEMA_FILENAME, ROOT_TYPE
+
+
+def main():
+    args = docopt(__doc__)
+    generate(args['<output_dir>'], int(args['-n']), int(args['-f']),
+             int(args['-d']), float(args['-a']), int(args['-k']),
+             int(args['-e']), int(args['-w']), int(args['-x']),
+             int(args['-l']), int(args['-g']), int(args['-G']))
+
+
+if __name__ == '__main__':
+    main()
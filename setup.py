@@ -30,6 +30,9 @@ setup(
     ],
     scripts=['xsd_to_django_model/xsd_to_django_model.py'],
     entry_points={
-        'console_scripts': ['xsd_to_django_model=xsd_to_django_model:main']
+        'console_scripts': [
+            'xsd_to_django_model=xsd_to_django_model.xsd_to_django_model:main',
+            'xsd_to_django_ingest=xsd_to_django_model.ingest:main',
+        ]
     },
 )
@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+import pytest
+
+from xsd_to_django_model.xsd_to_django_model import Settings, generate
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHOP_DIR = os.path.join(ROOT, 'examples', 'shop')
+APP_DIR = tempfile.mkdtemp(prefix='xsd_to_django_model-')
+
+
+def write_shop_app(dirname):
+    # The shop example as the shop app, with its migration, the mapping
+    # and the loaders
+    result = generate(os.path.join(SHOP_DIR, 'shop.xsd'), ['tOrder'],
+                      Settings.from_file(os.path.join(
+                          SHOP_DIR, 'xsd_to_django_model_settings.py')),
+                      path_index=True, app_label='shop', loaders=True)
+    app_dir = os.path.join(dirname, 'shop')
+    os.makedirs(os.path.join(app_dir, 'migrations'))
+    for filename, code in (('__init__.py', ''),
+                           ('models.py', result['models']),
+                           ('loaders.py', result['loaders']),
+                           ('migrations/__init__.py', ''),
+                           ('migrations/0001_initial.py',
+                            result['migration'])):
+        with open(os.path.join(app_dir, filename), 'w',
+                  encoding='utf-8') as f:
+            f.write(code)
+    return result['mapping']
+
+
+def pytest_configure(config):
+    config.shop_mapping = write_shop_app(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    settings.configure(
+        INSTALLED_APPS=['shop'],
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(APP_DIR, 'db.sqlite3'),
+            },
+        },
+        DEFAULT_AUTO_FIELD='django.db.models.BigAutoField',
+        USE_TZ=True,
+    )
+    django.setup()
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(APP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def migrated():
+    call_command('migrate', verbosity=0)
+
+
+@pytest.fixture
+def db(migrated):
+    # Every test runs in a transaction which is rolled back afterwards
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@pytest.fixture
+def shop_mapping(request):
+    return request.config.shop_mapping
@@ -0,0 +1,61 @@
+import decimal
+
+from django.apps import apps
+import pytest
+
+from xsd_to_django_model.export import FileWriter, export, load_files
+
+
+SPECIAL_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<order currency="USD">
+  <number>B\\2</number>
+  <date>2024-03-02</date>
+  <customer>
+    <name>"Quoted", with comma</name>
+  </customer>
+  <note>tab&#9;newline&#10;return&#13;backslash\\ \\N \\t</note>
+  <item>
+    <sku>SKU,1</sku>
+    <quantity>3</quantity>
+    <price>1.25</price>
+  </item>
+</order>
+'''
+
+
+def get_model(model_name):
+    return apps.get_model('shop', model_name)
+
+
+@pytest.mark.parametrize('fmt', ['text', 'csv'])
+def test_file_writer_round_trip(db, tmp_path, fmt):
+    rows = [
+        [1, 'tab\there', None],
+        [2, 'newline\nand return\r\n', ''],
+        [3, 'backslash\\ \\N \\t', '"quoted", with comma'],
+        [4, '\\', '\\N'],
+    ]
+    with FileWriter(str(tmp_path), fmt) as writer:
+        writer.write('shop_customer', ['id', 'name', 'email'], rows)
+    load_files(str(tmp_path))
+    assert [list(row) for row in get_model('Customer').objects
+            .order_by('pk').values_list('id', 'name', 'email')] == rows
+
+
+@pytest.mark.parametrize('fmt', ['text', 'csv'])
+def test_export_round_trip(db, tmp_path, shop_mapping, fmt):
+    source = tmp_path / 'order.xml'
+    source.write_text(SPECIAL_XML, encoding='utf-8')
+    dirname = str(tmp_path / 'copy')
+    counts = export(str(source), shop_mapping, 'shop', dirname, fmt,
+                    model_name='Order')
+    assert counts == {'Order': 1, 'Customer': 1, 'Item': 1}
+    load_files(dirname)
+    order = get_model('Order').objects.get()
+    assert order.number == 'B\\2'
+    assert order.note == 'tab\tnewline\nreturn\rbackslash\\ \\N \\t'
+    assert order.customer.name == '"Quoted", with comma'
+    assert order.customer.email is None
+    item = order.item.get()
+    assert (item.sku, item.quantity, item.price) == \
+        ('SKU,1', 3, decimal.Decimal('1.25'))
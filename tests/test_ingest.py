@@ -0,0 +1,64 @@
+import threading
+
+from django.apps import apps
+from django.db import OperationalError
+
+from xsd_to_django_model import ingest
+from xsd_to_django_model.loader import Loader
+
+from test_loader import ORDER_COUNTS, ORDER_XML
+
+
+def test_shared_pk_allocator_blocks(db):
+    Customer = apps.get_model('shop', 'Customer')
+    Customer.objects.create(id=10, name='Someone')
+    lock, next_pks = threading.Lock(), {}
+    first = ingest.SharedPkAllocator(lock, next_pks, 'default', 3)
+    second = ingest.SharedPkAllocator(lock, next_pks, 'default', 3)
+    assert [first(Customer) for i in range(2)] == [11, 12]
+    assert [second(Customer) for i in range(4)] == [14, 15, 16, 17]
+    # The rest of a block is never handed out again
+    assert [first(Customer) for i in range(2)] == [13, 20]
+
+
+def test_worker_retries_transient_errors(db, monkeypatch, shop_mapping):
+    monkeypatch.setattr(ingest, 'RETRY_DELAY', 0)
+    load = Loader.load
+    failures = []
+
+    def flaky_load(loader, source):
+        if len(failures) < 2:
+            failures.append(source)
+            raise OperationalError('database is locked')
+        return load(loader, source)
+
+    monkeypatch.setattr(Loader, 'load', flaky_load)
+    worker = ingest.Worker(None, threading.Lock(), {}, None, 'shop', 'Order',
+                           1000, 'default', 'shop.loaders', retries=2)
+    filename, counts, pk_models = worker.load(ORDER_XML)
+    assert len(failures) == 2
+    assert counts == dict(ORDER_COUNTS, skipped=3)
+    assert sorted(pk_models) == ['shop.Customer', 'shop.Item', 'shop.Order',
+                              'shop.Parcel']
+
+    failures.clear()
+    worker.retries = 1
+    filename, counts, error = worker.load(ORDER_XML)
+    assert counts is None
+    assert error == 'OperationalError: database is locked'
+
+
+def test_worker_does_not_retry_other_errors(db, monkeypatch):
+    monkeypatch.setattr(ingest, 'RETRY_DELAY', 0)
+    attempts = []
+
+    def failing_load(loader, source):
+        attempts.append(source)
+        raise OperationalError('no such table: shop_order')
+
+    monkeypatch.setattr(Loader, 'load', failing_load)
+    worker = ingest.Worker(None, threading.Lock(), {}, None, 'shop', 'Order',
+                           1000, 'default', 'shop.loaders')
+    filename, counts, error = worker.load(ORDER_XML)
+    assert counts is None
+    assert len(attempts) == 1
@@ -0,0 +1,156 @@
+import datetime
+import decimal
+import os
+
+from django.apps import apps
+
+from xsd_to_django_model.loader import Loader, PkAllocator, load
+
+from conftest import SHOP_DIR
+
+
+ORDER_XML = os.path.join(SHOP_DIR, 'order.xml')
+ORDER_COUNTS = {'Order': 1, 'Customer': 1, 'Item': 3, 'Parcel': 2}
+
+
+def get_model(model_name):
+    return apps.get_model('shop', model_name)
+
+
+class RecordingLoader(Loader):
+    # Keeps the closed records instead of saving them
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.closed = []
+
+    def close(self, record):
+        self.closed.append(record)
+        super().close(record)
+
+    def insert(self, model, instances):
+        pass
+
+
+def check_order(order):
+    assert order.currency == 'EUR'
+    assert order.number == 'A-1001'
+    assert order.date == datetime.date(2024, 3, 1)
+    assert order.note == 'Leave at the door'
+    assert order.customer.name == 'Jane Doe'
+    assert order.customer.email == 'jane@example.com'
+    assert [(item.sku, item.quantity, item.price)
+            for item in order.item.order_by('pk')] == [
+        ('SKU-1', 2, decimal.Decimal('9.99')),
+        ('SKU-2', 1, decimal.Decimal('120.00')),
+        ('SKU-3', 5, decimal.Decimal('0.50')),
+    ]
+    assert order.delivery_address == '1 Main Street'
+    assert [parcel.weight for parcel in order.delivery_parcel.order_by('pk')] \
+        == [decimal.Decimal('1.50'), decimal.Decimal('0.25')]
+
+
+def test_pk_allocator_follows_max_pk(db):
+    Customer = get_model('Customer')
+    Customer.objects.create(id=41, name='Someone')
+    allocate_pk = PkAllocator()
+    assert [allocate_pk(Customer) for i in range(3)] == [42, 43, 44]
+    assert allocate_pk(get_model('Item')) == 1
+
+
+def test_pk_allocator_start(db):
+    Customer = get_model('Customer')
+    Customer.objects.create(id=41, name='Someone')
+    allocate_pk = PkAllocator(start=1000)
+    assert allocate_pk(Customer) == 1000
+    assert allocate_pk(Customer) == 1001
+    assert allocate_pk(get_model('Item')) == 1000
+
+
+def test_router(db, shop_mapping):
+    loader = RecordingLoader(shop_mapping, 'shop', 'Order')
+    loader.route(ORDER_XML)
+    records = {(r.model, r.key): r for r in loader.closed}
+    assert [(r.model, r.key) for r in loader.closed] == [
+        ('Customer', 'customer'),
+        ('Item', 'item'),
+        ('Item', 'item'),
+        ('Item', 'item'),
+        ('Parcel', 'delivery.parcel'),
+        ('Parcel', 'delivery.parcel'),
+        ('Order', ''),
+    ]
+    order = records[('Order', '')]
+    assert order.values == {
+        'currency': 'EUR',
+        'number': 'A-1001',
+        'date': datetime.date(2024, 3, 1),
+        'note': 'Leave at the door',
+        'delivery_address': '1 Main Street',
+        'customer_id': records[('Customer', 'customer')].pk,
+    }
+    assert records[('Customer', 'customer')].values == {
+        'name': 'Jane Doe',
+        'email': 'jane@example.com',
+    }
+    items = [r for r in loader.closed if r.model == 'Item']
+    assert [r.values for r in items] == [
+        {'sku': 'SKU-1', 'quantity': 2, 'price': decimal.Decimal('9.99')},
+        {'sku': 'SKU-2', 'quantity': 1, 'price': decimal.Decimal('120.00')},
+        {'sku': 'SKU-3', 'quantity': 5, 'price': decimal.Decimal('0.50')},
+    ]
+    assert all(r.parent is order and r.column == 'order' for r in items)
+    # signature is dropped, giftWrap and discount are not in the schema
+    assert loader.counts['skipped'] == 3
+    # item/@code is not in the schema either
+    assert loader.counts['unmapped'] == 1
+
+
+def test_load(db, shop_mapping):
+    counts = load(ORDER_XML, shop_mapping, 'shop', model_name='Order')
+    assert counts == dict(ORDER_COUNTS, skipped=3, unmapped=1)
+    for model_name, count in ORDER_COUNTS.items():
+        assert get_model(model_name).objects.count() == count
+    check_order(get_model('Order').objects.get())
+
+
+def test_load_again(db, shop_mapping):
+    load(ORDER_XML, shop_mapping, 'shop', model_name='Order')
+    load(ORDER_XML, shop_mapping, 'shop', model_name='Order')
+    Order = get_model('Order')
+    for model_name, count in ORDER_COUNTS.items():
+        assert get_model(model_name).objects.count() == 2 * count
+    orders = Order.objects.order_by('pk')
+    assert orders[0].customer_id != orders[1].customer_id
+    for order in orders:
+        check_order(order)
+
+
+def test_load_with_converters(db):
+    counts = load(ORDER_XML, None, 'shop', model_name='Order',
+                  converters='shop.loaders')
+    assert counts == dict(ORDER_COUNTS, skipped=3)
+    for model_name, count in ORDER_COUNTS.items():
+        assert get_model(model_name).objects.count() == count
+    check_order(get_model('Order').objects.get())
+
+
+def test_convert_detaches_handled_elements(db):
+    loader = Loader(None, 'shop', 'Order', converters='shop.loaders')
+    converters = dict(loader.converters)
+    children = {}
+
+    def convert(model_name):
+        def convert_model(element):
+            children.setdefault(model_name, []).append(
+                [child.tag for child in element])
+            return converters[model_name](element)
+        return convert_model
+
+    loader.converters = {name: convert(name) for name in converters}
+    loader.load(ORDER_XML)
+    # Records are gone from the root by the time it is converted, and so
+    # are the dropped and unknown elements
+    assert children['Order'] == [['number', 'date', 'note', 'delivery']]
+    assert children['Parcel'] == [['weight']] * 2
+    assert children['Item'] == [['sku', 'quantity', 'price']] * 3
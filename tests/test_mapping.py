@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from xsd_to_django_model.mapping import load_mapping
+from xsd_to_django_model.xsd_to_django_model import (Settings,
+                                                      XSDModelBuilder,
+                                                      generate)
+
+from conftest import SHOP_DIR
+
+
+def make_builder():
+    builder = XSDModelBuilder(
+        os.path.join(SHOP_DIR, 'shop.xsd'),
+        settings=Settings.from_file(os.path.join(
+            SHOP_DIR, 'xsd_to_django_model_settings.py')),
+        cache_schema=True)
+    builder.make_models(['tOrder'])
+    builder.merge_models()
+    return builder
+
+
+def test_mapping_shards_keep_other_files(tmp_path):
+    dirname = str(tmp_path)
+    for filename in ('README.json', 'Stale.json', 'notes.txt'):
+        (tmp_path / filename).write_text('{}', encoding='utf-8')
+    builder = make_builder()
+    builder.write_mapping_shards(dirname)
+    assert sorted(os.listdir(dirname)) == [
+        'Customer.json', 'Item.json', 'Order.json', 'Parcel.json',
+        'README.json', 'Stale.json', '_index.json', 'notes.txt',
+    ]
+    # Another format replaces the shards of the previous run only
+    builder.write_mapping_shards(dirname, 'pickle', path_index=True)
+    assert sorted(os.listdir(dirname)) == [
+        'Customer.pickle', 'Item.pickle', 'Order.pickle', 'Parcel.pickle',
+        'README.json', 'Stale.json', '_index.pickle', '_path_index.pickle',
+        'notes.txt',
+    ]
+    mapping = load_mapping(dirname)
+    assert sorted(mapping) == ['Customer', 'Item', 'Order', 'Parcel',
+                              '_path_index']
+    assert mapping['_path_index']['Order']['item'] == \
+        ['Item', 'order', 'one_to_many']
+
+
+WRAPPED_XSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:complexType name="tLine">
+    <xs:attribute name="sku" type="xs:string"/>
+  </xs:complexType>
+  <xs:complexType name="tLines">
+    <xs:sequence>
+      <xs:element name="line" type="tLine" maxOccurs="unbounded"/>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:complexType name="tOrder">
+    <xs:sequence>
+      <xs:element name="lines" type="tLines"/>
+    </xs:sequence>
+  </xs:complexType>
+</xs:schema>
+'''
+
+
+@pytest.mark.parametrize('path_index', [False, True])
+def test_mapping_item_only_with_path_index(tmp_path, path_index):
+    xsd = tmp_path / 'wrapped.xsd'
+    xsd.write_text(WRAPPED_XSD, encoding='utf-8')
+    mapping = generate(str(xsd), ['tOrder'], Settings(
+        TYPE_MODEL_MAP={r't(.+)': r'\1'},
+        MODEL_OPTIONS={'Order': {'one_to_many_fields': ['lines']}},
+    ), path_index=path_index)['mapping']
+    field = next(f for f in mapping['Order']['fields']
+                 if f['name'] == 'lines')
+    if path_index:
+        assert field['item'] == 'line'
+        assert mapping['_path_index']['Order']['lines.line'] == \
+            ['Line', 'order', 'one_to_many']
+    else:
+        assert 'item' not in field
+        assert '_path_index' not in mapping
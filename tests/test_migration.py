@@ -0,0 +1,21 @@
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ProjectState
+
+
+def test_migration_is_applied(migrated):
+    loader = MigrationLoader(connection)
+    assert ('shop', '0001_initial') in loader.applied_migrations
+    tables = connection.introspection.table_names()
+    for model in apps.get_app_config('shop').get_models():
+        assert model._meta.db_table in tables
+
+
+def test_migration_matches_models(migrated):
+    loader = MigrationLoader(connection)
+    changes = MigrationAutodetector(
+        loader.project_state(), ProjectState.from_apps(apps),
+    ).changes(graph=loader.graph)
+    assert changes == {}
@@ -0,0 +1,127 @@
+import re
+
+import pytest
+
+from xsd_to_django_model.xsd_to_django_model import Settings, generate
+
+
+SHARED_XSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:simpleType name="tCurrency">
+    <xs:restriction base="xs:string">
+      <xs:enumeration value="EUR"/>
+      <xs:enumeration value="USD"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:complexType name="tPrice">
+    <xs:attribute name="amount" type="xs:decimal"/>
+    <xs:attribute name="currency" type="tCurrency"/>
+  </xs:complexType>
+  <xs:complexType name="tOrder">
+    <xs:sequence>
+      <xs:element name="price" type="tPrice"/>
+    </xs:sequence>
+    <xs:attribute name="currency" type="tCurrency"/>
+    <xs:attribute name="refundCurrency" type="tCurrency"/>
+  </xs:complexType>
+</xs:schema>
+'''
+
+
+def test_shared_choices_are_written_once(tmp_path):
+    xsd = tmp_path / 'shared.xsd'
+    xsd.write_text(SHARED_XSD, encoding='utf-8')
+    result = generate(str(xsd), ['tOrder'],
+                      Settings(TYPE_MODEL_MAP={r't(.+)': r'\1'}))
+    code = result['models']
+    assert re.findall(r'^(\w+) = \[$', code, re.M) == ['T_CURRENCY_CHOICES']
+    assert code.count('("EUR", "EUR")') == 1
+    assert code.count('choices=T_CURRENCY_CHOICES') == 3
+    assert 'choices=[' not in code
+    # The mapping keeps the choices themselves next to the rendered code
+    fields = {(name, f['name']): f
+              for name, m in result['mapping'].items()
+              for f in m['fields']}
+    for key in (('Price', 'currency'), ('Order', 'currency'),
+                ('Order', 'refundCurrency')):
+        assert 'choices=T_CURRENCY_CHOICES' in fields[key]['code']
+        assert '("EUR", "EUR")' in fields[key]['options']['choices']
+
+
+INTEGERS_XSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:simpleType name="tPercent">
+    <xs:restriction base="xs:integer">
+      <xs:minInclusive value="0"/>
+      <xs:maxInclusive value="100"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="tDelta">
+    <xs:restriction base="xs:integer">
+      <xs:minInclusive value="-1000"/>
+      <xs:maxInclusive value="1000"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="tCount">
+    <xs:restriction base="xs:integer">
+      <xs:minInclusive value="0"/>
+      <xs:maxInclusive value="100000"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="tCode">
+    <xs:restriction base="xs:integer">
+      <xs:totalDigits value="4"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="tSerial">
+    <xs:restriction base="xs:long">
+      <xs:totalDigits value="9"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:simpleType name="tLevel">
+    <xs:restriction base="xs:unsignedShort">
+      <xs:maxInclusive value="10"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:complexType name="tStats">
+    <xs:attribute name="percent" type="tPercent"/>
+    <xs:attribute name="delta" type="tDelta"/>
+    <xs:attribute name="count" type="tCount"/>
+    <xs:attribute name="code" type="tCode"/>
+    <xs:attribute name="serial" type="tSerial"/>
+    <xs:attribute name="level" type="tLevel"/>
+    <xs:attribute name="flags" type="xs:unsignedByte"/>
+    <xs:attribute name="port" type="xs:unsignedShort"/>
+  </xs:complexType>
+</xs:schema>
+'''
+
+
+@pytest.mark.parametrize('narrow, expected', [
+    (True, {'percent': 'PositiveSmallIntegerField',
+            'delta': 'SmallIntegerField',
+            'count': 'PositiveIntegerField',
+            'code': 'SmallIntegerField',
+            'serial': 'IntegerField',
+            'level': 'PositiveSmallIntegerField',
+            'flags': 'PositiveSmallIntegerField',
+            'port': 'PositiveIntegerField'}),
+    (False, {'percent': 'IntegerField',
+             'delta': 'IntegerField',
+             'count': 'IntegerField',
+             'code': 'IntegerField',
+             'serial': 'BigIntegerField',
+             'level': 'IntegerField',
+             'flags': 'IntegerField',
+             'port': 'IntegerField'}),
+])
+def test_narrow_integer_fields(tmp_path, narrow, expected):
+    xsd = tmp_path / 'integers.xsd'
+    xsd.write_text(INTEGERS_XSD, encoding='utf-8')
+    result = generate(str(xsd), ['tStats'], Settings(
+        GLOBAL_MODEL_OPTIONS={'narrow_integer_fields': narrow},
+    ))
+    fields = {f['name']: f['django_field']
+              for f in result['mapping']['tStats']['fields']}
+    assert fields == {name: 'models.%s' % field
+                      for name, field in expected.items()}
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from xsd_to_django_model.xsd_to_django_model import Settings, generate
+
+
+COMMON_XSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           targetNamespace="urn:common" xmlns:c="urn:common">
+  <xs:complexType name="tAddress">
+    <xs:attribute name="city" type="xs:string"/>
+  </xs:complexType>
+</xs:schema>
+'''
+
+SALES_XSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           targetNamespace="urn:sales" xmlns:s="urn:sales"
+           xmlns:c="urn:common">
+  <xs:import namespace="urn:common" schemaLocation="common.xsd"/>
+  <xs:complexType name="tCustomer">
+    <xs:sequence>
+      <xs:element name="address" type="c:tAddress"/>
+      <xs:element name="lastOrder" type="s:tOrder" minOccurs="0"/>
+    </xs:sequence>
+    <xs:attribute name="name" type="xs:string"/>
+  </xs:complexType>
+  <xs:complexType name="tOrder">
+    <xs:sequence>
+      <xs:element name="customer" type="s:tCustomer"/>
+      <xs:element name="billing" type="c:tAddress"/>
+    </xs:sequence>
+    <xs:attribute name="number" type="xs:string"/>
+  </xs:complexType>
+</xs:schema>
+'''
+
+SETTINGS = Settings(
+    TYPE_MODEL_MAP={r'(.+:)?t(.+)': r'\2'},
+    MODEL_GROUPS={
+        r'.*Address.*': 'addresses',
+        r'(Order|Customer)': 'sales',
+    },
+)
+
+
+def read_package(dirname):
+    package = {}
+    for filename in sorted(os.listdir(dirname)):
+        with open(os.path.join(dirname, filename), encoding='utf-8') as f:
+            package[filename] = f.read()
+    return package
+
+
+@pytest.mark.parametrize('grouping, groups', [
+    # Customer and Order refer to each other, so they share a module
+    ('scc', {'address': ['Address'], 'customer': ['Customer', 'Order']}),
+    ('namespace', {'c': ['Address'], 's': ['Customer', 'Order']}),
+    ('settings', {'addresses': ['Address'], 'sales': ['Customer', 'Order']}),
+])
+def test_models_package(tmp_path, grouping, groups):
+    (tmp_path / 'common.xsd').write_text(COMMON_XSD, encoding='utf-8')
+    (tmp_path / 'sales.xsd').write_text(SALES_XSD, encoding='utf-8')
+    package_dir = str(tmp_path / 'models')
+    result = generate(str(tmp_path / 'sales.xsd'), ['s:tOrder'], SETTINGS,
+                      models_package=package_dir, grouping=grouping)
+    assert result['models'] is None
+    package = read_package(package_dir)
+    assert sorted(package) == sorted(['__init__.py'] +
+                                     ['%s.py' % group for group in groups])
+    for group, names in groups.items():
+        code = package['%s.py' % group]
+        assert sorted(line[len('class '):line.index('(')]
+                      for line in code.splitlines()
+                      if line.startswith('class ')) == names
+        assert ('from .%s import (\n%s)\n'
+                % (group, ''.join('    %s,\n' % name for name in names))
+                in package['__init__.py'])
+    # Models in other modules are referred to by name
+    code = ''.join(package.values())
+    assert "ForeignKey(\n        'Address'," in code
+    assert "ForeignKey(\n        Address," not in code
+
+
+def test_models_package_removes_stale_modules(tmp_path):
+    (tmp_path / 'common.xsd').write_text(COMMON_XSD, encoding='utf-8')
+    (tmp_path / 'sales.xsd').write_text(SALES_XSD, encoding='utf-8')
+    package_dir = str(tmp_path / 'models')
+    os.makedirs(package_dir)
+    (tmp_path / 'models' / 'notes.py').write_text('# Kept\n',
+                                                  encoding='utf-8')
+    for grouping in ('namespace', 'settings'):
+        generate(str(tmp_path / 'sales.xsd'), ['s:tOrder'], SETTINGS,
+                 models_package=package_dir, grouping=grouping)
+    assert sorted(os.listdir(package_dir)) == [
+        '__init__.py', 'addresses.py', 'notes.py', 'sales.py',
+    ]
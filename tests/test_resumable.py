@@ -0,0 +1,189 @@
+import json
+import os
+
+from django.apps import apps
+from django.db import DatabaseError
+import pytest
+
+from xsd_to_django_model.loader import ResumableLoader
+
+
+ITEM = '''  <item>
+    <sku>SKU-%d</sku>
+    <quantity>%d</quantity>
+    <price>%d.50</price>%s
+  </item>
+'''
+ORDER = '''<?xml version="1.0" encoding="UTF-8"?>
+<order currency="EUR">
+  <number>A-2002</number>
+  <date>2024-03-04</date>
+  <customer>
+    <name>Jane Doe</name>
+  </customer>
+  <signature>c2lnbmF0dXJl</signature>
+%s  <delivery>
+    <address>1 Main Street</address>
+%s  </delivery>
+  <note>Written after the items</note>
+</order>
+'''
+
+
+PARCEL = '''    <parcel>
+      <weight>%d.25</weight>
+    </parcel>
+'''
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedLoader(ResumableLoader):
+    # Fails on the given top-level element, as if the process was killed
+
+    def __init__(self, *args, **kwargs):
+        self.fail_at = kwargs.pop('fail_at')
+        super().__init__(*args, **kwargs)
+
+    def boundary(self, offset, ancestors):
+        if not self.resuming and self.state['index'] == self.fail_at:
+            raise Interrupted
+        super().boundary(offset, ancestors)
+
+
+@pytest.fixture
+def source(tmp_path):
+    filename = tmp_path / 'order.xml'
+    filename.write_text(ORDER % (''.join(
+        ITEM % (i, i, i, '\n    <discount>1</discount>' if i % 3 else '')
+        for i in range(1, 11)), ''.join(PARCEL % i for i in range(1, 7))),
+        encoding='utf-8')
+    return str(filename)
+
+
+def get_rows():
+    rows = {}
+    for model_name in ('Order', 'Customer', 'Item', 'Parcel'):
+        model = apps.get_model('shop', model_name)
+        rows[model_name] = sorted(
+            tuple(value for name, value in row.items()
+                  if not name.endswith('id'))
+            for row in model.objects.values())
+    order = apps.get_model('shop', 'Order').objects.get()
+    # Every item belongs to the order, with its customer
+    assert order.item.count() == 10
+    assert order.delivery_parcel.count() == 6
+    assert order.customer.name == 'Jane Doe'
+    return rows
+
+
+def delete_rows():
+    for model_name in ('Item', 'Parcel', 'Order', 'Customer'):
+        apps.get_model('shop', model_name).objects.all().delete()
+
+
+# Top-level elements are counted from 0: number, date, customer, signature,
+# the items from 4, delivery at 14, its parcels from 15 and note at 21
+@pytest.mark.parametrize('fail_at', [4, 7, 12, 18, 21])
+def test_resume(db, tmp_path, source, shop_mapping, fail_at):
+    checkpoint_file = str(tmp_path / 'order.checkpoint')
+    counts = ResumableLoader(shop_mapping, 'shop', checkpoint_file,
+                             checkpoint_every=2).load(source)
+    assert counts == {'Order': 1, 'Customer': 1, 'Item': 10, 'Parcel': 6,
+                      'skipped': 8}
+    assert not os.path.exists(checkpoint_file)
+    expected = get_rows()
+    delete_rows()
+
+    with pytest.raises(Interrupted):
+        InterruptedLoader(shop_mapping, 'shop', checkpoint_file,
+                          checkpoint_every=2, fail_at=fail_at).load(source)
+    with open(checkpoint_file, encoding='utf-8') as f:
+        state = json.load(f)
+    # The checkpoint is past the head, and the rows before it are saved
+    assert state['offset'] > state['head'] > 0
+    # At a parcel, the start tag of the delivery is replayed when resuming
+    assert bool(state['ancestors']) == (fail_at > 16)
+    assert apps.get_model('shop', 'Order').objects.count() == 1
+    for model_name, count in (('Item', 10), ('Parcel', 6)):
+        saved = apps.get_model('shop', model_name).objects.count()
+        assert saved == state['counts'].get(model_name, 0) <= count
+
+    resumed = ResumableLoader(shop_mapping, 'shop', checkpoint_file,
+                              checkpoint_every=2).load(source)
+    assert resumed == counts
+    assert get_rows() == expected
+    assert not os.path.exists(checkpoint_file)
+
+
+def test_torn_checkpoint(db, tmp_path, source, shop_mapping):
+    checkpoint_file = str(tmp_path / 'order.checkpoint')
+    with pytest.raises(Interrupted):
+        InterruptedLoader(shop_mapping, 'shop', checkpoint_file,
+                          checkpoint_every=2, fail_at=9).load(source)
+    with open(checkpoint_file, encoding='utf-8') as f:
+        state = json.load(f)
+    Item = apps.get_model('shop', 'Item')
+
+    # Written, but its transaction was not committed: the last record is
+    # not in the database, so the older checkpoint stays
+    torn = dict(state, offset=state['offset'] + 1,
+                last=['shop.Item', Item.objects.order_by('pk').last().pk + 1])
+    with open(checkpoint_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(torn, f)
+    loader = ResumableLoader(shop_mapping, 'shop', checkpoint_file)
+    assert loader.read_checkpoint() == state
+    assert not os.path.exists(checkpoint_file + '.tmp')
+
+    # Committed, but not renamed: it replaces the older one
+    committed = dict(state, last=['shop.Item',
+                                  Item.objects.order_by('pk').last().pk])
+    with open(checkpoint_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(committed, f)
+    assert loader.read_checkpoint() == committed
+    assert not os.path.exists(checkpoint_file + '.tmp')
+
+
+def test_checkpoint_for_another_source(db, tmp_path, source, shop_mapping):
+    checkpoint_file = str(tmp_path / 'order.checkpoint')
+    with pytest.raises(Interrupted):
+        InterruptedLoader(shop_mapping, 'shop', checkpoint_file,
+                          checkpoint_every=2, fail_at=9).load(source)
+    other = str(tmp_path / 'other.xml')
+    with open(source, encoding='utf-8') as f, \
+            open(other, 'w', encoding='utf-8') as g:
+        g.write(f.read())
+    with pytest.raises(ValueError):
+        ResumableLoader(shop_mapping, 'shop', checkpoint_file).load(other)
+
+
+class FailingAtomic:
+    # Commits, then fails as if the commit did
+
+    def __init__(self, atomic):
+        self.atomic = atomic
+        self.exits = 0
+
+    def __exit__(self, *exc_info):
+        self.exits += 1
+        self.atomic.__exit__(*exc_info)
+        raise DatabaseError('commit failed')
+
+
+class FailingCommitLoader(ResumableLoader):
+
+    def write_checkpoint(self):
+        self.failing = self.atomic = FailingAtomic(self.atomic)
+        super().write_checkpoint()
+
+
+def test_failing_commit_is_exited_once(db, tmp_path, source, shop_mapping):
+    loader = FailingCommitLoader(shop_mapping, 'shop',
+                                 str(tmp_path / 'order.checkpoint'),
+                                 checkpoint_every=2)
+    with pytest.raises(DatabaseError):
+        loader.load(source)
+    assert loader.failing.exits == 1
+    assert loader.atomic is None
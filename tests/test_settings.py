@@ -0,0 +1,114 @@
+import os
+import pickle
+
+import pytest
+
+from xsd_to_django_model.xsd_to_django_model import Settings, generate
+
+from conftest import SHOP_DIR
+
+
+SHOP_XSD = os.path.join(SHOP_DIR, 'shop.xsd')
+SHOP_SETTINGS = os.path.join(SHOP_DIR, 'xsd_to_django_model_settings.py')
+
+
+def get_classes(code):
+    return sorted(line[len('class '):line.index('(')]
+                  for line in code.splitlines() if line.startswith('class '))
+
+
+def test_settings_objects_in_turn():
+    shop = Settings.from_file(SHOP_SETTINGS)
+    prefixed = Settings(
+        TYPE_MODEL_MAP={r't(.+)': r'Shop\1'},
+        MODEL_OPTIONS={'ShopOrder': dict(shop.MODEL_OPTIONS['Order'])},
+        BASETYPE_OVERRIDES={'xs:string': 'TextField'},
+    )
+    options = dict(shop.MODEL_OPTIONS['Order'], drop_fields=[])
+    keep_signature = Settings(TYPE_MODEL_MAP=shop.TYPE_MODEL_MAP,
+                              MODEL_OPTIONS={'Order': options})
+    automatic = Settings(
+        MODEL_OPTIONS={'tOrder': dict(shop.MODEL_OPTIONS['Order'])},
+    )
+    first = generate(SHOP_XSD, ['tOrder'], shop)['models']
+    assert get_classes(first) == ['Customer', 'Item', 'Order', 'Parcel']
+    code = generate(SHOP_XSD, ['tOrder'], prefixed)['models']
+    assert get_classes(code) == ['ShopCustomer', 'ShopItem', 'ShopOrder',
+                                 'ShopParcel']
+    assert 'CharField' not in code
+    # Same model names, other options
+    assert '# Dropping signature' in first
+    code = generate(SHOP_XSD, ['tOrder'], keep_signature)['models']
+    assert '\n    signature = ' in code
+    code = generate(SHOP_XSD, ['tOrder'], automatic)['models']
+    assert get_classes(code) == ['tCustomer', 'tItem', 'tOrder', 'tParcel']
+    # Automatic model names stay with the builder
+    assert automatic.TYPE_MODEL_MAP == {}
+    # Nothing memoized with the other settings is reused
+    assert generate(SHOP_XSD, ['tOrder'], shop)['models'] == first
+    assert 'xs:string' not in shop.BASETYPE_OVERRIDES
+    assert shop.BASETYPE_FIELD_MAP['xs:string'] == 'CharField'
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({'TYPE_MODEL_MAPS': {}}, 'unknown settings: TYPE_MODEL_MAPS'),
+    ({'MAX_LINE_LENGTH': '80'}, 'MAX_LINE_LENGTH is not an integer'),
+    ({'DOC_PREPROCESSOR': 'upper'}, 'DOC_PREPROCESSOR is not callable'),
+    ({'TYPE_MODEL_MAP': {r't(.+': r'\1'}}, 'TYPE_MODEL_MAP: invalid pattern'),
+    ({'MODEL_GROUPS': {r'[': 'x'}}, 'MODEL_GROUPS: invalid pattern'),
+    ({'MODEL_OPTIONS': {'Order': []}}, "MODEL_OPTIONS['Order'] is not a dict"),
+    ({'MODEL_OPTIONS': {'Order': {'if_type': {r'(': {}}}}},
+     "MODEL_OPTIONS['Order']['if_type']: invalid pattern"),
+])
+def test_settings_validation(kwargs, message):
+    with pytest.raises(ValueError, match=message.replace('[', r'\[')):
+        Settings(**kwargs)
+
+
+def test_settings_patterns_compiled_once():
+    settings = Settings(TYPE_MODEL_MAP={r't(.+)': r'\1'})
+    pattern = settings.type_model_map[0][0]
+    assert settings.compile(r't(.+)') is pattern
+    # Patterns match whole names, in verbose mode
+    assert pattern.match('tOrder')
+    assert settings.compile(r'Or der').match('Order')
+    assert not settings.compile(r'Order').match('Orders')
+
+
+def test_settings_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    settings = Settings.from_file(SHOP_SETTINGS, cache_dir)
+    filenames = os.listdir(cache_dir)
+    assert len(filenames) == 1
+    assert filenames[0].startswith('settings-')
+    cache_filename = os.path.join(cache_dir, filenames[0])
+    with open(cache_filename, 'rb') as f:
+        cached = pickle.load(f)
+    assert cached.MODEL_OPTIONS == settings.MODEL_OPTIONS
+    assert cached.type_model_map[0][0].pattern == r't(.+)$'
+    # The cached object is used as long as the file stays the same
+    cached.MAX_LINE_LENGTH = 120
+    with open(cache_filename, 'wb') as f:
+        pickle.dump(cached, f)
+    assert Settings.from_file(SHOP_SETTINGS, cache_dir).MAX_LINE_LENGTH == 120
+    # An unreadable cache is rebuilt
+    with open(cache_filename, 'wb') as f:
+        f.write(b'garbage')
+    assert Settings.from_file(SHOP_SETTINGS, cache_dir).MAX_LINE_LENGTH == 80
+    # A changed file gets a cache entry of its own
+    changed = tmp_path / 'settings.py'
+    with open(SHOP_SETTINGS, encoding='utf-8') as f:
+        changed.write_text(f.read() + 'MAX_LINE_LENGTH = 100\n',
+                           encoding='utf-8')
+    assert Settings.from_file(str(changed), cache_dir).MAX_LINE_LENGTH == 100
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_settings_cache_skips_unpicklable(tmp_path):
+    filename = tmp_path / 'settings.py'
+    filename.write_text('DOC_PREPROCESSOR = lambda doc: doc.upper()\n',
+                        encoding='utf-8')
+    cache_dir = tmp_path / 'cache'
+    settings = Settings.from_file(str(filename), str(cache_dir))
+    assert settings.DOC_PREPROCESSOR('doc') == 'DOC'
+    assert not cache_dir.exists() or not os.listdir(str(cache_dir))
@@ -0,0 +1,93 @@
+import pytest
+
+from xsd_to_django_model.xsd_to_django_model import Settings, generate
+
+
+CITY_XSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:complexType name="tParcel">
+    <xs:sequence>
+      <xs:element name="location">
+        <xs:complexType>
+          <xs:attribute name="x" type="xs:decimal"/>
+          <xs:attribute name="y" type="xs:decimal"/>
+        </xs:complexType>
+      </xs:element>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:complexType name="tBuilding">
+    <xs:sequence>
+      <xs:element name="location">
+        <xs:complexType>
+          <xs:annotation>
+            <xs:documentation>Where the building stands</xs:documentation>
+          </xs:annotation>
+          <xs:attribute name="x" type="xs:decimal"/>
+          <xs:attribute name="y" type="xs:decimal"/>
+        </xs:complexType>
+      </xs:element>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:complexType name="tRoad">
+    <xs:sequence>
+      <xs:element name="location">
+        <xs:complexType>
+          <xs:attribute name="x" type="xs:decimal"/>
+          <xs:attribute name="y" type="xs:decimal"/>
+          <xs:attribute name="z" type="xs:decimal"/>
+        </xs:complexType>
+      </xs:element>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:complexType name="tCity">
+    <xs:sequence>
+      <xs:element name="parcel" type="tParcel"/>
+      <xs:element name="building" type="tBuilding"/>
+      <xs:element name="road" type="tRoad"/>
+    </xs:sequence>
+  </xs:complexType>
+</xs:schema>
+'''
+
+SETTINGS = Settings(TYPE_MODEL_MAP={
+    r'tParcel\.location': 'Location',
+    r'tBuilding\.location': 'BuildingLocation',
+    r'tRoad\.location': 'RoadLocation',
+    r't(.+)': r'\1',
+})
+
+
+def get_classes(code):
+    return sorted(line[len('class '):line.index('(')]
+                  for line in code.splitlines() if line.startswith('class '))
+
+
+@pytest.mark.parametrize('share_anonymous, locations', [
+    (False, {'parcel': 'Location', 'building': 'BuildingLocation',
+             'road': 'RoadLocation'}),
+    # The location of a building differs by its documentation only, and
+    # gets the model of the first one reached; the road one has a z
+    (True, {'parcel': 'Location', 'building': 'Location',
+            'road': 'RoadLocation'}),
+])
+def test_share_anonymous(tmp_path, share_anonymous, locations):
+    xsd = tmp_path / 'city.xsd'
+    xsd.write_text(CITY_XSD, encoding='utf-8')
+    result = generate(str(xsd), ['tCity'], SETTINGS, path_index=True,
+                      share_anonymous=share_anonymous)
+    models = sorted(set(locations.values()) |
+                    {'Building', 'City', 'Parcel', 'Road'})
+    assert get_classes(result['models']) == models
+    assert sorted(result['mapping']) == models + ['_path_index']
+    path_index = result['mapping']['_path_index']['City']
+    for name, model in locations.items():
+        assert path_index['%s.location' % name] == \
+            [model, 'location', 'foreign_key']
+        assert path_index['%s.location.@x' % name] == \
+            [model, 'x', 'decimal']
+    if share_anonymous:
+        assert ('# Corresponds to XSD type[s]: tBuilding.location;'
+                ' tParcel.location\nclass Location(' in result['models'])
+        assert 'BuildingLocation' not in result['models']
+        assert [f['name'] for f in result['mapping']['Location']['fields']] \
+            == ['x', 'y']
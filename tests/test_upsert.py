@@ -0,0 +1,90 @@
+import datetime
+import decimal
+
+from django.apps import apps
+import pytest
+
+from xsd_to_django_model.upsert import SpilledKeys, Upserter
+
+
+MAPPING = {
+    'Customer': {'match_fields': ['name']},
+    'Item': {'match_fields': ['order', 'quantity']},
+}
+
+
+def get_model(model_name):
+    return apps.get_model('shop', model_name)
+
+
+def get_customers():
+    return list(get_model('Customer').objects.order_by('pk')
+                .values_list('name', 'email'))
+
+
+@pytest.fixture
+def customers(db):
+    Customer = get_model('Customer')
+    for name in ('Ann', 'Bob', 'Cat'):
+        Customer.objects.create(name=name, email='%s@old' % name.lower())
+
+
+@pytest.mark.parametrize('options', [
+    {'preload': True},
+    {'preload': False},
+    {'preload': True, 'max_keys': 1},
+    {'preload': False, 'max_keys': 1},
+])
+def test_upsert(customers, options):
+    upserter = Upserter(MAPPING, 'shop', **options)
+    # Bob carries no email: his stored email must be kept, although Ann's
+    # email is updated in the same batch
+    upserter.add('Customer', {'name': 'Ann', 'email': 'ann@new'})
+    upserter.add('Customer', {'name': 'Bob'})
+    upserter.add('Customer', {'name': 'Dan', 'email': 'dan@new'})
+    assert upserter.flush() == {'Customer': {'created': 1, 'updated': 2}}
+    assert get_customers() == [
+        ('Ann', 'ann@new'),
+        ('Bob', 'bob@old'),
+        ('Cat', 'cat@old'),
+        ('Dan', 'dan@new'),
+    ]
+    index = upserter.indexes['Customer']
+    assert isinstance(index.keys, SpilledKeys) == bool(
+        options.get('max_keys'))
+    # Created rows are found in the index afterwards
+    upserter.add('Customer', {'name': 'Dan', 'email': 'dan@newer'})
+    assert upserter.flush()['Customer'] == {'created': 1, 'updated': 3}
+    assert get_customers()[-1] == ('Dan', 'dan@newer')
+
+
+def test_upsert_batches(customers):
+    upserter = Upserter(MAPPING, 'shop', batch_size=2, preload=False)
+    for name in ('Ann', 'Bob', 'Eve', 'Fay', 'Ann'):
+        upserter.add('Customer', {'name': name, 'email': 'new'})
+    assert upserter.flush() == {'Customer': {'created': 2, 'updated': 3}}
+    assert get_model('Customer').objects.filter(email='new').count() == 4
+
+
+@pytest.mark.parametrize('preload', [True, False])
+def test_upsert_converts_keys(customers, preload):
+    order = get_model('Order').objects.create(
+        number='A-1', date=datetime.date(2024, 3, 1),
+        customer=get_model('Customer').objects.get(name='Ann'))
+    order.item.create(sku='SKU-1', quantity=5, price=decimal.Decimal('1.00'))
+    upserter = Upserter(MAPPING, 'shop', preload=preload)
+    # Values as parsed from XML text
+    upserter.add('Item', {'order_id': str(order.pk), 'quantity': '5',
+                          'price': '2.50'})
+    assert upserter.flush() == {'Item': {'updated': 1, 'created': 0}}
+    assert list(order.item.values_list('sku', 'quantity', 'price')) == \
+        [('SKU-1', 5, decimal.Decimal('2.50'))]
+
+
+def test_upsert_inserts_records_without_key(customers):
+    upserter = Upserter({'Customer': {'match_fields': ['email']}}, 'shop')
+    upserter.add('Customer', {'name': 'Gus'})
+    upserter.add('Customer', {'name': 'Hal'})
+    upserter.add('Customer', {'name': 'Ann', 'email': 'ann@old'})
+    assert upserter.flush() == {'Customer': {'created': 2, 'updated': 1}}
+    assert get_customers()[-2:] == [('Gus', None), ('Hal', None)]
@@ -0,0 +1,287 @@
+"""
+Conversion of XML documents to PostgreSQL COPY data, driven by the mapping
+written by xsd_to_django_model.
+
+Documents are parsed like the loader does, but completed records are
+written as COPY rows (in text or CSV format) instead of being saved one
+batch at a time with bulk_create. Primary keys are assigned before the
+rows are written, so foreign key columns are filled without any round
+trip to the database.
+
+The rows are either written to a file per table, with a manifest listing
+the tables in the order they should be loaded, or copied right away
+through a database connection. Other databases than PostgreSQL have no
+COPY, so the rows are inserted with plain INSERT statements there instead
+(which is only supported for SQLite, to check the produced data).
+"""
+
+
+import datetime
+import io
+import json
+import os
+import re
+
+from django.apps import apps
+from django.db import connections, models, transaction, DEFAULT_DB_ALIAS
+
+from .loader import Loader, PkAllocator, reset_sequences
+
+
+MANIFEST = 'copy.json'
+FORMATS = {
+    'text': '.copy',
+    'csv': '.csv',
+}
+
+TEXT_ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+TEXT_UNESCAPES = {'t': '\t', 'n': '\n', 'r': '\r'}
+TEXT_SPECIAL = re.compile(r'[\\\t\n\r]')
+TEXT_ESCAPE = re.compile(r'\\(.)')
+CSV_FIELD = re.compile(r'"((?:[^"]|"")*)"|([^,\r\n]*)')
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\x' + bytes(value).hex()
+    if isinstance(value, (list, tuple)):
+        return '{%s}' % ','.join(
+            'NULL' if item is None else
+            '"%s"' % format_value(item).replace('\\', '\\\\')
+                                       .replace('"', '\\"')
+            for item in value
+        )
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    return str(value)
+
+
+def format_text_row(values):
+    return '\t'.join(
+        '\\N' if value is None else
+        TEXT_SPECIAL.sub(lambda m: TEXT_ESCAPES[m.group()],
+                         format_value(value))
+        for value in values
+    ) + '\n'
+
+
+def format_csv_row(values):
+    # Everything but NULL is quoted, so that NULL and empty strings differ
+    return ','.join(
+        '' if value is None else
+        '"%s"' % format_value(value).replace('"', '""')
+        for value in values
+    ) + '\n'
+
+
+def parse_text_rows(data):
+    for line in data.split('\n'):
+        if not line:
+            continue
+        yield [None if value == '\\N' else
+               TEXT_ESCAPE.sub(lambda m: TEXT_UNESCAPES.get(m.group(1),
+                                                            m.group(1)),
+                               value)
+               for value in line.split('\t')]
+
+
+def parse_csv_rows(data):
+    pos = 0
+    row = []
+    while pos < len(data):
+        m = CSV_FIELD.match(data, pos)
+        quoted, plain = m.groups()
+        row.append(quoted.replace('""', '"') if quoted is not None
+                   else plain or None)
+        pos = m.end()
+        if data[pos:pos + 1] == ',':
+            pos += 1
+            continue
+        yield row
+        row = []
+        pos += 2 if data[pos:pos + 2] == '\r\n' else 1
+
+
+ROW_FORMATTERS = {
+    'text': format_text_row,
+    'csv': format_csv_row,
+}
+ROW_PARSERS = {
+    'text': parse_text_rows,
+    'csv': parse_csv_rows,
+}
+
+
+def get_sqlite_converter(declared_type):
+    declared_type = declared_type.lower()
+    if declared_type.startswith('bool'):
+        return lambda value: value == 't'
+    if 'int' in declared_type:
+        return int
+    if declared_type == 'real':
+        return float
+    if declared_type == 'blob':
+        return lambda value: bytes.fromhex(value[2:])
+    return str
+
+
+def insert_rows(connection, table, columns, fmt, f):
+    # Stands in for COPY on SQLite
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA table_info(%s)' % quote_name(table))
+        types = {row[1]: row[2] for row in cursor.fetchall()}
+        converters = [get_sqlite_converter(types[column])
+                      for column in columns]
+        cursor.executemany(
+            'INSERT INTO %s (%s) VALUES (%s)' % (
+                quote_name(table),
+                ', '.join(quote_name(column) for column in columns),
+                ', '.join(['%s'] * len(columns))),
+            [[None if value is None else convert(value)
+              for convert, value in zip(converters, row)]
+             for row in ROW_PARSERS[fmt](f.read())])
+
+
+def copy_rows(connection, table, columns, fmt, f):
+    if connection.vendor == 'sqlite':
+        insert_rows(connection, table, columns, fmt, f)
+        return
+    if connection.vendor != 'postgresql':
+        raise NotImplementedError("COPY is not supported by %s"
+                                  % connection.vendor)
+    quote_name = connection.ops.quote_name
+    sql = 'COPY %s (%s) FROM STDIN%s' % (
+        quote_name(table),
+        ', '.join(quote_name(column) for column in columns),
+        ' WITH (FORMAT csv)' if fmt == 'csv' else '')
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            # psycopg2
+            raw.copy_expert(sql, f)
+        else:
+            with raw.copy(sql) as copy:
+                for data in iter(lambda: f.read(65536), ''):
+                    copy.write(data)
+
+
+class FileWriter:
+    # Writes the rows to a file per table in dirname, appending to the
+    # files written by the same writer before
+
+    def __init__(self, dirname, fmt='text'):
+        if fmt not in FORMATS:
+            raise ValueError("unknown COPY format: %s" % fmt)
+        self.dirname = dirname
+        self.fmt = fmt
+        self.files = {}
+        self.tables = []
+
+    def __enter__(self):
+        os.makedirs(self.dirname, exist_ok=True)
+        return self
+
+    def write(self, table, columns, rows):
+        f = self.files.get(table)
+        if f is None:
+            filename = table + FORMATS[self.fmt]
+            known = any(t[0] == table for t in self.tables)
+            f = self.files[table] = open(os.path.join(self.dirname, filename),
+                                         'a' if known else 'w',
+                                         encoding='utf-8', newline='')
+            if not known:
+                self.tables.append([table, columns, filename])
+        format_row = ROW_FORMATTERS[self.fmt]
+        f.writelines(format_row(row) for row in rows)
+
+    def __exit__(self, *exc_info):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        with open(os.path.join(self.dirname, MANIFEST), 'w',
+                  encoding='utf-8') as f:
+            json.dump({'format': self.fmt, 'tables': self.tables}, f,
+                      indent=4)
+
+
+class DatabaseWriter:
+    # Copies the rows through a database connection in a single transaction
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, fmt='text'):
+        if fmt not in FORMATS:
+            raise ValueError("unknown COPY format: %s" % fmt)
+        self.using = using
+        self.fmt = fmt
+        self.atomic = None
+
+    def __enter__(self):
+        self.atomic = transaction.atomic(using=self.using)
+        self.atomic.__enter__()
+        return self
+
+    def write(self, table, columns, rows):
+        format_row = ROW_FORMATTERS[self.fmt]
+        copy_rows(connections[self.using], table, columns, self.fmt,
+                  io.StringIO(''.join(format_row(row) for row in rows)))
+
+    def __exit__(self, *exc_info):
+        atomic = self.atomic
+        self.atomic = None
+        return atomic.__exit__(*exc_info)
+
+
+class Exporter(Loader):
+
+    def __init__(self, mapping, app_label, writer, model_name=None,
+                 start_pk=None, **kwargs):
+        if kwargs.get('allocate_pk') is None:
+            kwargs['allocate_pk'] = PkAllocator(
+                kwargs.get('using', DEFAULT_DB_ALIAS), start_pk)
+        super().__init__(mapping, app_label, model_name, **kwargs)
+        self.writer = writer
+
+    def insert(self, model, instances):
+        # Every table of a multi-table inheritance hierarchy gets its own
+        # rows, ancestors first
+        for table_model in list(reversed(model._meta.get_parent_list())) + \
+                [model]:
+            fields = [f for f in table_model._meta.local_concrete_fields
+                      if not (f.primary_key and
+                              isinstance(f, models.AutoField) and
+                              getattr(instances[0], f.attname) is None)]
+            self.writer.write(
+                table_model._meta.db_table,
+                [f.column for f in fields],
+                [[getattr(instance, f.attname) for f in fields]
+                 for instance in instances])
+
+    def load(self, source):
+        with self.writer:
+            self.parse(source)
+            self.flush()
+        return dict(self.counts)
+
+
+def export(source, mapping, app_label, dirname, fmt='text', model_name=None,
+           **kwargs):
+    return Exporter(mapping, app_label, FileWriter(dirname, fmt), model_name,
+                    **kwargs).load(source)
+
+
+def load_files(dirname, using=DEFAULT_DB_ALIAS):
+    with open(os.path.join(dirname, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        for table, columns, filename in manifest['tables']:
+            with open(os.path.join(dirname, filename), encoding='utf-8',
+                      newline='') as f:
+                copy_rows(connection, table, columns, manifest['format'], f)
+        tables = {table for table, columns, filename in manifest['tables']}
+        reset_sequences([model for model in apps.get_models()
+                         if model._meta.db_table in tables], using)
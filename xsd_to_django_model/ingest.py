@@ -0,0 +1,234 @@
+#! /usr/bin/env python
+
+"""
+ingest
+Load a directory of XML documents into the database with a pool of worker
+processes, each with its own database connection.
+
+Usage:
+    ingest.py [-j <mapping_filename>] [-l <loaders_module>] [-m <model_name>]
+              [-w <workers>] [-b <batch_size>] [-k <block_size>]
+              [-r <retries>] [-s <settings_module>] [-d <database>]
+              <app_label> <xml_path>...
+    ingest.py -h | --help
+
+Options:
+    -h --help              Show this screen.
+    -j <mapping_filename>  Mapping generated with --path-index
+                           [default: mapping.json].
+    -l <loaders_module>    Module with the converters generated with -l, used
+                           instead of the mapping.
+    -m <model_name>        Model of the document root element, required if
+                           the mapping has several.
+    -w <workers>           Number of worker processes, defaults to the number
+                           of CPUs.
+    -b <batch_size>        Number of records saved at once by every worker
+                           [default: 1000].
+    -k <block_size>        Number of primary keys of a model reserved at once
+                           by every worker [default: 10000].
+    -r <retries>           Number of times a document is loaded again after a
+                           transient error, such as "database is locked"
+                           [default: 5].
+    -s <settings_module>   Django settings module, defaults to
+                           DJANGO_SETTINGS_MODULE.
+    -d <database>          Database alias [default: default].
+    <app_label>            Django app label of the generated models.
+    <xml_path>             XML document, directory of XML documents or glob
+                           pattern.
+
+Every document is loaded in its own transaction by one of the workers.
+Primary keys are handed out to the workers in blocks, so that they never
+collide; sequences are reset once all the documents are loaded. The keys
+left in the blocks of every worker at the end, and the keys taken by
+documents which failed or were loaded again, are never used: the primary
+keys have gaps, of up to <block_size> keys per model and worker.
+"""
+
+
+from collections import defaultdict
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from docopt import docopt
+
+
+BLOCK_SIZE = 10000
+RETRIES = 5
+RETRY_DELAY = 0.1
+
+logger = logging.getLogger(__name__)
+
+worker = None
+
+
+def get_filenames(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = sorted(glob.glob(os.path.join(path, '*.xml')))
+        else:
+            filenames = sorted(glob.glob(path, recursive=True))
+        if not filenames:
+            logger.warning('No XML documents found at %s', path)
+        for filename in filenames:
+            yield filename
+
+
+def setup_django(settings_module):
+    if settings_module:
+        os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    import django
+    django.setup()
+
+
+def is_transient(e):
+    # SQLite lock timeouts, PostgreSQL deadlocks and serialization failures,
+    # after which the same transaction may well succeed
+    from django.db import OperationalError
+    if not isinstance(e, OperationalError):
+        return False
+    cause = e.__cause__
+    return ('database is locked' in str(e) or
+            (getattr(cause, 'pgcode', None) or
+             getattr(cause, 'sqlstate', None)) in ('40001', '40P01'))
+
+
+class SharedPkAllocator:
+    # Reserves blocks of primary keys in a dict shared by all the workers.
+    # Keys are never given back, so the rest of the last block of a worker
+    # and the keys of rolled back documents leave gaps
+
+    def __init__(self, lock, next_pks, using, block_size=BLOCK_SIZE):
+        from .loader import PkAllocator
+        self.lock = lock
+        self.next_pks = next_pks
+        self.blocks = {}
+        self.local = PkAllocator(using)
+        self.block_size = block_size
+
+    def reserve(self, model):
+        key = model._meta.label
+        with self.lock:
+            try:
+                start = self.next_pks[key]
+            except KeyError:
+                start = self.local.get_max_pk(model) + 1
+            self.next_pks[key] = start + self.block_size
+        return [start, start + self.block_size]
+
+    def __call__(self, model):
+        block = self.blocks.get(model)
+        if block is None or block[0] == block[1]:
+            block = self.blocks[model] = self.reserve(model)
+        pk = block[0]
+        block[0] += 1
+        return pk
+
+
+class Worker:
+
+    def __init__(self, settings_module, lock, next_pks, mapping, app_label,
+                 model_name, batch_size, using, converters,
+                 block_size=BLOCK_SIZE, retries=RETRIES):
+        setup_django(settings_module)
+        from .mapping import load_mapping
+        self.allocate_pk = SharedPkAllocator(lock, next_pks, using,
+                                             block_size)
+        self.mapping = (load_mapping(mapping) if converters is None
+                        else None)
+        self.app_label = app_label
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.using = using
+        self.converters = converters
+        self.retries = retries
+
+    def load(self, filename):
+        from .loader import Loader
+        for attempt in range(self.retries + 1):
+            loader = Loader(self.mapping, self.app_label, self.model_name,
+                            batch_size=self.batch_size, using=self.using,
+                            converters=self.converters,
+                            allocate_pk=self.allocate_pk,
+                            reset_sequences=False)
+            try:
+                counts = loader.load(filename)
+            except Exception as e:
+                if attempt < self.retries and is_transient(e):
+                    # The transaction is rolled back, load it again
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+                    continue
+                return filename, None, '%s: %s' % (type(e).__name__, e)
+            return filename, counts, [model._meta.label
+                                      for model in loader.pk_models]
+
+
+def init_worker(*args):
+    global worker
+    worker = Worker(*args)
+
+
+def load_file(filename):
+    return worker.load(filename)
+
+
+def ingest(paths, mapping, app_label, model_name=None, workers=None,
+           batch_size=1000, using='default', converters=None,
+           settings_module=None, block_size=BLOCK_SIZE, retries=RETRIES):
+    setup_django(settings_module)
+    from django.apps import apps
+    from django.db import connections
+    from .loader import reset_sequences
+
+    filenames = list(get_filenames(paths))
+    counts = defaultdict(int)
+    pk_models = set()
+    failed = []
+    # Workers must not share the connections of this process
+    connections.close_all()
+    with multiprocessing.Manager() as manager:
+        args = (settings_module, manager.Lock(), manager.dict(), mapping,
+                app_label, model_name, batch_size, using, converters,
+                block_size, retries)
+        with multiprocessing.Pool(workers, init_worker, args) as pool:
+            for filename, file_counts, extra in \
+                    pool.imap_unordered(load_file, filenames):
+                if file_counts is None:
+                    logger.error('Failed to load %s: %s', filename, extra)
+                    failed.append(filename)
+                    continue
+                for key, value in file_counts.items():
+                    counts[key] += value
+                pk_models.update(extra)
+    reset_sequences([apps.get_model(label) for label in pk_models], using)
+    counts['documents'] = len(filenames) - len(failed)
+    return dict(counts), failed
+
+
+def main():
+    args = docopt(__doc__)
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.getcwd())
+    started = time.time()
+    counts, failed = ingest(args['<xml_path>'], args['-j'],
+                            args['<app_label>'], args['-m'],
+                            workers=int(args['-w']) if args['-w'] else None,
+                            batch_size=int(args['-b']), using=args['-d'],
+                            converters=args['-l'],
+                            settings_module=args['-s'],
+                            block_size=int(args['-k']),
+                            retries=int(args['-r']))
+    elapsed = time.time() - started
+    for key, value in sorted(counts.items()):
+        logger.info('%s: %d', key, value)
+    logger.info('Loaded %d documents in %.1f s', counts['documents'],
+                elapsed)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,766 @@
+"""
+Streaming XML loader driven by the mapping written by xsd_to_django_model.
+
+The mapping has to be generated with --path-index. XML documents are fed
+to the parser incrementally, every element and attribute is routed to its
+model and column with a single lookup in the path index, and completed
+records are saved with batched bulk_create, so that memory use does not
+depend on the document size. Subtrees which hold nothing mapped (dropped
+fields, unknown elements) are skipped as they are parsed, without building
+any objects for them. With the converters generated with -l, every record
+is built with iterparse and converted at once by its model's function
+instead, and the elements no converter reads are dropped as they end.
+
+Primary keys are assigned by the loader before the records are saved, so
+children may refer to parents which are not complete yet; the document is
+loaded in a single transaction, relying on foreign key constraints being
+checked at commit time (which is the case for the PostgreSQL and SQLite
+backends of Django). The loader assumes nobody else inserts rows into the
+same tables while it is running.
+"""
+
+
+import base64
+from collections import defaultdict
+import datetime
+import decimal
+from importlib import import_module
+import json
+import os
+import sys
+from xml.parsers import expat
+import xml.etree.ElementTree as ET
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import (connections, models, transaction, DEFAULT_DB_ALIAS,
+                       IntegrityError)
+from django.utils import timezone
+
+from .mapping import PATH_INDEX, RELATION_KINDS, load_mapping
+
+
+CHUNK_SIZE = 65536
+SKIPPED_KINDS = ('drop', 'parent')
+
+
+def to_bool(value):
+    return value in ('true', '1')
+
+
+def to_date(value):
+    value = value.strip()
+    if len(value) == 7:
+        # xs:gYearMonth
+        value += '-01'
+    return datetime.date.fromisoformat(value[:10])
+
+
+def to_datetime(value):
+    value = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if value.tzinfo and not settings.USE_TZ:
+        value = timezone.make_naive(value)
+    return value
+
+
+CONVERTERS = {
+    'binary': base64.b64decode,
+    'bool': to_bool,
+    'date': to_date,
+    'datetime': to_datetime,
+    'decimal': decimal.Decimal,
+    'float': float,
+    'int': int,
+    'json': str,
+    'str': str,
+}
+
+
+def reset_sequences(models, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), list(models))
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def bulk_insert(model, instances, batch_size=1000, using=DEFAULT_DB_ALIAS):
+    parents = model._meta.get_parent_list()
+    if not parents:
+        model._base_manager.using(using).bulk_create(instances,
+                                                     batch_size=batch_size)
+        return
+    # bulk_create does not support multi-table inheritance, so insert every
+    # table of the hierarchy on its own; primary keys have to be set
+    for parent in reversed(parents):
+        fields = parent._meta.local_concrete_fields
+        parent._base_manager.using(using).bulk_create(
+            [parent(**{f.attname: getattr(instance, f.attname)
+                       for f in fields})
+             for instance in instances],
+            batch_size=batch_size)
+    model._base_manager.using(using)._insert(
+        instances, fields=model._meta.local_concrete_fields, using=using)
+
+
+def get_live_paths(index):
+    # Element paths holding mapped data themselves or in their subtrees
+    live = {''}
+    for key, (model_name, column, kind) in index.items():
+        if kind in SKIPPED_KINDS:
+            continue
+        parts = key.split('.')
+        if parts[-1][0] == '@' or parts[-1] == '#text':
+            parts.pop()
+        for i in range(1, len(parts) + 1):
+            live.add('.'.join(parts[:i]))
+    return live
+
+
+def local_name(tag):
+    return tag.rpartition('}')[2]
+
+
+def iter_texts(element, path):
+    # Texts of array field items, which are either the elements found at
+    # the path or the children of a single wrapping element
+    for e in element.iterfind(path):
+        if len(e):
+            for item in e:
+                if item.text and not item.text.isspace():
+                    yield item.text
+        elif e.text and not e.text.isspace():
+            yield e.text
+
+
+class Record:
+    __slots__ = ('model', 'key', 'values', 'parent', 'column', 'kind', 'pk')
+
+    def __init__(self, model, key, parent=None, column=None, kind=None):
+        self.model = model
+        self.key = key
+        self.values = {}
+        self.parent = parent
+        self.column = column
+        self.kind = kind
+        self.pk = None
+
+
+class PkAllocator:
+    # Hands out primary keys following the largest one in the table, or
+    # starting from start if it is given
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, start=None):
+        self.using = using
+        self.start = start
+        self.next_pks = {}
+
+    def get_max_pk(self, model):
+        return model._base_manager.using(self.using) \
+            .aggregate(pk=models.Max('pk'))['pk'] or 0
+
+    def __call__(self, model):
+        try:
+            pk = self.next_pks[model]
+        except KeyError:
+            pk = (self.get_max_pk(model) + 1 if self.start is None
+                  else self.start)
+        self.next_pks[model] = pk + 1
+        return pk
+
+
+class Router:
+    # Parser target routing elements and attributes to the records of the
+    # loader; subtrees holding nothing mapped are skipped without building
+    # any objects
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.index = loader.index
+        self.live = get_live_paths(loader.index)
+        self.arrays = {key for key, entry in loader.index.items()
+                       if entry[2].endswith('[]')}
+        self.keys = []
+        self.texts = []
+        self.records = []
+        self.in_text = False
+        self.skipped = 0
+
+    def start(self, tag, attrib):
+        if self.skipped:
+            self.skipped += 1
+            return
+        loader = self.loader
+        self.in_text = False
+        if self.keys:
+            parent = self.keys[-1]
+            key = '%s.%s' % (parent, local_name(tag)) if parent \
+                else local_name(tag)
+            if key not in self.live and parent not in self.arrays:
+                self.skipped = 1
+                loader.counts['skipped'] += 1
+                return
+            entry = self.index.get(key)
+            if entry is not None and entry[2] in RELATION_KINDS:
+                self.records.append(loader.open(key, entry, self.records[-1]))
+        else:
+            key = ''
+            self.records.append(loader.open(key, (loader.model_name, None,
+                                                  None), None))
+        self.keys.append(key)
+        self.texts.append([])
+        self.in_text = True
+        prefix = key + '.' if key else ''
+        for name, value in attrib.items():
+            loader.set_value(self.records[-1],
+                             '%s@%s' % (prefix, local_name(name)), value)
+
+    def data(self, text):
+        if self.in_text and not self.skipped:
+            self.texts[-1].append(text)
+
+    def end(self, tag):
+        if self.skipped:
+            self.skipped -= 1
+            return
+        self.in_text = False
+        key = self.keys.pop()
+        text = ''.join(self.texts.pop())
+        record = self.records[-1]
+        is_record = record.key == key
+        if text and not text.isspace():
+            self.loader.set_value(record, ('%s.#text' % key if key
+                                           else '#text') if is_record
+                                  else key, text)
+        if is_record:
+            self.loader.close(self.records.pop())
+
+    def close(self):
+        pass
+
+
+
+class Loader:
+
+    def __init__(self, mapping, app_label, model_name=None, batch_size=1000,
+                 using=DEFAULT_DB_ALIAS, converters=None, allocate_pk=None,
+                 reset_sequences=True):
+        if isinstance(converters, str):
+            converters = import_module(converters)
+        if converters is not None:
+            # Relations only, every record is converted by generated code
+            path_index = converters.RECORDS
+            fields = getattr(converters, 'FIELDS', None)
+            self.converters = converters.CONVERTERS
+        else:
+            if isinstance(mapping, str):
+                mapping = load_mapping(mapping)
+            try:
+                path_index = mapping[PATH_INDEX]
+            except KeyError:
+                raise ValueError("the mapping has no path index,"
+                                 " generate it with --path-index")
+            fields = None
+            self.converters = None
+        if model_name is None:
+            if len(path_index) != 1:
+                raise ValueError("model_name is required, choose one of: %s"
+                                 % ', '.join(sorted(path_index)))
+            model_name = next(iter(path_index))
+        self.index = path_index[model_name]
+        self.field_index = fields[model_name] if fields is not None else None
+        self.model_name = model_name
+        self.app_label = app_label
+        self.batch_size = batch_size
+        self.using = using
+        self.allocate_pk = allocate_pk or PkAllocator(using)
+        self.must_reset_sequences = reset_sequences
+        self.models = {}
+        self.ranks = {}
+        self.pk_models = set()
+        self.pending = defaultdict(list)
+        self.pending_links = defaultdict(list)
+        self.n_pending = 0
+        self.counts = defaultdict(int)
+
+    def get_model(self, model_name):
+        try:
+            return self.models[model_name]
+        except KeyError:
+            model = self.models[model_name] = \
+                apps.get_model(self.app_label, model_name)
+            return model
+
+    def assign_pk(self, record):
+        model = self.get_model(record.model)
+        root = (model._meta.get_parent_list() or [model])[-1]
+        if not isinstance(root._meta.pk, models.AutoField):
+            # Natural primary key, known when the record is complete
+            return
+        self.pk_models.add(root)
+        record.pk = self.allocate_pk(root)
+
+    def open(self, key, entry, parent):
+        model_name, column, kind = entry
+        record = Record(model_name, key, parent, column, kind)
+        self.assign_pk(record)
+        return record
+
+    def close(self, record):
+        if record.pk is None:
+            model = self.get_model(record.model)
+            record.pk = record.values.get(model._meta.pk.attname)
+        if record.kind == 'foreign_key':
+            model = self.get_model(record.parent.model)
+            record.parent.values[model._meta.get_field(record.column).attname] \
+                = record.pk
+        elif record.kind == 'many_to_many':
+            self.pending_links[(record.parent.model, record.column)] \
+                .append((record.parent, record))
+        self.pending[record.model].append(record)
+        self.n_pending += 1
+        if self.n_pending >= self.batch_size:
+            self.flush()
+
+    def set_value(self, record, key, text):
+        entry = self.index.get(key)
+        if entry is None:
+            # An item of an array field?
+            entry = self.index.get(key.rpartition('.')[0])
+            if entry is None or not entry[2].endswith('[]'):
+                self.counts['unmapped'] += 1
+                return
+        model_name, column, kind = entry
+        if kind in SKIPPED_KINDS or kind in RELATION_KINDS:
+            return
+        array = kind.endswith('[]')
+        kind = kind.rstrip('[]')
+        if kind != 'str':
+            text = text.strip()
+        if column == 'attrs':
+            record.values.setdefault('attrs', {})[
+                key[len(record.key) + 1:] if record.key else key] = text
+            return
+        value = CONVERTERS[kind](text)
+        if array:
+            record.values.setdefault(column, []).append(value)
+        else:
+            record.values[column] = value
+
+    def get_instance(self, record):
+        model = self.get_model(record.model)
+        values = record.values
+        if record.kind in ('one_to_many', 'one_to_one'):
+            values[model._meta.get_field(record.column).attname] = \
+                record.parent.pk
+        instance = model(**values)
+        if record.pk is not None:
+            instance.pk = record.pk
+            for parent in model._meta.get_parent_list():
+                setattr(instance, parent._meta.pk.attname, record.pk)
+        return instance
+
+    def get_rank(self, model):
+        # Parent and referenced models come before the models referring
+        # to them
+        try:
+            return self.ranks[model]
+        except KeyError:
+            pass
+        self.ranks[model] = 0
+        rank = self.ranks[model] = 1 + max(
+            [self.get_rank(f.related_model)
+             for f in model._meta.concrete_fields
+             if f.is_relation and f.related_model is not model] or [-1])
+        return rank
+
+    def is_ready(self, record):
+        return record.pk is not None and (
+            record.kind not in ('one_to_many', 'one_to_one') or
+            record.parent.pk is not None
+        )
+
+    def insert(self, model, instances):
+        bulk_insert(model, instances, self.batch_size, self.using)
+
+    def flush(self):
+        pending = self.pending
+        self.pending = defaultdict(list)
+        self.n_pending = 0
+        for model_name, records in sorted(
+                pending.items(),
+                key=lambda item: self.get_rank(self.get_model(item[0]))):
+            ready = []
+            for record in records:
+                if self.is_ready(record):
+                    ready.append(record)
+                else:
+                    # Its parent's natural primary key is not known yet
+                    self.pending[model_name].append(record)
+                    self.n_pending += 1
+            if ready:
+                self.insert(self.get_model(model_name),
+                            [self.get_instance(r) for r in ready])
+                self.counts[model_name] += len(ready)
+
+        pending_links = self.pending_links
+        self.pending_links = defaultdict(list)
+        for (model_name, column), links in pending_links.items():
+            field = self.get_model(model_name)._meta.get_field(column)
+            through = field.remote_field.through
+            from_name = '%s_id' % field.m2m_field_name()
+            to_name = '%s_id' % field.m2m_reverse_field_name()
+            ready = [(parent, child) for parent, child in links
+                     if parent.pk is not None]
+            self.pending_links[(model_name, column)].extend(
+                (parent, child) for parent, child in links
+                if parent.pk is None)
+            if ready:
+                self.insert(through, [through(**{from_name: parent.pk,
+                                                 to_name: child.pk})
+                                      for parent, child in ready])
+
+    def reset_sequences(self):
+        reset_sequences(self.pk_models, self.using)
+
+    def get_parser(self):
+        return ET.XMLParser(target=Router(self))
+
+    def feed(self, parser, f):
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            parser.feed(chunk)
+        parser.close()
+
+    def route(self, source):
+        parser = self.get_parser()
+        f = open(source, 'rb') if isinstance(source, (str, os.PathLike)) \
+            else source
+        try:
+            self.feed(parser, f)
+        finally:
+            if f is not source:
+                f.close()
+
+    def convert(self, source):
+        # Records are detached from the tree once converted, and so are the
+        # elements no converter reads once they end (unless the converters
+        # were generated without FIELDS)
+        if self.field_index is not None:
+            index = dict(self.field_index, **self.index)
+            live = get_live_paths(index)
+            arrays = {key for key, entry in index.items()
+                      if entry[2].endswith('[]')}
+        else:
+            live = None
+        keys = []
+        elements = []
+        records = []
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                # Generated converters look elements up by local names
+                tag = element.tag
+                if tag[0] == '{':
+                    tag = element.tag = local_name(tag)
+                for name in [name for name in element.attrib
+                             if name[0] == '{']:
+                    element.attrib[local_name(name)] = \
+                        element.attrib.pop(name)
+                if not elements:
+                    key = ''
+                    records.append(self.open(key, (self.model_name, None,
+                                                   None), None))
+                else:
+                    key = '%s.%s' % (keys[-1], tag) if keys[-1] else tag
+                    entry = self.index.get(key)
+                    if entry is not None:
+                        records.append(self.open(key, entry, records[-1]))
+                keys.append(key)
+                elements.append(element)
+                continue
+
+            key = keys.pop()
+            elements.pop()
+            record = records[-1]
+            if record.key == key:
+                values = self.converters[record.model](element)
+                values.update(record.values)
+                record.values = values
+                self.close(records.pop())
+                if elements:
+                    # The subtree of a record is not needed anymore
+                    elements[-1].remove(element)
+            elif live is not None and key not in live and \
+                    keys[-1] not in arrays:
+                elements[-1].remove(element)
+                if keys[-1] in live:
+                    self.counts['skipped'] += 1
+
+    def parse(self, source):
+        if self.converters is None:
+            self.route(source)
+        else:
+            self.convert(source)
+
+    def load(self, source):
+        with transaction.atomic(using=self.using):
+            self.parse(source)
+            self.flush()
+            if self.must_reset_sequences:
+                self.reset_sequences()
+        return dict(self.counts)
+
+
+def read_start_tag(f, offset):
+    f.seek(offset)
+    tag = bytearray()
+    quote = None
+    while True:
+        c = f.read(1)
+        if not c:
+            raise ValueError("unterminated start tag at %d" % offset)
+        tag += c
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in b'"\'':
+            quote = c
+        elif c == b'>':
+            return bytes(tag)
+
+
+class OffsetParser:
+    # Drives a parser target with expat, which tells the byte offset of the
+    # current event
+
+    def __init__(self, target):
+        self.target = target
+        self.parser = expat.ParserCreate(namespace_separator='}')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = target.start
+        self.parser.EndElementHandler = target.end
+        self.parser.CharacterDataHandler = target.data
+
+    @property
+    def offset(self):
+        return self.parser.CurrentByteIndex
+
+    def feed(self, data):
+        self.parser.Parse(data, False)
+
+    def close(self):
+        self.parser.Parse(b'', True)
+        self.target.close()
+
+
+class ResumableRouter(Router):
+    # Also keeps the byte offsets of the open elements, and tells the loader
+    # about every top-level element and every record right under the root
+    # record, where a load may be resumed
+
+    def __init__(self, loader):
+        super().__init__(loader)
+        self.parser = None
+        self.base = 0
+        self.offsets = []
+
+    def start(self, tag, attrib):
+        offset = self.base + self.parser.offset
+        if not self.skipped and self.keys and len(self.records) == 1:
+            parent = self.keys[-1]
+            key = '%s.%s' % (parent, local_name(tag)) if parent \
+                else local_name(tag)
+            entry = self.index.get(key)
+            if len(self.keys) == 1 or (entry is not None and
+                                       entry[2] in RELATION_KINDS):
+                self.loader.boundary(offset, self.offsets[1:])
+        depth = len(self.keys)
+        super().start(tag, attrib)
+        if len(self.keys) > depth:
+            self.offsets.append(offset)
+
+    def end(self, tag):
+        depth = len(self.keys)
+        super().end(tag)
+        if len(self.keys) < depth:
+            self.offsets.pop()
+
+
+class ResumableLoader(Loader):
+    # Commits every checkpoint_every records right under the root record (or
+    # top-level elements), and records in checkpoint_file where to resume an
+    # interrupted load from
+
+    def __init__(self, mapping, app_label, checkpoint_file, model_name=None,
+                 checkpoint_every=1000, **kwargs):
+        super().__init__(mapping, app_label, model_name, **kwargs)
+        if self.converters is not None:
+            raise ValueError("checkpoints are only supported with the"
+                             " mapping")
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_every = checkpoint_every
+        self.state = None
+        self.router = None
+        self.atomic = None
+        self.root = None
+        self.root_saved = False
+        self.resuming = False
+        self.last = None
+        self.since = 0
+
+    def read_checkpoint(self):
+        # A checkpoint is written before its transaction is committed and
+        # renamed afterwards, so a left over one is only valid if its last
+        # record made it to the database
+        pending_file = self.checkpoint_file + '.tmp'
+        if os.path.exists(pending_file):
+            with open(pending_file, encoding='utf-8') as f:
+                state = json.load(f)
+            label, pk = state['last']
+            if apps.get_model(label)._base_manager.using(self.using) \
+                    .filter(pk=pk).exists():
+                os.replace(pending_file, self.checkpoint_file)
+            else:
+                os.remove(pending_file)
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_checkpoint(self):
+        pending_file = self.checkpoint_file + '.tmp'
+        with open(pending_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        self.commit()
+        os.replace(pending_file, self.checkpoint_file)
+        self.atomic = transaction.atomic(using=self.using)
+        self.atomic.__enter__()
+
+    def commit(self):
+        # Forgotten before it is exited, so that a failing commit is not
+        # exited once more by load
+        atomic = self.atomic
+        self.atomic = None
+        atomic.__exit__(None, None, None)
+
+    def open(self, key, entry, parent):
+        if parent is None and self.state['offset']:
+            record = Record(self.model_name, key)
+            record.pk = self.state['root']
+            self.root_saved = True
+        else:
+            record = super().open(key, entry, parent)
+        if parent is None:
+            self.root = record
+        return record
+
+    def close(self, record):
+        if record is not self.root or not self.root_saved:
+            super().close(record)
+            return
+        self.update_root()
+
+    def update_root(self):
+        # Saved at the first checkpoint, update it with what came later
+        record = self.root
+        model = self.get_model(record.model)
+        instance = self.get_instance(record)
+        model._base_manager.using(self.using).filter(pk=record.pk).update(
+            **{f.attname: getattr(instance, f.attname)
+               for f in model._meta.concrete_fields
+               if f.name in record.values or f.attname in record.values})
+
+    def insert(self, model, instances):
+        super().insert(model, instances)
+        if instances[-1].pk is not None:
+            self.last = [model._meta.label, instances[-1].pk]
+
+    def checkpoint(self, offset, ancestors):
+        self.flush()
+        if self.n_pending or any(self.pending_links.values()) or \
+                self.root.pk is None:
+            # Records still wait for the natural primary key of a parent
+            return
+        if self.root_saved:
+            self.update_root()
+        else:
+            try:
+                with transaction.atomic(using=self.using):
+                    self.insert(self.get_model(self.root.model),
+                                [self.get_instance(self.root)])
+            except IntegrityError:
+                # Required fields of the root record are further down
+                return
+            self.counts[self.root.model] += 1
+            self.root_saved = True
+        self.since = 0
+        self.state.update(offset=offset, ancestors=ancestors,
+                          root=self.root.pk, last=self.last,
+                          counts=dict(self.counts))
+        self.write_checkpoint()
+
+    def boundary(self, offset, ancestors):
+        if self.resuming:
+            return
+        if self.state['head'] is None:
+            self.state['head'] = offset
+        if self.since >= self.checkpoint_every:
+            self.checkpoint(offset, ancestors)
+        self.since += 1
+        self.state['index'] += 1
+
+    def get_parser(self):
+        self.router = ResumableRouter(self)
+        self.router.parser = OffsetParser(self.router)
+        return self.router.parser
+
+    def feed(self, parser, f):
+        state = self.state
+        if state['offset']:
+            # The head of the document up to its first top-level element and
+            # the start tags of the elements open at the checkpoint, then the
+            # rest of the document after it
+            self.resuming = True
+            parser.feed(f.read(state['head']))
+            fed = state['head']
+            for offset in state['ancestors']:
+                tag = read_start_tag(f, offset)
+                parser.feed(tag)
+                fed += len(tag)
+            self.resuming = False
+            self.router.offsets[1:] = state['ancestors']
+            self.router.base = state['offset'] - fed
+            f.seek(state['offset'])
+        super().feed(parser, f)
+
+    def load(self, source):
+        source = os.path.abspath(source)
+        state = self.read_checkpoint()
+        if state is None:
+            state = {'source': source, 'head': None, 'offset': 0,
+                     'ancestors': [], 'index': 0}
+        elif state['source'] != source:
+            raise ValueError("the checkpoint is for %s" % state['source'])
+        self.state = state
+        self.counts.update(state.get('counts', {}))
+        self.atomic = transaction.atomic(using=self.using)
+        self.atomic.__enter__()
+        try:
+            self.route(source)
+            self.flush()
+            if self.must_reset_sequences:
+                self.reset_sequences()
+        except BaseException:
+            if self.atomic is not None:
+                atomic = self.atomic
+                self.atomic = None
+                atomic.__exit__(*sys.exc_info())
+            raise
+        self.commit()
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+        return dict(self.counts)
+
+
+def load(source, mapping, app_label, model_name=None, **kwargs):
+    return Loader(mapping, app_label, model_name, **kwargs).load(source)
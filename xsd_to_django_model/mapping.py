@@ -0,0 +1,70 @@
+"""
+Loading of the mapping files written by xsd_to_django_model.
+
+A mapping is either a single file (JSON, pickle or marshal, told apart by
+the file extension), or a directory written with --mapping-shards, which
+holds one file per model plus an index, and is loaded lazily.
+"""
+
+
+from collections.abc import Mapping
+import json
+import marshal
+import os
+import pickle
+
+
+MAPPING_INDEX = '_index'
+PATH_INDEX = '_path_index'
+
+# The kinds of path index entries which lead to another model
+RELATION_KINDS = ('one_to_many', 'one_to_one', 'foreign_key', 'many_to_many')
+
+LOADERS = {
+    '.json': ('r', json.load),
+    '.pickle': ('rb', pickle.load),
+    '.marshal': ('rb', marshal.load),
+}
+
+
+def load_file(filename):
+    ext = os.path.splitext(filename)[1]
+    mode, load = LOADERS.get(ext, LOADERS['.json'])
+    with open(filename, mode, **({} if 'b' in mode else
+                                 {'encoding': 'utf-8'})) as f:
+        return load(f)
+
+
+def load_mapping(path):
+    if os.path.isdir(path):
+        return ShardedMapping(path)
+    return load_file(path)
+
+
+class ShardedMapping(Mapping):
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.cache = {}
+        for ext in LOADERS:
+            filename = os.path.join(dirname, MAPPING_INDEX + ext)
+            if os.path.exists(filename):
+                self.index = load_file(filename)
+                break
+        else:
+            raise IOError("no mapping index found in %s" % dirname)
+
+    def __getitem__(self, key):
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        value = load_file(os.path.join(self.dirname, self.index[key]))
+        self.cache[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
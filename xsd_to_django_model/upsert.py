@@ -0,0 +1,241 @@
+"""
+Insert-or-update of records identified by the match_fields or number_field
+of the mapping written by xsd_to_django_model.
+
+Instead of looking every incoming record up with its own query, the keys
+of the existing rows of a model are kept in a hash index, which is either
+preloaded at once or filled lazily with a single query per batch. Incoming
+records are told apart as inserts or updates in memory and saved with
+bulk_create and bulk_update. With max_keys, an index growing larger than
+that is spilled to a temporary SQLite file, so that memory use stays
+bounded for very large tables.
+"""
+
+
+from collections import defaultdict
+from functools import reduce
+from itertools import chain
+import operator
+import sqlite3
+
+from django.apps import apps
+from django.db import models, transaction, DEFAULT_DB_ALIAS
+
+from .loader import PkAllocator, bulk_insert, reset_sequences
+from .mapping import load_mapping
+
+
+QUERY_CHUNK_SIZE = 500
+
+
+def get_key_fields(model_mapping):
+    if model_mapping.get('match_fields'):
+        return model_mapping['match_fields']
+    if model_mapping.get('number_field'):
+        return [model_mapping['number_field']]
+    return None
+
+
+class MemoryKeys(dict):
+
+    def get_many(self, keys):
+        return {key: self[key] for key in keys if key in self}
+
+
+class SpilledKeys:
+    # Keys kept in a temporary SQLite database on disk
+
+    def __init__(self, items=()):
+        self.db = sqlite3.connect('')
+        self.db.execute('CREATE TABLE keys (key TEXT PRIMARY KEY, pk)')
+        self.update(items)
+
+    def update(self, items):
+        self.db.executemany('INSERT OR REPLACE INTO keys VALUES (?, ?)',
+                            ((repr(key), pk) for key, pk in items))
+
+    def __setitem__(self, key, pk):
+        self.update([(key, pk)])
+
+    def get_many(self, keys):
+        reprs = {repr(key): key for key in keys}
+        found = {}
+        chunk = list(reprs)
+        for i in range(0, len(chunk), QUERY_CHUNK_SIZE):
+            part = chunk[i:i + QUERY_CHUNK_SIZE]
+            for key, pk in self.db.execute(
+                    'SELECT key, pk FROM keys WHERE key IN (%s)'
+                    % ', '.join('?' * len(part)), part):
+                found[reprs[key]] = pk
+        return found
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM keys').fetchone()[0]
+
+
+class KeyIndex:
+    # Primary keys of the rows of a model by the values of its key fields
+
+    def __init__(self, model, key_fields, using=DEFAULT_DB_ALIAS,
+                 preload=True, max_keys=None):
+        self.model = model
+        self.fields = [model._meta.get_field(name) for name in key_fields]
+        self.attnames = [f.attname for f in self.fields]
+        self.using = using
+        self.max_keys = max_keys
+        self.keys = MemoryKeys()
+        self.complete = preload
+        if preload:
+            self.update(
+                (tuple(row[:-1]), row[-1]) for row in
+                model._base_manager.using(using)
+                .values_list(*(self.attnames + ['pk']))
+                .iterator(chunk_size=10000))
+
+    def get_key(self, values):
+        # Converted like the stored values, so that the text '5' finds 5
+        key = []
+        for f in self.fields:
+            value = values.get(f.attname, values.get(f.name))
+            key.append(None if value is None else f.to_python(value))
+        return tuple(key)
+
+    def update(self, items):
+        items = iter(items)
+        if not isinstance(self.keys, MemoryKeys):
+            self.keys.update(items)
+            return
+        for key, pk in items:
+            self.keys[key] = pk
+            if self.max_keys and len(self.keys) > self.max_keys:
+                self.keys = SpilledKeys(self.keys.items())
+                self.update(items)
+                return
+
+    def fetch(self, keys):
+        # Pages the given keys in from the database
+        manager = self.model._base_manager.using(self.using)
+        for i in range(0, len(keys), QUERY_CHUNK_SIZE):
+            part = keys[i:i + QUERY_CHUNK_SIZE]
+            if len(self.fields) == 1:
+                condition = models.Q(**{'%s__in' % self.attnames[0]:
+                                        [key[0] for key in part]})
+            else:
+                condition = reduce(operator.or_,
+                                   (models.Q(**dict(zip(self.attnames, key)))
+                                    for key in part))
+            self.update(
+                (tuple(row[:-1]), row[-1]) for row in
+                manager.filter(condition)
+                .values_list(*(self.attnames + ['pk'])))
+
+    def lookup(self, keys):
+        found = self.keys.get_many(keys)
+        if not self.complete:
+            missing = [key for key in keys if key not in found]
+            if missing:
+                self.fetch(missing)
+                found.update(self.keys.get_many(missing))
+        return found
+
+
+class Upserter:
+
+    def __init__(self, mapping, app_label, batch_size=1000,
+                 using=DEFAULT_DB_ALIAS, preload=True, max_keys=None):
+        if isinstance(mapping, str):
+            mapping = load_mapping(mapping)
+        self.mapping = mapping
+        self.app_label = app_label
+        self.batch_size = batch_size
+        self.using = using
+        self.preload = preload
+        self.max_keys = max_keys
+        self.allocate_pk = PkAllocator(using)
+        self.indexes = {}
+        self.pending = defaultdict(dict)
+        self.unkeyed = defaultdict(list)
+        self.counts = defaultdict(lambda: defaultdict(int))
+
+    def get_index(self, model_name):
+        try:
+            return self.indexes[model_name]
+        except KeyError:
+            pass
+        key_fields = get_key_fields(self.mapping[model_name])
+        if not key_fields:
+            raise ValueError("%s has neither match_fields nor number_field"
+                             % model_name)
+        index = self.indexes[model_name] = KeyIndex(
+            apps.get_model(self.app_label, model_name), key_fields,
+            self.using, self.preload, self.max_keys)
+        return index
+
+    def add(self, model_name, values):
+        index = self.get_index(model_name)
+        pending = self.pending[model_name]
+        key = index.get_key(values)
+        if all(value is None for value in key):
+            # Nothing to identify it by, it is always inserted
+            self.unkeyed[model_name].append(dict(values))
+        elif key in pending:
+            # The same record again in this batch, the last values win
+            pending[key].update(values)
+        else:
+            pending[key] = dict(values)
+        if len(pending) + len(self.unkeyed[model_name]) >= self.batch_size:
+            self.flush_model(model_name)
+
+    def flush_model(self, model_name):
+        pending = self.pending.pop(model_name, None) or {}
+        unkeyed = self.unkeyed.pop(model_name, None) or []
+        if not pending and not unkeyed:
+            return
+        index = self.indexes[model_name]
+        model = index.model
+        root = (model._meta.get_parent_list() or [model])[-1]
+        allocate = isinstance(root._meta.pk, models.AutoField)
+        found = index.lookup(list(pending))
+        created = []
+        created_keys = []
+        # Updated rows by the fields they carry, so that a row never gets
+        # the defaults of the fields only other rows of the batch carry
+        updated = defaultdict(list)
+        for key, values in chain(pending.items(),
+                                 ((None, values) for values in unkeyed)):
+            instance = model(**values)
+            pk = None if key is None else found.get(key)
+            if pk is None:
+                if allocate:
+                    instance.pk = self.allocate_pk(root)
+                    for parent in model._meta.get_parent_list():
+                        setattr(instance, parent._meta.pk.attname,
+                                instance.pk)
+                created.append(instance)
+                created_keys.append(key)
+            else:
+                instance.pk = pk
+                updated[tuple(
+                    f.name for f in model._meta.concrete_fields
+                    if (f.name in values or f.attname in values) and
+                    not f.primary_key)].append(instance)
+        with transaction.atomic(using=self.using):
+            if created:
+                bulk_insert(model, created, self.batch_size, self.using)
+            for fields, instances in updated.items():
+                if fields:
+                    model._base_manager.using(self.using).bulk_update(
+                        instances, fields, batch_size=self.batch_size)
+        index.update((key, instance.pk)
+                     for key, instance in zip(created_keys, created)
+                     if key is not None)
+        self.counts[model_name]['created'] += len(created)
+        self.counts[model_name]['updated'] += sum(
+            len(instances) for instances in updated.values())
+
+    def flush(self):
+        for model_name in list(self.pending) + list(self.unkeyed):
+            self.flush_model(model_name)
+        reset_sequences(self.allocate_pk.next_pks, self.using)
+        return {model_name: dict(counts)
+                for model_name, counts in self.counts.items()}
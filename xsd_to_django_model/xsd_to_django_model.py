@@ -5,16 +5,81 @@ xsd_to_django_model
 Generate Django models from an XSD schema description (and a bunch of hints).
 
 Usage:
-    xsd_to_django_model.py [-m <models_filename>] [-f <fields_filename>]
-                           [-j <mapping_filename>] <xsd_filename> <xsd_type>...
+    xsd_to_django_model.py [-m <models_filename>] [-p <models_package>]
+                           [-g <grouping>] [-f <fields_filename>]
+                           [-j <mapping_filename>] [-J <mapping_format>]
+                           [--mapping-shards] [--path-index]
+                           [-M <migration_filename>] [-a <app_label>]
+                           [-l <loaders_filename>] [--graph <graph_filename>]
+                           [--share-anonymous] [--release-schema] [-k]
+                           [-s <settings_filename>]
+                           [--settings-cache <cache_dir>]
+                           [--profile <profile_filename>]
+                           [--memory <memory_filename>]
+                           [-q | --events <events_filename>]
+                           <xsd_filename> <xsd_type>...
     xsd_to_django_model.py -h | --help
 
 Options:
     -h --help              Show this screen.
     -m <models_filename>   Output models filename [default: models.py].
+    -p <models_package>    Output models package directory with a module per
+                           group of models, instead of a single models file.
+    -g <grouping>          Group models in the package by `namespace`,
+                           `settings` (see settings.MODEL_GROUPS) or `scc` (strongly
+                           connected components of the dependency graph)
+                           [default: namespace].
     -f <fields_filename>   Output fields filename to generate custom fields.
     -j <mapping_filename>  Output JSON mapping filename
                            [default: mapping.json].
+    -J <mapping_format>    Output mapping format: `indented` JSON, `compact`
+                           JSON, `pickle` or `marshal` [default: indented].
+    --mapping-shards       Write the mapping to <mapping_filename> directory,
+                           one file per model plus an index file.
+    --path-index           Add an index from document paths to (model,
+                           column, kind) to the mapping.
+    -M <migration_filename>
+                           Output initial migration filename, to create the
+                           models without running makemigrations.
+    -a <app_label>         Django app label for the migration, defaults to
+                           the name of the directory with the models.
+    -l <loaders_filename>  Output loaders filename with a generated XML
+                           converter function per model, for the loader.
+    --graph <graph_filename>
+                           Output the dependency graph of the models: as
+                           DOT if <graph_filename> ends with `.dot`, as JSON
+                           with the order the models are written in, the
+                           edges and the cycles otherwise.
+    -s <settings_filename> Settings file to use instead of importing
+                           xsd_to_django_model_settings.
+    --settings-cache <cache_dir>
+                           Directory to cache the validated settings of
+                           <settings_filename> in, by the hash of the file.
+    --share-anonymous      Make anonymous complex types with the same
+                           structure into a single model, merging them as if
+                           they were mapped with `+` in TYPE_MODEL_MAP.
+    -k --keep-going        Do not stop at a type which fails to generate:
+                           report the error, write an empty model for the
+                           type and go on with the rest. The exit status is 1
+                           if any type failed.
+    --release-schema       Drop the parsed schema once the models are made,
+                           to lower the peak memory of merging and writing.
+    --profile <profile_filename>
+                           Write timings of every phase and of every
+                           make_model call, regular expression, memo and
+                           merge counters as JSON to <profile_filename>, or
+                           as a report to stderr if it is `-`.
+    --memory <memory_filename>
+                           Trace memory allocations, and write the top
+                           allocating sites, object counts by type and the
+                           retained size of the schema, the models and the
+                           caches after every phase as JSON to
+                           <memory_filename>, or as a report to stderr if it
+                           is `-`. Tracing slows generation down.
+    -q --quiet             Do not report progress, only warnings and errors.
+    --events <events_filename>
+                           Write progress and warnings as JSON lines to
+                           <events_filename>, or to stdout if it is `-`.
     <xsd_filename>         Input XSD schema filename.
     <xsd_type>             XSD type (or an XPath query for XSD type) for which
                            a Django model should be generated.
@@ -24,72 +89,44 @@ current directory, it will be imported.
 """
 
 
+import ast
 import codecs
+from collections import defaultdict
+from contextlib import contextmanager, ExitStack
 from copy import deepcopy
 import datetime
-import decimal
 from functools import partial, wraps
+import gc
 from itertools import chain, groupby
 import json
+import io
 import logging
 from operator import itemgetter
-import pickle
+import os
 import re
 import sys
 import textwrap
+import time
+import traceback
+from types import BuiltinFunctionType, FunctionType, ModuleType
 
-from docopt import docopt
-import ndifflib
-import xmlschema
 try:
-    from xmlschema.utils.qnames import get_prefixed_qname
+    from .mapping import (LOADERS as MAPPING_LOADERS, MAPPING_INDEX,
+                          PATH_INDEX, RELATION_KINDS, load_file)
 except ImportError:
-    from xmlschema.helpers import get_prefixed_qname
+    # Run as a script, with this directory first in sys.path
+    from mapping import (LOADERS as MAPPING_LOADERS, MAPPING_INDEX,
+                         PATH_INDEX, RELATION_KINDS, load_file)
 
 try:
-    from xsd_to_django_model_settings import TYPE_MODEL_MAP
+    import xsd_to_django_model_settings as settings_module
 except ImportError:
-    TYPE_MODEL_MAP = {}
-try:
-    from xsd_to_django_model_settings import MODEL_OPTIONS
-except ImportError:
-    MODEL_OPTIONS = {}
-try:
-    from xsd_to_django_model_settings import GLOBAL_MODEL_OPTIONS
-except ImportError:
-    GLOBAL_MODEL_OPTIONS = {}
-try:
-    from xsd_to_django_model_settings import TYPE_OVERRIDES
-except ImportError:
-    TYPE_OVERRIDES = {}
-try:
-    from xsd_to_django_model_settings import BASETYPE_OVERRIDES
-except ImportError:
-    BASETYPE_OVERRIDES = {}
-try:
-    from xsd_to_django_model_settings import IMPORTS
-except ImportError:
-    IMPORTS = ''
-try:
-    from xsd_to_django_model_settings import DOC_PREPROCESSOR
-except ImportError:
-    DOC_PREPROCESSOR = ''
-try:
-    from xsd_to_django_model_settings import JSON_DOC_HEADING
-except ImportError:
-    JSON_DOC_HEADING = "JSON attributes:\n"
-try:
-    from xsd_to_django_model_settings import JSON_GROUP_HEADING
-except ImportError:
-    JSON_GROUP_HEADING = "*   JSON attribute group \u2013 "
-try:
-    from xsd_to_django_model_settings import JSON_DOC_INDENT
-except ImportError:
-    JSON_DOC_INDENT = " " * 4
-try:
-    from xsd_to_django_model_settings import MAX_LINE_LENGTH
-except ImportError:
-    MAX_LINE_LENGTH = 80
+    settings_module = None
+
+# xmlschema takes longer to import than everything else together, so it is
+# imported only once a schema is loaded (see import_xmlschema)
+xmlschema = None
+get_prefixed_qname = None
 
 
 BASETYPE_FIELD_MAP = {
@@ -112,13 +149,31 @@ BASETYPE_FIELD_MAP = {
     'xs:short': 'SmallIntegerField',
     'xs:string': 'CharField',
     'xs:token': 'CharField',
+    'xs:unsignedByte': 'IntegerField',
     'xs:unsignedInt': 'BigIntegerField',
+    'xs:unsignedShort': 'IntegerField',
 }
 
-BASETYPE_FIELD_MAP.update(BASETYPE_OVERRIDES)
+# Used instead with GLOBAL_MODEL_OPTIONS['narrow_integer_fields']
+NARROW_BASETYPE_FIELD_MAP = {
+    'xs:unsignedByte': 'PositiveSmallIntegerField',
+    'xs:unsignedShort': 'PositiveIntegerField',
+}
+
+# Narrowest first, see get_narrowest_integer_field()
+INTEGER_FIELD_RANGES = {
+    'PositiveSmallIntegerField': (0, 2 ** 15 - 1),
+    'SmallIntegerField': (-2 ** 15, 2 ** 15 - 1),
+    'PositiveIntegerField': (0, 2 ** 31 - 1),
+    'IntegerField': (-2 ** 31, 2 ** 31 - 1),
+    'BigIntegerField': (-2 ** 63, 2 ** 63 - 1),
+}
 
 NS = {'xs': "http://www.w3.org/2001/XMLSchema"}
 
+QNAME_ATTRIBUTES = ('type', 'base', 'ref', 'itemType', 'memberTypes',
+                    'substitutionGroup', 'refer')
+
 FIELD_TMPL = {
     '_coalesce':
         '{dotted_name} => {coalesce}',
@@ -145,11 +200,14 @@ HEADER = ('# THIS FILE IS GENERATED AUTOMATICALLY. DO NOT EDIT\n'
           '# -*- coding: utf-8 -*-\n\n'
           'from __future__ import unicode_literals\n\n')
 
+CONSTANT_OPTIONS = ('choices', 'validators')
+
 RE_SPACES = re.compile('([^\n])  +', re.U)
 RE_KWARG = re.compile(r'^[a-zi0-9_]+=')
 RE_CAMELCASE_TO_UNDERSCORE_1 = re.compile(r'(.)([A-Z][a-z]+)')
 RE_CAMELCASE_TO_UNDERSCORE_2 = re.compile(r'([a-z0-9])([A-Z])')
 RE_RELATED_FIELD = re.compile(r'^models\.(ForeignKey|ManyToManyField)$')
+RE_REFERENCE_FIELD = re.compile(r'^models\.(ForeignKey|OneToOneField|ManyToManyField)$')
 RE_RE_DECIMAL = re.compile(r'\\d\{(|(\d+),)(\d+)\}'
                            r'\(?\\\.\\d\{(|(\d+),)(\d+)\}(\)\?)?')
 RE_FIELD_CLASS_FILTER = re.compile(r'[^a-zA-Z0-9_]')
@@ -157,11 +215,339 @@ RE_MARKDOWN_LIST_ENTRY = re.compile(r"^([-+ *]|\d+[).]) ")
 
 MAX_OCCURS_UNBOUNDED = None
 
-logging.basicConfig(level=logging.INFO)
+
+def dump_pickle(data, f):
+    import pickle
+    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def dump_marshal(data, f):
+    import marshal
+    marshal.dump(data, f)
+
+
+MAPPING_FORMATS = {
+    'indented': ('.json', partial(json.dump, ensure_ascii=False, indent=4)),
+    'compact': ('.json', partial(json.dump, ensure_ascii=False,
+                                 separators=(',', ':'))),
+    'pickle': ('.pickle', dump_pickle),
+    'marshal': ('.marshal', dump_marshal),
+}
+BINARY_MAPPING_FORMATS = ('pickle', 'marshal')
+
+FIELD_KINDS = {
+    'models.BigIntegerField': 'int',
+    'models.BinaryField': 'binary',
+    'models.BooleanField': 'bool',
+    'models.DateField': 'date',
+    'models.DateTimeField': 'datetime',
+    'models.DecimalField': 'decimal',
+    'models.FloatField': 'float',
+    'models.IntegerField': 'int',
+    'models.JSONField': 'json',
+    'models.PositiveIntegerField': 'int',
+    'models.PositiveSmallIntegerField': 'int',
+    'models.SmallIntegerField': 'int',
+}
+
+# Python expressions coercing XML text to a value of the given kind,
+# see also parse_default()
+CONVERTER_CODE = {
+    'binary': 'base64.b64decode(%s)',
+    'bool': "%s.strip() in ('true', '1')",
+    'date': 'to_date(%s)',
+    'datetime': 'to_datetime(%s)',
+    'decimal': 'decimal.Decimal(%s)',
+    'float': 'float(%s)',
+    'int': 'int(%s)',
+    'json': '%s',
+    'str': '%s',
+}
+
 logger = logging.getLogger(__name__)
 
 
-depth = -1
+class Settings:
+    # The settings (see xsd_to_django_model_settings), validated once, with
+    # their regular expressions compiled once
+
+    DEFAULTS = {
+        'TYPE_MODEL_MAP': {},
+        'MODEL_OPTIONS': {},
+        'GLOBAL_MODEL_OPTIONS': {},
+        'TYPE_OVERRIDES': {},
+        'BASETYPE_OVERRIDES': {},
+        'IMPORTS': '',
+        'DOC_PREPROCESSOR': '',
+        'JSON_DOC_HEADING': "JSON attributes:\n",
+        'JSON_GROUP_HEADING': "*   JSON attribute group \u2013 ",
+        'JSON_DOC_INDENT': " " * 4,
+        'MAX_LINE_LENGTH': 80,
+        'MODEL_GROUPS': {},
+    }
+
+    def __init__(self, **kwargs):
+        unknown = set(kwargs) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError("unknown settings: %s"
+                             % ', '.join(sorted(unknown)))
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, kwargs.get(name, default))
+        if not isinstance(self.MAX_LINE_LENGTH, int):
+            raise ValueError("MAX_LINE_LENGTH is not an integer")
+        if self.DOC_PREPROCESSOR and not callable(self.DOC_PREPROCESSOR):
+            raise ValueError("DOC_PREPROCESSOR is not callable")
+        self.BASETYPE_FIELD_MAP = dict(BASETYPE_FIELD_MAP)
+        if self.GLOBAL_MODEL_OPTIONS.get('narrow_integer_fields'):
+            self.BASETYPE_FIELD_MAP.update(NARROW_BASETYPE_FIELD_MAP)
+        self.BASETYPE_FIELD_MAP.update(self.BASETYPE_OVERRIDES)
+        self.patterns = {}
+        self.type_model_map = [(self.compile(expr, 'TYPE_MODEL_MAP'), sub)
+                               for expr, sub in self.TYPE_MODEL_MAP.items()]
+        for expr in self.MODEL_GROUPS:
+            self.compile(expr, 'MODEL_GROUPS')
+        for model_name, options in self.MODEL_OPTIONS.items():
+            if not isinstance(options, dict):
+                raise ValueError("MODEL_OPTIONS[%r] is not a dict"
+                                 % model_name)
+            for expr in options.get('if_type', {}):
+                self.compile(expr, "MODEL_OPTIONS[%r]['if_type']"
+                             % model_name)
+
+    def compile(self, expr, setting='settings'):
+        # Patterns match whole names, in verbose mode
+        try:
+            return self.patterns[expr]
+        except KeyError:
+            pass
+        try:
+            pattern = self.patterns[expr] = re.compile(expr + '$', re.X)
+        except re.error as e:
+            raise ValueError("%s: invalid pattern %r: %s"
+                             % (setting, expr, e))
+        return pattern
+
+    @classmethod
+    def from_module(cls, module):
+        return cls(**{name: getattr(module, name) for name in cls.DEFAULTS
+                      if hasattr(module, name)})
+
+    @classmethod
+    def from_file(cls, filename, cache_dir=None):
+        # With cache_dir, the validated settings are pickled there under
+        # the hash of the settings file, unless they hold something which
+        # cannot be pickled (like a lambda DOC_PREPROCESSOR)
+        import hashlib
+        import pickle
+        with open(filename, 'rb') as f:
+            source = f.read()
+        cache_filename = cache_dir and os.path.join(
+            cache_dir, 'settings-%s.pickle' % hashlib.sha1(source).hexdigest())
+        if cache_filename:
+            try:
+                with open(cache_filename, 'rb') as f:
+                    return pickle.load(f)
+            except Exception:
+                pass
+        module = ModuleType('xsd_to_django_model_settings')
+        module.__file__ = filename
+        exec(compile(source, filename, 'exec'), module.__dict__)
+        self = cls.from_module(module)
+        if cache_filename:
+            try:
+                data = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                pass
+            else:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(cache_filename, 'wb') as f:
+                    f.write(data)
+        return self
+
+
+default_settings = Settings.from_module(settings_module)
+settings = default_settings
+automatic_model_names = set()
+shared_types = {}
+
+
+class Profiler:
+    # Timings and counters, collected only when profiler is set (--profile)
+
+    def __init__(self):
+        self.phases = {}
+        self.counts = defaultdict(int)
+        self.regex = defaultdict(lambda: [0, 0, 0])
+        self.memo = defaultdict(lambda: [0, 0])
+        self.types = {}
+        self.stack = []
+
+    @contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.phases[name] = {'wall': time.perf_counter() - wall,
+                                 'cpu': time.process_time() - cpu}
+
+    def count_regex(self, function, tries, hit):
+        counts = self.regex[function]
+        counts[0] += 1
+        counts[1] += tries
+        counts[2] += bool(hit)
+
+    def start_type(self):
+        self.stack.append([time.perf_counter(), 0.0])
+
+    def end_type(self, typename, model_name):
+        # Own time excludes the models made for the types referred to
+        start, children = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        if self.stack:
+            self.stack[-1][1] += elapsed
+        self.types[typename] = {'model': model_name, 'total': elapsed,
+                                'own': elapsed - children}
+
+    def get_report(self):
+        return {
+            'phases': self.phases,
+            'make_model': self.types,
+            'regex': {name: dict(zip(('calls', 'tries', 'hits'), counts))
+                      for name, counts in self.regex.items()},
+            'memo': {name: dict(zip(('hits', 'misses'), counts))
+                     for name, counts in self.memo.items()},
+            'counts': dict(self.counts),
+        }
+
+    def write_report(self, outfile, top=20):
+        outfile.write('Phases:\n')
+        for name, t in self.phases.items():
+            outfile.write('  %-24s %9.3fs wall %9.3fs cpu\n'
+                          % (name, t['wall'], t['cpu']))
+        outfile.write('make_model: %d types, top %d by own time:\n'
+                      % (len(self.types), top))
+        for typename, t in sorted(self.types.items(),
+                                  key=lambda item: -item[1]['own'])[:top]:
+            outfile.write('  %9.3fs own %9.3fs total  %s (%s)\n'
+                          % (t['own'], t['total'], typename, t['model']))
+        outfile.write('Regular expressions:\n')
+        for name, (calls, tries, hits) in sorted(self.regex.items()):
+            outfile.write('  %-24s %9d calls %9d tries %9d hits\n'
+                          % (name, calls, tries, hits))
+        outfile.write('Memoized functions:\n')
+        for name, (hits, misses) in sorted(self.memo.items()):
+            outfile.write('  %-24s %9d hits %9d misses %5.1f%%\n'
+                          % (name, hits, misses,
+                             100.0 * hits / ((hits + misses) or 1)))
+        outfile.write('Counters:\n')
+        for name, n in sorted(self.counts.items()):
+            outfile.write('  %-24s %9d\n' % (name, n))
+
+
+class MemoryProfiler:
+    # tracemalloc snapshots and object counts after every phase, collected
+    # with --memory
+
+    SHARED_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType)
+
+    def __init__(self, top=20):
+        self.top = top
+        self.phases = {}
+        self.builder = None
+        import tracemalloc
+        tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        import tracemalloc
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.measure()
+
+    def get_sizes(self, roots):
+        # Deep sizes of the roots; objects reachable from several of them
+        # are counted once, with the first one, and the builder itself is
+        # not followed
+        seen = {id(self.builder)}
+        sizes = {}
+        for name, root in roots:
+            size = 0
+            stack = [root]
+            while stack:
+                obj = stack.pop()
+                if id(obj) in seen or isinstance(obj, self.SHARED_TYPES):
+                    continue
+                seen.add(id(obj))
+                size += sys.getsizeof(obj)
+                stack.extend(gc.get_referents(obj))
+            sizes[name] = size
+        return sizes
+
+    def measure(self):
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+        objects = defaultdict(int)
+        for obj in gc.get_objects():
+            objects[type(obj).__name__] += 1
+        caches = {name: f.memo for name, f in globals().items()
+                  if isinstance(f, FunctionType) and hasattr(f, 'memo')}
+        return {
+            'current': current,
+            'peak': peak,
+            'top': [{'site': '%s:%d' % (stat.traceback[0].filename,
+                                        stat.traceback[0].lineno),
+                     'size': stat.size, 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.top]],
+            'objects': dict(sorted(objects.items(),
+                                   key=lambda item: -item[1])[:self.top]),
+            'retained': self.get_sizes([
+                ('schema', getattr(self.builder, 'schema', None)),
+                ('models', getattr(self.builder, 'models', None)),
+                ('caches', caches),
+            ]) if self.builder else {},
+        }
+
+    def get_report(self):
+        return self.phases
+
+    def write_report(self, outfile):
+        mb = 1024.0 * 1024
+        for name, m in self.phases.items():
+            outfile.write('Phase %s: %.1f MB traced, %.1f MB peak\n'
+                          % (name, m['current'] / mb, m['peak'] / mb))
+            if m['retained']:
+                outfile.write('  retained: %s\n' % ', '.join(
+                    '%s %.1f MB' % (key, size / mb)
+                    for key, size in m['retained'].items()))
+            outfile.write('  top sites:\n')
+            for stat in m['top']:
+                outfile.write('  %9.1f MB %9d blocks  %s\n'
+                              % (stat['size'] / mb, stat['count'],
+                                 stat['site']))
+            outfile.write('  objects:\n')
+            for type_name, n in m['objects'].items():
+                outfile.write('  %9d %s\n' % (n, type_name))
+
+
+profiler = None
+memory = None
+
+
+def import_xmlschema():
+    global xmlschema, get_prefixed_qname
+    if xmlschema is not None:
+        return
+    import xmlschema
+    try:
+        from xmlschema.utils.qnames import get_prefixed_qname
+    except ImportError:
+        from xmlschema.helpers import get_prefixed_qname
 
 
 def memoize(function):
@@ -170,12 +556,17 @@ def memoize(function):
     @wraps(function)
     def wrapper(*args):
         if args in memo:
+            if profiler:
+                profiler.memo[function.__name__][0] += 1
             return memo[args]
         else:
+            if profiler:
+                profiler.memo[function.__name__][1] += 1
             rv = function(*args)
             if rv:
                 memo[args] = rv
             return rv
+    wrapper.memo = memo
     return wrapper
 
 
@@ -183,8 +574,58 @@ def cat(seq):
     return tuple(chain.from_iterable(seq))
 
 
-def info(s):
-    sys.stderr.write('%s%s' % (' ' * depth, s))
+class EventWriter:
+    # Progress events and log records, written in batches: as indented
+    # text, as JSON lines, or quietly (only log records, as text)
+
+    def __init__(self, outfile=None, fmt='text', batch_size=100):
+        self.outfile = outfile or sys.stderr
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.lines = []
+        self.types = []
+
+    def emit(self, event, text, **data):
+        progress = event in ('type_start', 'type_end')
+        if event == 'type_end':
+            self.types.pop()
+        indent = ' ' * len(self.types) if progress else ''
+        if event == 'type_start':
+            self.types.append(data['type'])
+        elif self.types and not progress:
+            # Log records are attributed to the type being made
+            data.setdefault('type', self.types[-1])
+        if self.fmt == 'json':
+            self.lines.append(json.dumps(dict(data, event=event),
+                                         ensure_ascii=False) + '\n')
+        elif self.fmt == 'text' or not progress:
+            self.lines.append('%s%s\n' % (indent, text))
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.outfile.writelines(self.lines)
+        self.outfile.flush()
+        self.lines = []
+
+
+class EventHandler(logging.Handler):
+    # Passes log records on to an EventWriter, keeping them in order with
+    # the progress events
+
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record):
+        message = record.getMessage().rstrip()
+        self.writer.emit(record.levelname.lower(),
+                         '%s:%s:%s' % (record.levelname, record.name, message),
+                         code=getattr(record, 'code', None),
+                         logger=record.name, message=message)
+
+
+events = None
 
 
 def xfind(root, path, **kwargs):
@@ -192,14 +633,68 @@ def xfind(root, path, **kwargs):
     return root.findall(path, namespaces=NS, **kwargs)
 
 
+def activate_settings(new_settings, new_automatic_model_names,
+                      new_shared_types):
+    # The functions below read the settings of the builder at work; results
+    # memoized with other settings are dropped
+    global settings, automatic_model_names, shared_types
+    if new_automatic_model_names is not automatic_model_names or \
+            new_shared_types is not shared_types:
+        automatic_model_names = new_automatic_model_names
+        shared_types = new_shared_types
+        get_model_for_type.memo.clear()
+    if new_settings is settings:
+        return
+    settings = new_settings
+    for f in list(globals().values()):
+        if isinstance(f, FunctionType) and hasattr(f, 'memo'):
+            f.memo.clear()
+
+
 @memoize
 def get_model_for_type(name):
-    for expr, sub in TYPE_MODEL_MAP.items():
-        if re.match(expr + '$', name, flags=re.X):
-            return re.sub(expr + '$', sub, name, flags=re.X).replace('+', '')
+    if name in shared_types:
+        # An anonymous type made into the model of an identical one
+        return get_model_for_type(shared_types[name]) or \
+            (name if name in automatic_model_names else None)
+    for tries, (pattern, sub) in enumerate(settings.type_model_map, 1):
+        if pattern.match(name):
+            if profiler:
+                profiler.count_regex('get_model_for_type', tries, True)
+            return pattern.sub(sub, name).replace('+', '')
+    if profiler:
+        profiler.count_regex('get_model_for_type',
+                             len(settings.type_model_map), False)
+    if name in automatic_model_names:
+        return name
     return None
 
 
+def get_structure_key(ctype):
+    # Hash of the canonical form of an XSD complex type: annotations are left
+    # out and prefixed names are expanded, so that the same structure gets
+    # the same key wherever it is and whatever the prefixes are
+    import hashlib
+    namespaces = ctype.namespaces
+
+    def expand(qname):
+        prefix, _, local_name = qname.rpartition(':')
+        return '{%s}%s' % (namespaces.get(prefix, prefix), local_name)
+
+    def canonical(elem):
+        if not isinstance(elem.tag, str) or \
+                elem.tag == '{%s}annotation' % NS['xs']:
+            return None
+        attrs = tuple((key, ' '.join(map(expand, value.split()))
+                       if key in QNAME_ATTRIBUTES else value)
+                      for key, value in sorted(elem.attrib.items()))
+        return (elem.tag, attrs, (elem.text or '').strip(),
+                tuple(filter(None, map(canonical, elem))))
+
+    return hashlib.sha1(repr(canonical(ctype.elem)).encode('utf-8')) \
+        .hexdigest()
+
+
 def schema_get_type(schema, typename):
     ns, name = get_ns(typename), strip_ns(typename)
     return (schema.imports[schema.namespaces[ns]]
@@ -209,7 +704,11 @@ def schema_get_type(schema, typename):
 
 def get_a_type_for_model(name, schema):
     names = (name, '+%s' % name)
-    exprs = (expr for expr, sub in TYPE_MODEL_MAP.items()
+    # Dotted automatic model names used to be looked up escaped, so they
+    # are left out as well
+    exprs = (expr for expr, sub in chain(settings.TYPE_MODEL_MAP.items(),
+                                         ((n, n) for n in automatic_model_names
+                                          if '.' not in n))
              if ('(' not in expr and '\\' not in expr and sub in names))
     typename = None
     for expr in exprs:
@@ -222,19 +721,19 @@ def get_a_type_for_model(name, schema):
 
 @memoize
 def get_merge_for_type(name):
-    for expr, sub in TYPE_MODEL_MAP.items():
-        if re.match(expr + '$', name, flags=re.X):
+    for pattern, sub in settings.type_model_map:
+        if pattern.match(name):
             return sub.startswith('+')
     return False
 
 
 @memoize
 def get_opt(model_name, typename=None):
-    opt = MODEL_OPTIONS.get(model_name, {})
+    opt = settings.MODEL_OPTIONS.get(model_name, {})
     if not typename:
         return opt
     for opt2 in (o for pattern, o in opt.get('if_type', {}).items()
-                 if re.match(pattern + '$', typename, flags=re.X)):
+                 if settings.compile(pattern).match(typename)):
         opt = deepcopy(opt)
         for k, v in opt2.items():
             try:
@@ -284,8 +783,8 @@ def get_doc(el_def, name, model_name, doc_prefix=None, choices=None):
             for c in choices
             if not re.search(r"^%s(| - .*)$" % c[0], doc or "", re.M)
         )
-    if DOC_PREPROCESSOR:
-        doc = DOC_PREPROCESSOR(doc)
+    if settings.DOC_PREPROCESSOR:
+        doc = settings.DOC_PREPROCESSOR(doc)
     if doc_prefix:
         return doc_prefix + (doc or name)
     return doc or None
@@ -308,6 +807,7 @@ def mark_diff_n(seq, n):
 def makediff_n(sequences):
     if len(sequences) == 1:
         return sequences[0]
+    import ndifflib
     sm = ndifflib.SequenceMatcher(None, *sequences).get_opcodes()
     markup = []
     for opcode, begins, indices in sm:
@@ -342,7 +842,7 @@ def stringify(s, max_length=None):
 
 def multiline_comment(s, indent=4):
     prefix = " " * indent + "# "
-    return "\n".join(textwrap.wrap(s, width=MAX_LINE_LENGTH, break_long_words=False,
+    return "\n".join(textwrap.wrap(s, width=settings.MAX_LINE_LENGTH, break_long_words=False,
                                    initial_indent=prefix,
                                    subsequent_indent=prefix + " ")) + "\n"
 
@@ -371,28 +871,36 @@ def camelcase_to_underscore(name):
 
 
 def coalesce(name, model, option):
-    try:
-        expr, sub = next(
-            (expr, sub)
-            for expr, sub in chain(GLOBAL_MODEL_OPTIONS.get(option, {}).items(),
-                                   model.get(option, {}).items())
-            if re.match(expr + '$', name, flags=re.X)
-        )
-    except StopIteration:
-        return None
-    return re.sub(expr + '$', sub, name, flags=re.X)
+    tries = 0
+    for expr, sub in chain(settings.GLOBAL_MODEL_OPTIONS.get(option, {}).items(),
+                           model.get(option, {}).items()):
+        tries += 1
+        pattern = settings.compile(expr)
+        if pattern.match(name):
+            if profiler:
+                profiler.count_regex('coalesce', tries, True)
+            return pattern.sub(sub, name)
+    if profiler:
+        profiler.count_regex('coalesce', tries, False)
+    return None
 
 
 def match(name, model, kind):
+    tries = 0
     for expr in chain(model.get(kind, ()),
-                      GLOBAL_MODEL_OPTIONS.get(kind, ())):
+                      settings.GLOBAL_MODEL_OPTIONS.get(kind, ())):
         if not isinstance(expr, str):
             # Allow lists/tuples for index_together
             if kind in ('plain_index_fields',):
                 return False
             # Otherwise, fail
-        if re.match(expr + '$', name, flags=re.X):
+        tries += 1
+        if settings.compile(expr).match(name):
+            if profiler:
+                profiler.count_regex('match', tries, True)
             return True
+    if profiler:
+        profiler.count_regex('match', tries, False)
     return False
 
 
@@ -405,8 +913,8 @@ def parse_user_options(options):
 
 def override_field_options(field_name, options, model_options, field_type):
     this_field_add_options = {
-        **parse_user_options(GLOBAL_MODEL_OPTIONS.get('field_type_options', {}).get(field_type, {})),
-        **parse_user_options(GLOBAL_MODEL_OPTIONS.get('field_options', {}).get(field_name, {})),
+        **parse_user_options(settings.GLOBAL_MODEL_OPTIONS.get('field_type_options', {}).get(field_type, {})),
+        **parse_user_options(settings.GLOBAL_MODEL_OPTIONS.get('field_options', {}).get(field_name, {})),
         **parse_user_options(model_options.get('field_type_options', {}).get(field_type, {})),
         **parse_user_options(model_options.get('field_options', {}).get(field_name, {})),
     }
@@ -437,6 +945,7 @@ def parse_default(basetype, default):
     if basetype == "xs:double":
         return float(default)
     if basetype == "xs:decimal":
+        import decimal
         return decimal.Decimal(default)
     if basetype == "xs:gYearMonth":
         return datetime.datetime.strptime(default + "-01", "%Y-%m-%d").date()
@@ -447,12 +956,67 @@ def parse_default(basetype, default):
     if basetype == "xs:token":
         return ''.join(default.split())
     if basetype in ("xs:byte", "xs:int", "xs:integer",
-                    "xs:nonNegativeInteger", "xs:positiveInteger", "xs:short"):
+                    "xs:nonNegativeInteger", "xs:positiveInteger", "xs:short",
+                    "xs:unsignedByte", "xs:unsignedInt", "xs:unsignedShort"):
         return int(default)
     assert False, "parsing default value '%s' for %s type not implemented" \
         % (default, basetype)
 
 
+def get_narrowest_integer_field(parent, stype):
+    # The smallest integer field holding every value the facets of stype
+    # allow, within the range of the field chosen so far
+    low, high = INTEGER_FIELD_RANGES[parent]
+    facets = xmlschema.validators.facets
+    for v in stype.validators:
+        if isinstance(v, facets.XsdMinInclusiveFacet):
+            low = max(low, v.value)
+        elif isinstance(v, facets.XsdMinExclusiveFacet):
+            low = max(low, v.value + 1)
+        elif isinstance(v, facets.XsdMaxInclusiveFacet):
+            high = min(high, v.value)
+        elif isinstance(v, facets.XsdMaxExclusiveFacet):
+            high = min(high, v.value - 1)
+        elif isinstance(v, facets.XsdTotalDigitsFacet):
+            low = max(low, 1 - 10 ** v.value)
+            high = min(high, 10 ** v.value - 1)
+        elif isinstance(v, facets.XsdEnumerationFacets):
+            values = [int(e.get('value')) for e in v._elements]
+            low = max(low, min(values))
+            high = min(high, max(values))
+    return next(field for field, (field_low, field_high)
+                in INTEGER_FIELD_RANGES.items()
+                if field_low <= low and high <= field_high)
+
+
+def get_index_name(db_table, columns, suffix):
+    # Same as django.db.models.Index.set_name_with_model()
+    table_name = db_table.split('"."')[-1].strip('"')
+    column_names = [c.lstrip('-') for c in columns]
+    import hashlib
+    digest = hashlib.md5()
+    for arg in [table_name] + columns + [suffix]:
+        digest.update(arg.encode())
+    name = '%s_%s_%s_%s' % (table_name[:11], column_names[0][:7],
+                            digest.hexdigest()[:6], suffix)
+    if name[0] == '_' or name[0].isdigit():
+        name = 'D%s' % name[1:]
+    return name
+
+
+def get_final_field(django_field, options, wrapped):
+    if django_field == 'models.CharField' and \
+            (options.get('max_length') == 'None' or
+             int(options.get('max_length', 1000)) > 500):
+        django_field = 'models.TextField'
+    if (options.get('null') == "True" and
+            (wrapped or django_field == 'models.ManyToManyField')):
+        del options['null']
+    elif django_field == 'models.TextField' and 'max_length' in options:
+        del options['max_length']
+    return django_field
+
+
 def indent_multiline(doc, indent):
     return "\n{indent}{doc}\n".format(doc=doc.replace("\n", "\n" + indent),
                                       indent=indent)
@@ -484,12 +1048,12 @@ class Model:
         self.code = None
         self.deps = None
         self.match_fields = None
-        self.written = False
         self.doc = None
         self.number_field = None
         self.abstract = False
         self.have_validators = False
         self.mapping_extra = None
+        self.error = None
 
     def build_attrs_options(self, kwargs):
         if kwargs.get('name') == 'attrs':
@@ -522,7 +1086,7 @@ class Model:
             def process_multiline(s, indent=""):
                 if '\n' not in s:
                     return s
-                return indent_multiline(s, indent=indent + JSON_DOC_INDENT) \
+                return indent_multiline(s, indent=indent + settings.JSON_DOC_INDENT) \
                     .replace('\n', '\n\n').rstrip()
 
             current_indent = ""
@@ -534,21 +1098,21 @@ class Model:
                 if prefix:
                     if current_indent or len(prefix_attrs) > 1:
                         attrs_lines.append("%s%s\n" %
-                                           (JSON_GROUP_HEADING,
+                                           (settings.JSON_GROUP_HEADING,
                                             process_multiline(prefix)))
-                        current_indent = JSON_DOC_INDENT
+                        current_indent = settings.JSON_DOC_INDENT
                     else:
                         prefix_attrs = [(name, 0, "::".join((prefix, doc)))
                                         for name, _, doc in prefix_attrs]
                 for name, _, doc in prefix_attrs:
                     attrs_lines.append('%s%s``%s`` \u2013 %s\n' %
                                        (current_indent,
-                                        "*".ljust(len(JSON_DOC_INDENT)),
+                                        "*".ljust(len(settings.JSON_DOC_INDENT)),
                                         name,
                                         process_multiline(doc,
                                                           current_indent)))
             attrs_str = '\n'.join(attrs_lines)
-            kwargs['doc'] = [JSON_DOC_HEADING + attrs_str]
+            kwargs['doc'] = [settings.JSON_DOC_HEADING + attrs_str]
             kwargs['options'] = dict(null="True")
 
     def normalize_field_options(self, kwargs):
@@ -561,41 +1125,47 @@ class Model:
         doc = tuple(doc) if type(doc) is list else doc
         if '_' in options:
             if options['_'].startswith('"'):
-                options['_'] = stringify(doc, MAX_LINE_LENGTH - 8)
+                options['_'] = stringify(doc, settings.MAX_LINE_LENGTH - 8)
             else:
-                options['verbose_name'] = stringify(doc, MAX_LINE_LENGTH - 23)
+                options['verbose_name'] = stringify(doc, settings.MAX_LINE_LENGTH - 23)
             return options
-        return dict(options, _=stringify(doc, MAX_LINE_LENGTH - 8))
+        return dict(options, _=stringify(doc, settings.MAX_LINE_LENGTH - 8))
 
     def build_field_code(self, kwargs, force=False):
         self.build_attrs_options(kwargs)
         skip_code = False
         if force or 'code' not in kwargs:
+            if profiler:
+                profiler.counts['build_field_code.%s' % (
+                    'rerenders' if 'code' in kwargs else 'renders')] += 1
             tmpl_key = next((k for k in ('drop', 'parent_field',
                                          'one_to_many', 'one_to_one',
                                          'wrap')
                              if k in kwargs),
                             'default')
 
-            final_django_field = kwargs.get('django_field')
             options = self.normalize_field_options(kwargs)
             kwargs['options'] = options.copy()
+            constants = self.builder.constants
+            if constants:
+                # Shared choices and validators are written by name, the
+                # field data keeps their values
+                for key in CONSTANT_OPTIONS:
+                    if (key, options.get(key)) in constants:
+                        options[key] = constants[key, options[key]]
+            if self.builder.string_refs and \
+                    RE_REFERENCE_FIELD.match(kwargs.get('django_field') or '') and \
+                    not options.get('_', "'").startswith(("'", '"')):
+                # The related model may live in another module of the package
+                options['_'] = "'%s'" % options['_']
             kwargs['wrap_options'] = 'null=True' if 'wrap' in kwargs else ''
-            if final_django_field == 'models.CharField' and \
-                    (options.get('max_length') == 'None' or
-                     int(options.get('max_length', 1000)) > 500):
-                final_django_field = 'models.TextField'
-            if (options.get('null') == "True" and
-                ('wrap' in kwargs or
-                 final_django_field == 'models.ManyToManyField')):
-                del options['null']
-            elif final_django_field == 'models.TextField' \
-                    and 'max_length' in options:
-                del options['max_length']
+            final_django_field = get_final_field(kwargs.get('django_field'),
+                                                 options, 'wrap' in kwargs)
 
             if kwargs.get('coalesce'):
                 kwargs['code'] = multiline_comment(FIELD_TMPL['_coalesce'].format(**kwargs))
-                skip_code = any(('coalesce' in f and
+                skip_code = any((f is not kwargs and
+                                 'coalesce' in f and
                                  f['coalesce'] == kwargs['coalesce'] and
                                  'code' in f and
                                  ' = ' in f['code'])
@@ -632,8 +1202,8 @@ class Model:
                                  if '{serialized_options}' in r), None)
                 if tmpl_row:
                     templated_line = tmpl_row.format(**tmpl_ctx)
-                    add_indent = '    ' if templated_line.index('(') > MAX_LINE_LENGTH - 1 else ''
-                    if len(templated_line) > MAX_LINE_LENGTH:
+                    add_indent = '    ' if templated_line.index('(') > settings.MAX_LINE_LENGTH - 1 else ''
+                    if len(templated_line) > settings.MAX_LINE_LENGTH:
                         cmt = '# ' if tmpl_row[4] == '#' else ''
                         indent = '    %s    %s' % (cmt, add_indent)
                         newline_indent = "\n" + indent
@@ -646,7 +1216,7 @@ class Model:
                                                        for k, v in options.items()})),
                                cmt, add_indent)
                 templated_code = FIELD_TMPL[tmpl_key].format(**tmpl_ctx)
-                if tmpl_key == 'default' and templated_code.index('(') > MAX_LINE_LENGTH - 1:
+                if tmpl_key == 'default' and templated_code.index('(') > settings.MAX_LINE_LENGTH - 1:
                     cmt = '# ' if templated_code[4] == '#' else ''
                     indent = '    %s    ' % cmt
                     newline_indent = "\n" + indent
@@ -655,20 +1225,20 @@ class Model:
                 if 'validators' in options:
                     self.have_validators = True
 
-    def build_code(self):
+    def get_meta(self):
         model_options = get_opt(self.model_name, self.type_name)
         meta_ctx = {'model_lower': self.model_name.lower()}
         meta = [template % meta_ctx
                 for template in chain(model_options.get('meta', []),
-                                      GLOBAL_MODEL_OPTIONS.get('meta', []))
+                                      settings.GLOBAL_MODEL_OPTIONS.get('meta', []))
                 if not (self.abstract and template.startswith('db_table = '))]
 
         if self.doc and not any(option for option in meta
                                 if option.startswith('verbose_name = ')):
             doc = tuple(self.doc) if type(self.doc) is list else self.doc
-            doc1 = stringify(doc, MAX_LINE_LENGTH - 23)
+            doc1 = stringify(doc, settings.MAX_LINE_LENGTH - 23)
             if '\n' in doc1:
-                doc1 = stringify(doc, MAX_LINE_LENGTH - 12)
+                doc1 = stringify(doc, settings.MAX_LINE_LENGTH - 12)
                 indent = " " * 4
                 doc1 = '({doc}{indent}{indent})'.format(
                     doc=indent_multiline(doc1, indent=indent * 3),
@@ -679,17 +1249,28 @@ class Model:
         if self.abstract and not any(option for option in meta
                                      if option.startswith('abstract = ')):
             meta.append('abstract = True')
+        return meta
 
-        indexes = list(chain(
-            ['models.Index(fields=["%s", "%s"])' % (f, model_options.get('primary_key', 'id'))
+    def get_indexes(self):
+        model_options = get_opt(self.model_name, self.type_name)
+        pk = model_options.get('primary_key', 'id')
+        return list(chain(
+            [('models.Index', [f, pk],
+              'models.Index(fields=["%s", "%s"])' % (f, pk))
              for f in model_options.get('strict_index_fields', [])],
-            ['GinIndex(fields=["%s"])' % f
+            [('GinIndex', [f], 'GinIndex(fields=["%s"])' % f)
              for f in model_options.get('gin_index_fields', [])],
-            ['models.Index(fields=%r)' % ([f] if isinstance(f, str) else list(f),)
-             for f in list(set(model_options.get('plain_index_fields', [])) -
-                           set(model_options.get('unique_fields', [])))
-             if f != model_options.get('primary_key')],
+            [('models.Index', fields, 'models.Index(fields=%r)' % (fields,))
+             for fields in ([f] if isinstance(f, str) else list(f)
+                            for f in list(set(model_options.get('plain_index_fields', [])) -
+                                          set(model_options.get('unique_fields', [])))
+                            if f != model_options.get('primary_key'))],
         ))
+
+    def build_code(self):
+        model_options = get_opt(self.model_name, self.type_name)
+        meta = self.get_meta()
+        indexes = [code for _, _, code in self.get_indexes()]
         if indexes:
             meta.append('indexes = [\n            %s\n        ]'
                         % ',\n            '.join(sorted(indexes)))
@@ -711,18 +1292,18 @@ class Model:
             stringify(tuple(chain.from_iterable(
                 _['doc']
                 for _ in one_to_many_fields if _['name'] == name
-            )), MAX_LINE_LENGTH - 12) + ",\n"
+            )), settings.MAX_LINE_LENGTH - 12) + ",\n"
             for name in sorted(set(f['name'] for f in one_to_many_fields))
         ]
         one_to_many_descriptions = (
             '    AUTO_ONE_TO_MANY_FIELDS = {\n' +
             ''.join(_.replace(": ", ":\n", 1).replace("\n", "\n            ").rstrip() + "\n"
-                    if len(_) > MAX_LINE_LENGTH else _
+                    if len(_) > settings.MAX_LINE_LENGTH else _
                     for _ in one_to_many_descriptions) +
             '    }\n'
         ) if one_to_many_descriptions else ''
         sorted_fields = self.fields
-        if GLOBAL_MODEL_OPTIONS.get('reverse_fields'):
+        if settings.GLOBAL_MODEL_OPTIONS.get('reverse_fields'):
             sorted_fields = sorted(self.fields,
                                    key=lambda f: f.get('dotted_name', f.get('name', ''))[::-1])
         content = ''.join([one_to_many_descriptions,
@@ -732,8 +1313,12 @@ class Model:
         if not content:
             content = '    pass'
 
+        comment = multiline_comment('Corresponds to XSD type[s]: ' + self.type_name, indent=0)
+        if self.error:
+            comment += multiline_comment('FIXME: not generated, failed with ' + self.error,
+                                         indent=0)
         code = '\n\n{cmt}class {name}({parent}):\n{content}\n'.format(
-            cmt=multiline_comment('Corresponds to XSD type[s]: ' + self.type_name, indent=0),
+            cmt=comment,
             name=self.model_name,
             parent=self.parent or 'models.Model',
             content=content,
@@ -828,9 +1413,189 @@ class Model:
         return None
 
 
+schema_cache = {}
+
+
+class ModelGraph:
+    # Dependencies of the models on each other: on the parent model and on
+    # the targets of ForeignKey, OneToOneField and ManyToManyField fields.
+    # Targets referred to by a quoted name (like the reverse ForeignKey of
+    # one_to_many) are edges too, but do not constrain the order
+
+    def __init__(self, models):
+        self.edges = {}
+        self.ordered = {}
+        for model in models.values():
+            edges = self.edges[model.model_name] = {}
+            ordered = self.ordered[model.model_name] = set(model.deps or ())
+            if model.parent:
+                edges[model.parent] = 'parent'
+                ordered.add(model.parent)
+            for f in model.fields:
+                if RE_REFERENCE_FIELD.match(f.get('django_field', '')):
+                    target = f['options']['_']
+                    if target.startswith(("'", '"')):
+                        target = target.strip('\'"')
+                    else:
+                        ordered.add(target)
+                    edges.setdefault(target, f['django_field'].split('.')[-1])
+            for dep in ordered:
+                edges.setdefault(dep, 'dependency')
+            edges.pop(model.model_name, None)
+            ordered.discard(model.model_name)
+
+    def get_deps(self, name, names):
+        # The edges the order is made of
+        return sorted(dep for dep in self.ordered[name] if dep in names)
+
+    def get_order(self, names=None):
+        # Depth first from every model in sorted order, every model after
+        # the models it depends on; edges closing cycles are left out
+        names = set(self.edges if names is None else names)
+        order = []
+        done = set()
+        for root in sorted(names):
+            if root in done:
+                continue
+            done.add(root)
+            stack = [(root, iter(self.get_deps(root, names)))]
+            while stack:
+                name, deps = stack[-1]
+                for dep in deps:
+                    if dep not in done:
+                        done.add(dep)
+                        stack.append((dep, iter(self.get_deps(dep, names))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(name)
+        return order
+
+    def get_components(self, names=None):
+        # Tarjan's algorithm, the strongly connected component of every model
+        names = set(self.edges if names is None else names)
+        index = {}
+        lowlink = {}
+        stack = []
+        components = {}
+
+        def strongconnect(name):
+            index[name] = lowlink[name] = len(index)
+            stack.append(name)
+            for dep in self.get_deps(name, names):
+                if dep not in index:
+                    strongconnect(dep)
+                    lowlink[name] = min(lowlink[name], lowlink[dep])
+                elif dep in stack:
+                    lowlink[name] = min(lowlink[name], index[dep])
+            if lowlink[name] == index[name]:
+                component = []
+                while True:
+                    dep = stack.pop()
+                    component.append(dep)
+                    if dep == name:
+                        break
+                component.sort()
+                for dep in component:
+                    components[dep] = component
+
+        for name in sorted(names):
+            if name not in index:
+                strongconnect(name)
+        return components
+
+    def get_cycles(self, names=None):
+        return sorted(set(tuple(c) for c in
+                          self.get_components(names).values()
+                          if len(c) > 1))
+
+    def get_report(self, names=None):
+        names = set(self.edges if names is None else names)
+        return {
+            'order': self.get_order(names),
+            'edges': [{'from': name, 'to': dep, 'kind': kind,
+                       'ordered': dep in self.ordered[name]}
+                      for name in sorted(names)
+                      for dep, kind in sorted(self.edges[name].items())
+                      if dep in names],
+            'cycles': [list(c) for c in self.get_cycles(names)],
+        }
+
+    def write_dot(self, outfile, names=None):
+        names = set(self.edges if names is None else names)
+        outfile.write('digraph models {\n')
+        for name in sorted(names):
+            outfile.write('    "%s";\n' % name)
+            for dep, kind in sorted(self.edges[name].items()):
+                if dep in names:
+                    outfile.write('    "%s" -> "%s" [label="%s"%s];\n'
+                                  % (name, dep, kind,
+                                     '' if dep in self.ordered[name]
+                                     else ', style=dashed'))
+        outfile.write('}\n')
+
+
+def load_schema(infile, cache=False):
+    # Parsed schemas are pickled next to the schema file and, with cache,
+    # also kept in memory by file name, modification time and size
+    if cache:
+        stat = os.stat(infile)
+        key = (os.path.abspath(infile), stat.st_mtime_ns, stat.st_size)
+        try:
+            return schema_cache[key]
+        except KeyError:
+            pass
+    import_xmlschema()
+    import pickle
+    try:
+        with open(infile + ".pickle", "rb") as f:
+            schema = pickle.load(f)
+    except Exception:
+        schema = xmlschema.XMLSchema(infile)
+
+        with open(infile + ".pickle", "wb") as f:
+            pickle.dump(schema, f)
+    if cache:
+        schema_cache[key] = schema
+    return schema
+
+
+def get_mapping_shards(dirname):
+    # The files written by earlier runs of write_mapping_shards, in any
+    # format: the indexes and the shards they list. Nothing else in the
+    # directory is ever touched
+    shards = set()
+    for ext in MAPPING_LOADERS:
+        index_filename = MAPPING_INDEX + ext
+        path = os.path.join(dirname, index_filename)
+        if not os.path.exists(path):
+            continue
+        try:
+            listed = list(load_file(path).values())
+        except Exception as e:
+            logger.warning("Cannot read the mapping index %s, leaving its"
+                           " shards alone: %s", path, e,
+                           extra={'code': 'mapping-index-unreadable'})
+            continue
+        shards.add(index_filename)
+        shards.update(filename for filename in listed
+                      if isinstance(filename, str) and
+                      os.path.basename(filename) == filename and
+                      os.path.exists(os.path.join(dirname, filename)))
+    return shards
+
+
 class XSDModelBuilder:
 
-    def __init__(self, infile, custom_fields=False):
+    def __init__(self, infile, custom_fields=False, string_refs=False,
+                 settings=None, cache_schema=False, keep_going=False,
+                 share_anonymous=False):
+        self.settings = settings or default_settings
+        self.automatic_model_names = set()
+        self.share_anonymous = bool(share_anonymous)
+        self.shared_types = {}
+        self.anonymous_types = {}
+        self.activate()
         self.types = set()
         self.models = {}
         self.fields = {}
@@ -839,18 +1604,28 @@ class XSDModelBuilder:
         self.have_json = False
         self.on_field_class_cb = {}
         self.custom_fields = bool(custom_fields)
-        try:
-            with open(infile + ".pickle", "rb") as f:
-                self.schema = pickle.load(f)
-        except Exception:
-            pass
-        else:
-            return
-
-        self.schema = xmlschema.XMLSchema(infile)
-
-        with open(infile + ".pickle", "wb") as f:
-            pickle.dump(self.schema, f)
+        self.constant_types = {}
+        self.constants = None
+        self.string_refs = bool(string_refs)
+        self.keep_going = bool(keep_going)
+        self.errors = []
+        self.graph = None
+        self.schema = load_schema(infile, cache_schema)
+        self.namespaces = self.schema.namespaces
+
+    def activate(self):
+        # Makes the module-level functions use the settings of this builder
+        activate_settings(self.settings, self.automatic_model_names,
+                          self.shared_types)
+
+    def release_schema(self):
+        # Merging and writing need nothing from the schema but namespaces,
+        # so the whole XSD component graph can go once the models are made
+        self.namespaces = dict(self.namespaces)
+        self.schema = None
+        self.types = None
+        self.on_field_class_cb = None
+        gc.collect()
 
     def get_parent_ns(self, element):
         ptr = element
@@ -876,13 +1651,14 @@ class XSDModelBuilder:
         if isinstance(stype, xmlschema.validators.XsdUnion):
             logger.warning("xs:simpleType[name=%s]/xs:union is not supported"
                            " yet",
-                           stype.prefixed_name)
+                           stype.prefixed_name,
+                           extra={'code': 'union-unsupported'})
             return (get_doc(stype, None, None), "TextField", {})
 
         basetype = self.global_name(stype.base_type)
         try:
             doc, parent, options = (get_doc(stype, None, None),
-                                    BASETYPE_FIELD_MAP[basetype],
+                                    settings.BASETYPE_FIELD_MAP[basetype],
                                     {})
         except KeyError:
             doc, parent, options = self.get_field_data_from_type(self.simplify_ns(basetype))
@@ -899,7 +1675,7 @@ class XSDModelBuilder:
         for v in stype.validators:
             if isinstance(v, facets.XsdEnumerationFacets):
                 choices = self.get_field_choices_from_enumerations(v._elements)
-                is_int = parent in ('SmallIntegerField', 'IntegerField', 'BigIntegerField')
+                is_int = parent in INTEGER_FIELD_RANGES
                 options['choices'] = \
                     '[\n    %s\n]' % ',\n    '.join(
                         '(%s, %s)' %
@@ -914,7 +1690,7 @@ class XSDModelBuilder:
                 options['decimal_places'] = v.value
             elif isinstance(v, facets.XsdLengthFacet) and parent != 'IntegerField':
                 options['max_length'] = v.value * \
-                    GLOBAL_MODEL_OPTIONS.get('charfield_max_length_factor', 1)
+                    settings.GLOBAL_MODEL_OPTIONS.get('charfield_max_length_factor', 1)
             elif isinstance(v, facets.XsdMaxExclusiveFacet):
                 if parent == 'DateField':
                     self.have_datetime = True
@@ -931,7 +1707,7 @@ class XSDModelBuilder:
                 validators.append('MaxValueValidator(%s)' % arg)
             elif isinstance(v, facets.XsdMaxLengthFacet):
                 options['max_length'] = v.value * \
-                    GLOBAL_MODEL_OPTIONS.get('charfield_max_length_factor', 1)
+                    settings.GLOBAL_MODEL_OPTIONS.get('charfield_max_length_factor', 1)
             elif isinstance(v, facets.XsdMinExclusiveFacet):
                 if parent == 'DateField':
                     self.have_datetime = True
@@ -959,9 +1735,13 @@ class XSDModelBuilder:
             else:
                 raise Exception("Unknown validator facet %s" % v.__class__)
 
+        if parent in INTEGER_FIELD_RANGES and \
+                settings.GLOBAL_MODEL_OPTIONS.get('narrow_integer_fields'):
+            parent = get_narrowest_integer_field(parent, stype)
+
         pattern = '|'.join(stype.patterns.regexps) if stype.patterns else None
         if pattern:
-            is_int = parent in ('IntegerField', 'PositiveIntegerField', 'BigIntegerField', 'SmallIntegerField')
+            is_int = parent in INTEGER_FIELD_RANGES
             if not is_int and parent not in ('DecimalField', 'FloatField'):
                 validators.append('RegexValidator(r"%s")' % pattern)
             if not is_int:
@@ -977,7 +1757,7 @@ class XSDModelBuilder:
                                          for match in re.findall(r'\\d\{(\d+)\}', pattern))
                 if max_length:
                     options['max_length'] = int(max_length) * \
-                        GLOBAL_MODEL_OPTIONS.get('charfield_max_length_factor',
+                        settings.GLOBAL_MODEL_OPTIONS.get('charfield_max_length_factor',
                                                  1)
             if parent == 'DecimalField':
                 match = RE_RE_DECIMAL.match(pattern)
@@ -991,9 +1771,9 @@ class XSDModelBuilder:
         return doc, parent, options
 
     def get_field_data_from_type(self, typename):
-        if typename in TYPE_OVERRIDES:
-            return deepcopy(TYPE_OVERRIDES[typename])
-        elif typename in BASETYPE_FIELD_MAP:
+        if typename in settings.TYPE_OVERRIDES:
+            return deepcopy(settings.TYPE_OVERRIDES[typename])
+        elif typename in settings.BASETYPE_FIELD_MAP:
             return None, None, None
 
         try:
@@ -1010,6 +1790,7 @@ class XSDModelBuilder:
         if simplified_typename not in self.fields:
             if not typename:
                 if isinstance(element.type, xmlschema.validators.XsdComplexType):
+                    self.share_anonymous_type(el_path, element.type)
                     self.make_model(el_path, element.type)
                     model_name = get_model_for_type(el_path)
                     return orig_typename, {
@@ -1026,7 +1807,7 @@ class XSDModelBuilder:
                         orig_typename = 'xs:string'
                     return orig_typename, {
                         'name': 'models.%s' % parent,
-                        'options': options,
+                        'options': self.share_options(options, el_path),
                     }
                 else:
                     raise Exception(
@@ -1040,9 +1821,9 @@ class XSDModelBuilder:
                 simplified_typename = self.simplify_ns(typename)
                 doc, parent, options = self.get_field_data_from_type(simplified_typename)
                 if parent is None:
-                    if typename in BASETYPE_FIELD_MAP:
+                    if typename in settings.BASETYPE_FIELD_MAP:
                         return orig_typename, {
-                            'name': 'models.%s' % BASETYPE_FIELD_MAP[typename]
+                            'name': 'models.%s' % settings.BASETYPE_FIELD_MAP[typename]
                         }
                     self.make_model(simplified_typename)
                     return orig_typename, {
@@ -1066,7 +1847,9 @@ class XSDModelBuilder:
                     parent = 'TextField'
                 if not self.custom_fields:
                     return orig_typename, dict(name='models.' + parent,
-                                               options=options,
+                                               options=self.share_options(
+                                                   options,
+                                                   simplified_typename),
                                                doc=doc,
                                                **(dict(choices=choices)
                                                   if choices else {}))
@@ -1077,6 +1860,72 @@ class XSDModelBuilder:
                          else self.global_name(stype.primitive_type))
         return orig_typename, self.fields[simplified_typename]
 
+    def share_options(self, options, typename):
+        # Choices and validators used by many fields are written as
+        # module-level constants, named after the first type using them
+        for key in CONSTANT_OPTIONS:
+            if key in options:
+                self.constant_types.setdefault((key, options[key]), typename)
+        return options
+
+    def get_constants(self):
+        # Names of the choices and validators of more than one written
+        # field, by (option, value); the fields using them are rendered
+        # again with the names
+        if self.constants is not None:
+            return self.constants
+        uses = defaultdict(int)
+        for model_name in self.get_code_model_names():
+            for f in self.models[model_name].fields:
+                for key in CONSTANT_OPTIONS:
+                    value = f.get('options', {}).get(key)
+                    if (key, value) in self.constant_types:
+                        uses[key, value] += 1
+        self.constants = {}
+        names = set()
+        for (key, value), typename in self.constant_types.items():
+            if uses[key, value] < 2:
+                continue
+            base = RE_FIELD_CLASS_FILTER.sub(
+                '_', camelcase_to_underscore(strip_ns(typename).split('.')[-1])
+            ).upper()
+            name = '%s_%s' % (base, key.upper())
+            n = 1
+            while name in names:
+                n += 1
+                name = '%s_%s_%d' % (base, key.upper(), n)
+            names.add(name)
+            self.constants[key, value] = name
+        for model_name in self.get_code_model_names():
+            model = self.models[model_name]
+            fields = [f for f in model.fields
+                      if any((key, f.get('options', {}).get(key))
+                             in self.constants for key in CONSTANT_OPTIONS)]
+            for f in fields:
+                # Keep the xs:choice markers added around the rendered code
+                start = f['code'].startswith('    # xs:choice start\n')
+                end = f['code'].endswith('\n    # xs:choice end')
+                model.build_field_code(f, force=True)
+                if start:
+                    f['code'] = '    # xs:choice start\n' + f['code']
+                if end:
+                    f['code'] += '\n    # xs:choice end'
+            if fields:
+                model.build_code()
+        return self.constants
+
+    def get_model_constants(self, model):
+        constants = self.get_constants()
+        return {(key, f['options'][key]): constants[key, f['options'][key]]
+                for f in model.fields
+                for key in CONSTANT_OPTIONS
+                if (key, f.get('options', {}).get(key)) in constants}
+
+    def get_model_code(self, model):
+        # Only final once the constants are known
+        self.get_constants()
+        return model.code
+
     def get_type(self, typename):
         t = schema_get_type(self.schema, typename)
         if t is None:
@@ -1084,7 +1933,7 @@ class XSDModelBuilder:
         return t
 
     def global_name(self, type_):
-        return get_prefixed_qname(type_.name, self.schema.namespaces)
+        return get_prefixed_qname(type_.name, self.namespaces)
 
     def make_field_class(self, typename, doc, parent, options, choices):
         name = RE_FIELD_CLASS_FILTER.sub('_', typename) + 'Field'
@@ -1093,8 +1942,8 @@ class XSDModelBuilder:
 
         if doc:
             doc1 = stringify(doc)
-            if len(doc1) > MAX_LINE_LENGTH - 20:
-                doc1 = stringify(doc, MAX_LINE_LENGTH - 8)
+            if len(doc1) > settings.MAX_LINE_LENGTH - 20:
+                doc1 = stringify(doc, settings.MAX_LINE_LENGTH - 8)
             if '\n' in doc1:
                 code += '    description = (%s)\n\n' % doc1
             else:
@@ -1130,7 +1979,7 @@ class XSDModelBuilder:
 
     def simplify_ns(self, typename):
         ns = get_ns(typename)
-        ns_map = self.schema.namespaces
+        ns_map = self.namespaces
         if ns and '' in ns_map and ns_map[ns] == ns_map['']:
             return strip_ns(typename)
         return typename
@@ -1242,15 +2091,16 @@ class XSDModelBuilder:
                     el2_name = name
                 logger.warning("no maxOccurs=unbounded in %s,"
                                " pretending it's unbounded",
-                               el2_name)
+                               el2_name,
+                               extra={'code': 'no-max-occurs-unbounded'})
 
         ctype2 = self.get_element_complex_type(el2)
         assert ctype2 is not None, \
             "N:many field %s content not a complexType" % name
 
         rel = self.simplify_ns(self.global_name(ctype2)) or \
-            ('%s.%s' % (typename, el2_name))
-        return rel, ctype2
+            self.share_anonymous_type('%s.%s' % (typename, el2_name), ctype2)
+        return rel, ctype2, (None if el2 is element else el2.local_name)
 
     def get_n_to_one_relation(self, typename, name, element):
         ctype2 = self.get_element_complex_type(element)
@@ -1258,9 +2108,20 @@ class XSDModelBuilder:
             "N:1 field %s content is not a complexType" % name
 
         rel = self.simplify_ns(self.global_name(ctype2)) or \
-            ('%s.%s' % (typename, name))
+            self.share_anonymous_type('%s.%s' % (typename, name), ctype2)
         return rel, ctype2
 
+    def share_anonymous_type(self, typename, ctype):
+        # With share_anonymous, the model of the first anonymous type with
+        # the same structure is used, the types are merged like with "+"
+        if self.share_anonymous and typename not in self.shared_types:
+            shared = self.anonymous_types.setdefault(
+                get_structure_key(ctype), typename)
+            if shared != typename:
+                self.shared_types[typename] = shared
+                get_model_for_type.memo.pop((typename,), None)
+        return typename
+
     def nsify(self, typename, context_def):
         return (typename if ':' in typename
                 else (self.get_parent_ns(context_def) + typename))
@@ -1269,7 +2130,8 @@ class XSDModelBuilder:
         if ctype.has_simple_content() and ctype.is_restriction():
             logger.warning("xs:complexType[name=%s]/xs:simpleContent"
                            "/xs:restriction is not yet supported",
-                           ctype.prefixed_name)
+                           ctype.prefixed_name,
+                           extra={'code': 'simple-content-restriction-unsupported'})
 
         if not ctype.has_simple_content() and ctype.is_extension():
             ctype2 = ctype.base_type
@@ -1282,7 +2144,8 @@ class XSDModelBuilder:
             self.write_seq_or_choice(seq_or_choice, typename, **kwargs)
         elif ctype.is_extension():
             logger.warning("xs:complexContent/xs:extension adds nothing to the base type %s",
-                           self.global_name(ctype.base_type))
+                           self.global_name(ctype.base_type),
+                           extra={'code': 'empty-extension'})
         return (self.global_name(ctype.base_type)
                 if ctype.has_simple_content() else None)
 
@@ -1316,7 +2179,7 @@ class XSDModelBuilder:
                      null=False):
         model_name = get_model_for_type(typename)
         this_model = self.models[typename]
-        model = dict({'strategy': GLOBAL_MODEL_OPTIONS.get('strategy', 0)},
+        model = dict({'strategy': settings.GLOBAL_MODEL_OPTIONS.get('strategy', 0)},
                      **get_opt(model_name, typename))
         el_attr = ((attribute.ref or attribute) if element is None
                    else (element.ref or element))
@@ -1395,11 +2258,14 @@ class XSDModelBuilder:
                          name=name,
                          drop_after=drop_after,
                          doc=[doc] if doc else [])
-            rel = (
-                self.get_n_to_many_relation(typename, name, element)
-                if type(one_to_many) is bool
-                else (one_to_many, None)
-            )
+            if type(one_to_many) is bool:
+                rel, ctype2, item = \
+                    self.get_n_to_many_relation(typename, name, element)
+                rel = (rel, ctype2)
+                if item:
+                    field['item'] = item
+            else:
+                rel = (one_to_many, None)
             field['options'] = \
                 dict(_=this_model.make_related_model(rel=rel, **field))
             return field
@@ -1411,16 +2277,18 @@ class XSDModelBuilder:
             name not in model.get('array_fields', {}) and
             self.is_eligible_n2m(typename, name, element, 2)
         ):
+            item = None
             try:
                 rel = model.get('many_to_many_field_overrides', {})[name]
                 ctype2 = None
             except KeyError:
-                rel, ctype2 = self.get_n_to_many_relation(typename, name,
-                                                          element)
+                rel, ctype2, item = self.get_n_to_many_relation(typename, name,
+                                                                element)
             self.make_model(rel, ctype2)
             options = dict(_=get_model_for_type(rel))
             options = override_field_options(name, options, model, 'models.ManyToManyField')
-            return dict(dotted_name=dotted_name,
+            return dict({'item': item} if item else {},
+                        dotted_name=dotted_name,
                         name=name,
                         drop_after=drop_after,
                         django_field='models.ManyToManyField',
@@ -1432,7 +2300,7 @@ class XSDModelBuilder:
             ctype2 = self.get_element_complex_type(element)
             flatten_prefix = \
                 flatten_name.startswith(cat(o.get('flatten_prefixes', ())
-                                            for o in (GLOBAL_MODEL_OPTIONS,
+                                            for o in (settings.GLOBAL_MODEL_OPTIONS,
                                                       model)))
 
             if (
@@ -1467,11 +2335,13 @@ class XSDModelBuilder:
                 else:
                     logger.warning('complexType not found'
                                    ' while flattening prefix %s',
-                                   o['prefix'])
+                                   o['prefix'],
+                                   extra={'code': 'prefix-type-not-found'})
 
         if not (len(name) <= 63 or drop_after):
-            logger.warning("%s hits PostgreSQL column name 63 char limit!" %
-                           name)
+            logger.warning("%s hits PostgreSQL column name 63 char limit!",
+                           name,
+                           extra={'code': 'column-name-too-long'})
 
         basetype = None
         reference_extension = match(name, model, 'reference_extension_fields')
@@ -1487,7 +2357,8 @@ class XSDModelBuilder:
             else:
                 logger.warning("No reference extension while processing prefix"
                                " %s, falling back to normal processing",
-                               new_dotted_prefix)
+                               new_dotted_prefix,
+                               extra={'code': 'no-reference-extension'})
                 reference_extension = False
 
         if match(name, model, 'array_fields'):
@@ -1552,7 +2423,8 @@ class XSDModelBuilder:
             if name == model.get('primary_key', None):
                 logger.warning("WARNING: %s.%s is a primary key but has"
                                " null=True. Skipping null=True",
-                               model_name, name)
+                               model_name, name,
+                               extra={'code': 'null-primary-key'})
             else:
                 options['null'] = 'True'
         else:
@@ -1655,7 +2527,8 @@ class XSDModelBuilder:
                 not ctype.attributes:
             logger.warning("no sequence/choice, no attributes, and"
                            " no complexContent in %s complexType",
-                           ctype.prefixed_name)
+                           ctype.prefixed_name,
+                           extra={'code': 'empty-complex-type'})
         elif not seq_or_choice and ctype.is_extension():
             n_attributes = len(ctype.attributes)
             complexity = ("complex" if ctype.has_complex_content() else "simple")
@@ -1669,7 +2542,8 @@ class XSDModelBuilder:
             if not n_attributes:
                 logger.warning("no additions in extension in"
                                " complexContent in %s complexType",
-                               ctype.prefixed_name)
+                               ctype.prefixed_name,
+                               extra={'code': 'no-extension-additions'})
 
         parent = None
         if ctype.is_extension():
@@ -1682,27 +2556,48 @@ class XSDModelBuilder:
         return parent
 
     def make_model(self, typename, ctype=None, add_fields=None):
-        global depth
-        depth += 1
-
         model_name = get_model_for_type(typename)
         if not model_name:
             logger.warning('Automatic model name: %s. Consider adding it to'
                            ' TYPE_MODEL_MAP\n',
-                           typename)
-            TYPE_MODEL_MAP[typename.replace('.', r'\.')] = typename
+                           typename,
+                           extra={'code': 'automatic-model-name'})
+            self.automatic_model_names.add(typename)
             model_name = get_model_for_type(typename)
 
         if typename in self.types:
-            depth -= 1
             return
 
         self.types.add(typename)
+        if profiler:
+            profiler.start_type()
 
         model = get_opt(model_name, typename)
 
-        info('Making model for type %s\n' % typename)
+        if events:
+            start = time.perf_counter()
+            events.emit('type_start', 'Making model for type %s' % typename,
+                        type=typename, model=model_name)
+
+        if self.keep_going:
+            # A failure is confined to the type it happened in
+            try:
+                self.build_model(typename, model_name, model, ctype,
+                                 add_fields)
+            except Exception as e:
+                self.stub_model(typename, model_name, e)
+        else:
+            self.build_model(typename, model_name, model, ctype, add_fields)
+
+        if events:
+            events.emit('type_end',
+                        'Done making model %s (%s)' % (model_name, typename),
+                        type=typename, model=model_name,
+                        duration=round(time.perf_counter() - start, 6))
+        if profiler:
+            profiler.end_type(typename, model_name)
 
+    def build_model(self, typename, model_name, model, ctype, add_fields):
         if typename not in self.models:
             this_model = Model(self, model_name, typename)
             self.models[typename] = this_model
@@ -1733,19 +2628,22 @@ class XSDModelBuilder:
                 logger.warning(
                     'xs:complexType[name="%s"] mixed=true is not supported'
                     ' yet',
-                    typename
+                    typename,
+                    extra={'code': 'mixed-unsupported'}
                 )
             if ctype.has_simple_content():
                 logger.warning(
                     'xs:complexType[name="%s"]/xs:simpleContent is only'
                     ' supported within flatten_fields',
-                    typename
+                    typename,
+                    extra={'code': 'simple-content-unsupported'}
                 )
             if ctype.has_restriction():
                 logger.warning(
                     'xs:complexType[name="%s"]/xs:complexContent'
                     '/xs:restriction is not supported yet',
-                    typename
+                    typename,
+                    extra={'code': 'complex-content-restriction-unsupported'}
                 )
 
             doc = get_doc(ctype, None, None)
@@ -1775,9 +2673,10 @@ class XSDModelBuilder:
 
         if model.get('include_parent_fields') and not parent_type:
             logger.warning(
-                "include_parent_fields, but parent not found in %s", typename
+                "include_parent_fields, but parent not found in %s", typename,
+                extra={'code': 'parent-not-found'}
             )
-        if parent_type and parent_type in BASETYPE_FIELD_MAP:
+        if parent_type and parent_type in settings.BASETYPE_FIELD_MAP:
             # Probably simpleContent.
             # Add same-named field, with all substitutions.
             coalesced_name = ctype.parent.local_name
@@ -1785,7 +2684,7 @@ class XSDModelBuilder:
                            'level3_substitutions'):
                 coalesced_name = \
                     coalesce(coalesced_name, model, option) or coalesced_name
-            this_model.add_field(django_field='models.%s' % BASETYPE_FIELD_MAP[parent_type],
+            this_model.add_field(django_field='models.%s' % settings.BASETYPE_FIELD_MAP[parent_type],
                                  name=coalesced_name,
                                  dotted_name=ctype.parent.local_name,
                                  doc=doc,
@@ -1861,10 +2760,27 @@ class XSDModelBuilder:
         if 'match_fields' in model:
             this_model.match_fields = model['match_fields']
 
-        info('Done making model %s (%s)\n' % (model_name, typename))
-        depth -= 1
+    def stub_model(self, typename, model_name, e):
+        # Records the error and puts an empty model in place of the failed
+        # one, so that the models referring to it are still valid
+        error = '%s: %s' % (type(e).__name__, e)
+        self.errors.append({'type': typename, 'model': model_name,
+                            'error': error,
+                            'traceback': traceback.format_exc()})
+        logger.error('Failed to make model %s for type %s: %s',
+                     model_name, typename, error,
+                     extra={'code': 'make-model-failed'})
+        this_model = Model(self, model_name, typename)
+        this_model.error = error
+        this_model.deps = []
+        this_model.build_code()
+        self.models[typename] = this_model
 
     def make_models(self, typenames):
+        assert self.schema is not None, "the schema is already released"
+        self.activate()
+        self.graph = None
+        self.constants = None
         self.target_typenames = typenames
         for typename in typenames:
             if typename.startswith('/'):
@@ -1873,6 +2789,10 @@ class XSDModelBuilder:
                 self.make_model(typename)
 
     def merge_models(self):
+        self.activate()
+        self.graph = None
+        self.constants = None
+
         def are_coalesced(field1, field2):
             return any('coalesce' in f1 and
                        f2.get('coalesce', f2.get('name')) == f1['coalesce']
@@ -1932,7 +2852,8 @@ class XSDModelBuilder:
                        for o in containing_opts):
                     logger.warning("Warning: %s is a primary key but wants"
                                    " null=True in %s",
-                                   (name, dotted_name), merged_typename)
+                                   (name, dotted_name), merged_typename,
+                                   extra={'code': 'null-primary-key'})
                 else:
                     for m in containing_models:
                         f = m.get(dotted_name=dotted_name, name=name)
@@ -2163,75 +3084,606 @@ class XSDModelBuilder:
                     merged_model.fields.append(f)
 
                 merged_model.doc = merge_model_docs(models)
+                if profiler:
+                    profiler.counts['merge.models'] += 1
+                    profiler.counts['merge.types'] += len(models)
+                    profiler.counts['merge.fields'] += \
+                        len(merged_model.fields)
 
             merged_model.build_code()
             merged_models[merged_model.model_name] = merged_model
         self.models = merged_models
 
-    def write_model(self, model, outfile):
-        if model.written:
-            return
-        for dep in sorted(model.deps):
-            if dep != model.model_name and not get_opt(dep).get('skip_code'):
-                self.write_model(self.models[dep], outfile)
-        outfile.write(model.code)
-        model.written = True
+    def get_graph(self):
+        # Built once the models are merged, and shared by the writers
+        if self.graph is None:
+            self.graph = ModelGraph(self.models)
+        return self.graph
+
+    def write_model_code(self, outfile, model_names):
+        graph = self.get_graph()
+        for cycle in graph.get_cycles(model_names):
+            logger.warning('Models depend on each other: %s',
+                           ', '.join(cycle),
+                           extra={'code': 'dependency-cycle'})
+        for model_name in graph.get_order(model_names):
+            outfile.write(self.get_model_code(self.models[model_name]))
+
+    def get_code_model_names(self):
+        return sorted(name for name in self.models
+                      if not get_opt(name).get('skip_code'))
+
+    def get_header_flags(self, model_names=None):
+        if model_names is None:
+            return {
+                'datetime': self.have_datetime,
+                'validators': any(_.have_validators
+                                  for _ in self.models.values()),
+                'array': self.have_array,
+                'json': self.have_json,
+                'gin': any('gin_index_fields' in o
+                           for o in settings.MODEL_OPTIONS.values()),
+                'index_marker': any(('gin_index_fields' in o or
+                                     'plain_index_fields' in o or
+                                     'strict_index_fields' in o)
+                                    for o in settings.MODEL_OPTIONS.values()),
+            }
+        code = ''.join(self.get_model_code(self.models[name])
+                       for name in model_names)
+        return {
+            'datetime': 'datetime.' in code,
+            'validators': 'validators.' in code,
+            'array': 'ArrayField(' in code,
+            'json': 'JSONField(' in code,
+            'gin': 'GinIndex(' in code,
+            'index_marker': 'INDEX_IN_META' in code,
+        }
 
-    def write(self, models_file, fields_file, map_file):
-        if fields_file:
-            fields_file.write(HEADER)
-            fields_file.write('import datetime\n')
-            fields_file.write('from django.core import validators\n')
-            fields_file.write('from django.db import models\n\n\n')
-            for key in sorted(self.fields):
-                field = self.fields[key]
-                if 'code' in field:
-                    fields_file.write(field['code'])
-
-        models_file.write(HEADER)
-        if self.have_datetime:
-            models_file.write('import datetime\n')
-        if any(_.have_validators for _ in self.models.values()):
-            models_file.write('from django.core import validators\n')
-        models_file.write('from django.db import models\n')
-        if self.have_array:
-            models_file.write('from django.contrib.postgres.fields import'
-                              ' ArrayField\n')
-        if self.have_json:
-            models_file.write(
+    def get_custom_field_names(self, model_names):
+        return sorted(
+            set(f['name'] for f in self.fields.values() if 'code' in f)
+            .intersection(f.get('django_field')
+                          for f in chain.from_iterable(self.models[n].fields
+                                                       for n in model_names))
+        )
+
+    def write_models_header(self, outfile, flags, field_names=(),
+                            fields_module='.fields', extra_imports=''):
+        outfile.write(HEADER)
+        if flags['datetime']:
+            outfile.write('import datetime\n')
+        if flags['validators']:
+            outfile.write('from django.core import validators\n')
+        outfile.write('from django.db import models\n')
+        if flags['array']:
+            outfile.write('from django.contrib.postgres.fields import'
+                          ' ArrayField\n')
+        if flags['json']:
+            outfile.write(
                 'try:\n'
                 '    JSONField = models.JSONField\n'
                 'except AttributeError:\n'
                 '    from django.contrib.postgres.fields import JSONField\n'
             )
-        if any('gin_index_fields' in o for o in MODEL_OPTIONS.values()):
-            models_file.write('from django.contrib.postgres.indexes import'
-                              ' GinIndex\n')
-
-        models_file.write('\n')
-        if fields_file:
-            fields = sorted(
-                set(f['name'] for f in self.fields.values() if 'code' in f)
-                .intersection(f.get('django_field')
-                              for f in chain.from_iterable(m.fields
-                                                           for n, m in self.models.items()
-                                                           if not get_opt(n).get('skip_code')))
+        if flags['gin']:
+            outfile.write('from django.contrib.postgres.indexes import'
+                          ' GinIndex\n')
+
+        outfile.write('\n')
+        if len(field_names):
+            outfile.write(
+                'from %s import \\\n        %s\n'
+                % (fields_module, ', \\\n        '.join(field_names))
             )
-            if len(fields):
-                models_file.write(
-                    'from .fields import \\\n        %s\n'
-                    % ', \\\n        '.join(fields)
-                )
-        models_file.write(IMPORTS + '\n\n\n')
-        if any(('gin_index_fields' in o or
-                'plain_index_fields' in o or
-                'strict_index_fields' in o)
-               for o in MODEL_OPTIONS.values()):
-            models_file.write('INDEX_IN_META = False  # A handy marker\n')
-        for model_name in sorted(self.models.keys()):
-            if not get_opt(model_name).get('skip_code'):
-                self.write_model(self.models[model_name], models_file)
+        outfile.write(extra_imports)
+        outfile.write(settings.IMPORTS + '\n\n\n')
+        if flags['index_marker']:
+            outfile.write('INDEX_IN_META = False  # A handy marker\n')
+
+    def write_fields(self, fields_file):
+        fields_file.write(HEADER)
+        fields_file.write('import datetime\n')
+        fields_file.write('from django.core import validators\n')
+        fields_file.write('from django.db import models\n\n\n')
+        for key in sorted(self.fields):
+            field = self.fields[key]
+            if 'code' in field:
+                fields_file.write(field['code'])
+
+    def write_constants(self, outfile, names=None):
+        constants = sorted((name, value)
+                           for (key, value), name in self.get_constants().items()
+                           if names is None or name in names)
+        if constants:
+            outfile.write(''.join('%s = %s\n' % c for c in constants))
+
+    def write_models(self, models_file, have_fields_file):
+        model_names = self.get_code_model_names()
+        self.write_models_header(
+            models_file,
+            self.get_header_flags(),
+            self.get_custom_field_names(model_names) if have_fields_file else (),
+        )
+        self.write_constants(models_file)
+        self.write_model_code(models_file, model_names)
+
+    def get_model_group(self, model, grouping, components):
+        if grouping == 'namespace':
+            group = get_ns(model.type_name.split('; ')[0]) or 'default'
+        elif grouping == 'settings':
+            matches = ((settings.compile(expr).match(model.model_name), sub)
+                       for expr, sub in settings.MODEL_GROUPS.items())
+            group = next((m.expand(sub) for m, sub in matches if m),
+                         'default')
+        elif grouping == 'scc':
+            group = camelcase_to_underscore(components[model.model_name][0])
+        else:
+            raise ValueError("unknown model grouping: %s" % grouping)
+        group = RE_FIELD_CLASS_FILTER.sub('_', group).lower()
+        return ('_' + group) if group[0].isdigit() else group
+
+    def write_models_package(self, package_dir, grouping, have_fields_file):
+        model_names = self.get_code_model_names()
+        components = (self.get_graph().get_components(model_names)
+                      if grouping == 'scc' else {})
+        groups = {}
+        for model_name in model_names:
+            group = self.get_model_group(self.models[model_name], grouping,
+                                         components)
+            groups.setdefault(group, []).append(model_name)
+        module_for_model = {model_name: group
+                            for group, names in groups.items()
+                            for model_name in names}
+
+        constants = self.get_constants()
+        contents = {}
+        for group, names in sorted(groups.items()):
+            parents = sorted(set(
+                (module_for_model[m.parent], m.parent)
+                for m in (self.models[name] for name in names)
+                if m.parent in module_for_model and
+                module_for_model[m.parent] != group
+            ))
+            extra_imports = ''.join(
+                'from .%s import %s\n' % (module, ', '.join(n for _, n in it))
+                for module, it in groupby(parents, key=itemgetter(0))
+            )
+            group_constants = sorted(set(chain.from_iterable(
+                self.get_model_constants(self.models[name]).values()
+                for name in names)))
+            if group_constants:
+                extra_imports += 'from ._constants import %s\n' \
+                    % ', '.join(group_constants)
+            outfile = io.StringIO()
+            self.write_models_header(
+                outfile,
+                self.get_header_flags(names),
+                self.get_custom_field_names(names) if have_fields_file else (),
+                fields_module='..fields',
+                extra_imports=extra_imports,
+            )
+            self.write_model_code(outfile, names)
+            contents['%s.py' % group] = outfile.getvalue()
+
+        if constants:
+            outfile = io.StringIO()
+            outfile.write(HEADER)
+            code = ''.join(value for _, value in constants)
+            if 'datetime.' in code:
+                outfile.write('import datetime\n')
+            if 'validators.' in code:
+                outfile.write('from django.core import validators\n')
+            outfile.write('\n\n')
+            self.write_constants(outfile)
+            contents['_constants.py'] = outfile.getvalue()
+
+        contents['__init__.py'] = HEADER + ''.join(
+            'from .%s import (\n%s)\n'
+            % (group, ''.join('    %s,\n' % name for name in names))
+            for group, names in sorted(groups.items())
+        )
+
+        def write_if_changed(item):
+            filename, content = item
+            filename = os.path.join(package_dir, filename)
+            try:
+                with codecs.open(filename, 'r', 'utf-8') as f:
+                    if f.read() == content:
+                        return False
+            except IOError:
+                pass
+            with codecs.open(filename, 'w', 'utf-8') as f:
+                f.write(content)
+            return True
+
+        os.makedirs(package_dir, exist_ok=True)
+        for filename in os.listdir(package_dir):
+            # Remove generated modules of groups which do not exist anymore
+            if filename.endswith('.py') and filename not in contents:
+                path = os.path.join(package_dir, filename)
+                with codecs.open(path, 'r', 'utf-8') as f:
+                    is_generated = f.read(len(HEADER)) == HEADER
+                if is_generated:
+                    os.remove(path)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor() as executor:
+            changed = sum(executor.map(write_if_changed,
+                                       sorted(contents.items())))
+        logger.info("%d of %d modules rewritten in %s",
+                    changed, len(contents), package_dir)
+
+    def get_migration_fields(self, model, app_label):
+        parent = self.models.get(model.parent)
+        fields = (self.get_migration_fields(parent, app_label)
+                  if parent and parent.abstract else [])
+        custom_fields = set(f['name'] for f in self.fields.values()
+                            if 'code' in f)
+        for f in model.fields:
+            if not re.search(r'^    %s = ' % re.escape(f.get('name', '')),
+                             f.get('code', ''), re.M):
+                # Comments, reverse relations and coalesced duplicates
+                continue
+            options = dict(f['options'])
+            django_field = get_final_field(f.get('django_field'), options,
+                                           'wrap' in f)
+            if django_field not in custom_fields and \
+                    not django_field.startswith('models.'):
+                django_field = 'models.%s' % django_field
+            args = []
+            target = None
+            column = f['name']
+            if RE_REFERENCE_FIELD.match(f.get('django_basefield', '')):
+                target = options.pop('_').strip("'")
+                options['to'] = "'%s.%s'" % (app_label, target.lower())
+                column = (None if f['django_basefield'] == 'models.ManyToManyField'
+                          else '%s_id' % column)
+            elif '_' in options:
+                args.append(options.pop('_'))
+            if 'db_column' in options:
+                column = options['db_column'].strip('"\'')
+            code = '%s(%s)' % (django_field,
+                               ', '.join(args + ['%s=%s' % o for o in
+                                                 sorted(options.items())]))
+            if 'wrap' in f:
+                code = '%s(%s)' % (f['wrap'], ', '.join(
+                    filter(None, (code, f['wrap_options']))))
+            fields.append((f['name'], code, target, column))
+        return fields
+
+    def get_migration_options(self, model):
+        parent = self.models.get(model.parent)
+        options = (self.get_migration_options(parent)
+                   if parent and parent.abstract else {})
+        for option in model.get_meta():
+            key, _, value = option.partition(' = ')
+            options[key] = value
+        indexes = model.get_indexes()
+        if indexes:
+            options['indexes'] = indexes
+        return options
+
+    def get_concrete_parent(self, model):
+        parent = self.models.get(model.parent)
+        while parent and parent.abstract:
+            parent = self.models.get(parent.parent)
+        return parent
 
+    def write_migration(self, outfile, app_label):
+        model_names = [name for name in self.get_code_model_names()
+                       if not self.models[name].abstract]
+        fields = {name: self.get_migration_fields(self.models[name], app_label)
+                  for name in model_names}
+        bases = {name: self.get_concrete_parent(self.models[name])
+                 for name in model_names}
+        deps = {name: (set(f[2] for f in fields[name] if f[2]) |
+                       set([bases[name].model_name] if bases[name] else ())) &
+                set(model_names) - set([name])
+                for name in model_names}
+        for name in model_names:
+            for target in sorted(set(f[2] for f in fields[name] if f[2])):
+                if target not in self.models:
+                    logger.warning("%s refers to %s, which is not generated;"
+                                   " add its migration to dependencies",
+                                   name, target,
+                                   extra={'code': 'missing-dependency'})
+
+        def indented(code, indent):
+            return code.replace('\n', '\n' + indent)
+
+        # The primary key field Django adds to models without one, which has
+        # to match the DEFAULT_AUTO_FIELD setting (or the app's
+        # default_auto_field)
+        auto_field_module, _, auto_field = settings.GLOBAL_MODEL_OPTIONS.get(
+            'default_auto_field', 'django.db.models.BigAutoField'
+        ).rpartition('.')
+        if auto_field_module == 'django.db.models':
+            auto_field = 'models.' + auto_field
+
+        # CreateModel operations in dependency order, relations closing
+        # cycles are added afterwards
+        created = set()
+        remaining = list(model_names)
+        operations = []
+        added_fields = []
+        while remaining:
+            name = next(
+                chain((n for n in remaining if created.issuperset(deps[n])),
+                      (n for n in remaining
+                       if not bases[n] or bases[n].model_name in created),
+                      remaining)
+            )
+            remaining.remove(name)
+            created.add(name)
+            model = self.models[name]
+            parent = bases[name]
+            field_lines = []
+            if parent:
+                field_lines.append(
+                    "('%s_ptr', models.OneToOneField(auto_created=True,"
+                    " on_delete=models.CASCADE, parent_link=True,"
+                    " primary_key=True, serialize=False, to='%s.%s'))"
+                    % (parent.model_name.lower(), app_label,
+                       parent.model_name.lower()))
+            elif not any('primary_key=True' in f[1] for f in fields[name]):
+                field_lines.append(
+                    "('id', %s(auto_created=True, primary_key=True,"
+                    " serialize=False, verbose_name='ID'))" % auto_field)
+            for field_name, code, target, _ in fields[name]:
+                if target and target not in created and target in model_names:
+                    added_fields.append(
+                        'migrations.AddField(\n'
+                        "            model_name='%s',\n"
+                        "            name='%s',\n"
+                        '            field=%s,\n'
+                        '        ),'
+                        % (name.lower(), field_name, indented(code, ' ' * 12)))
+                else:
+                    field_lines.append("('%s', %s)"
+                                       % (field_name, indented(code, ' ' * 20)))
+
+            options = self.get_migration_options(model)
+            options.pop('abstract', None)
+            if 'indexes' in options:
+                db_table = ast.literal_eval(options.get(
+                    'db_table', repr('%s_%s' % (app_label, name.lower()))))
+                columns = dict((f[0], f[3]) for f in fields[name])
+                columns['id'] = 'id'
+                options['indexes'] = '[%s]' % ', '.join(sorted(
+                    "%s(fields=%r, name='%s')" % (
+                        index_class, index_fields,
+                        get_index_name(db_table,
+                                       [('-' if f.startswith('-') else '') +
+                                        columns.get(f.lstrip('-'), f.lstrip('-'))
+                                        for f in index_fields],
+                                       'gin' if index_class == 'GinIndex'
+                                       else 'idx'))
+                    for index_class, index_fields, _ in options['indexes']))
+            operation = [
+                'migrations.CreateModel(',
+                "    name='%s'," % name,
+                '    fields=[',
+            ] + ['        %s,' % line for line in field_lines] + [
+                '    ],',
+            ]
+            if options:
+                operation.extend(['    options={'] + [
+                    "        '%s': %s," % (key, indented(value, ' ' * 16))
+                    for key, value in sorted(options.items())
+                ] + ['    },'])
+            if parent:
+                operation.append("    bases=('%s.%s',),"
+                                 % (app_label, parent.model_name.lower()))
+            operation.append('),')
+            operations.append('\n        '.join(operation))
+
+        body = '\n        '.join(operations + added_fields)
+        custom_field_names = sorted(
+            f['name'] for f in self.fields.values()
+            if 'code' in f and re.search(r'\b%s\(' % f['name'], body))
+        outfile.write(HEADER)
+        if 'datetime.' in body:
+            outfile.write('import datetime\n')
+        if 'validators.' in body:
+            outfile.write('from django.core import validators\n')
+        outfile.write('from django.db import migrations, models\n')
+        if auto_field_module != 'django.db.models' and \
+                re.search(r'\b%s\(' % auto_field, body):
+            outfile.write('from %s import %s\n'
+                          % (auto_field_module, auto_field))
+        if 'ArrayField(' in body:
+            outfile.write('from django.contrib.postgres.fields import'
+                          ' ArrayField\n')
+        if 'GinIndex(' in body:
+            outfile.write('from django.contrib.postgres.indexes import'
+                          ' GinIndex\n')
+        imports = []
+        if custom_field_names:
+            imports.append('from ..fields import \\\n        %s'
+                           % ', \\\n        '.join(custom_field_names))
+        if settings.IMPORTS:
+            imports.append(settings.IMPORTS.rstrip('\n'))
+        outfile.write(''.join('\n%s\n' % code for code in imports) + '\n\n')
+        if 'INDEX_IN_META' in body:
+            outfile.write('INDEX_IN_META = False  # A handy marker\n\n\n')
+        outfile.write(
+            'class Migration(migrations.Migration):\n\n'
+            '    initial = True\n\n'
+            '    dependencies = [\n'
+            '    ]\n\n'
+            '    operations = [\n'
+            '        %s\n'
+            '    ]\n'
+            % body)
+
+    def get_path_index(self, mapping):
+        def model_fields(model_name):
+            parent = mapping[model_name].get('parent')
+            return chain(model_fields(parent) if parent in mapping else (),
+                         mapping[model_name].get('fields', ()))
+
+        def add_paths(index, model_name, prefix, el_name, seen):
+            for f in model_fields(model_name):
+                if 'attrs' in f:
+                    for dotted_name in f['attrs']:
+                        index[prefix + dotted_name] = \
+                            [model_name, f['name'], 'json']
+                    continue
+                dotted_name = f.get('dotted_name')
+                if not dotted_name:
+                    continue
+                path = prefix + dotted_name
+                django_field = f.get('django_basefield', '')
+                if f.get('drop') or f.get('parent_field'):
+                    index[path] = [model_name, None,
+                                   'drop' if f.get('drop') else 'parent']
+                    continue
+                elif f.get('one_to_many') or f.get('one_to_one'):
+                    target = f['options']['_'].strip("'")
+                    column = f['reverse_id_name'][:-3]
+                    kind = 'one_to_many' if f.get('one_to_many') \
+                        else 'one_to_one'
+                elif RE_REFERENCE_FIELD.match(django_field):
+                    target = f['options']['_']
+                    if target.startswith("'"):
+                        # Back reference to the containing record
+                        continue
+                    column = f['name']
+                    kind = ('many_to_many'
+                            if django_field == 'models.ManyToManyField'
+                            else 'foreign_key')
+                else:
+                    if dotted_name == el_name:
+                        # simpleContent of the record element itself
+                        path = prefix + '#text'
+                    index[path] = [
+                        model_name, f['name'],
+                        FIELD_KINDS.get(django_field, 'str') +
+                        ('[]' if f.get('wrap') == 'ArrayField' else '')
+                    ]
+                    continue
+                if f.get('item'):
+                    path += '.' + f['item']
+                index[path] = [target, column, kind]
+                if target in mapping and target not in seen:
+                    add_paths(index, target, path + '.',
+                              path.rpartition('.')[2], seen | {target})
+
+        path_index = {}
+        for typename in self.target_typenames:
+            if typename.startswith('/'):
+                el_name, typename = typename[1:], 'typename1'
+            else:
+                el_name = None
+            model_name = get_model_for_type(typename) or typename
+            if model_name in mapping:
+                index = path_index[model_name] = {}
+                add_paths(index, model_name, '', el_name, {model_name})
+        return path_index
+
+    def get_converter_code(self, model_name, fields):
+        lines = ['def convert_%s(element):' % model_name,
+                 '    values = {}']
+        if any(column == 'attrs' for _, column, _ in fields):
+            lines.append('    attrs = {}')
+        for path, column, kind in fields:
+            array = kind.endswith('[]')
+            kind = kind.rstrip('[]')
+            value = CONVERTER_CODE[kind] % 'text'
+            xpath = path.replace('.', '/')
+            if array:
+                lines.extend(["    items = [%s for text in"
+                              " iter_texts(element, '%s')]" % (value, xpath),
+                              '    if items:',
+                              "        values['%s'] = items" % column])
+                continue
+            el_path, _, name = xpath.rpartition('/')
+            if name == '#text' and not el_path:
+                lines.append('    text = element.text')
+            elif name == '#text':
+                lines.append("    text = element.findtext('%s')" % el_path)
+            elif name.startswith('@') and not el_path:
+                lines.append("    text = element.get('%s')" % name[1:])
+            elif name.startswith('@'):
+                lines.extend(["    e = element.find('%s')" % el_path,
+                              "    text = None if e is None else e.get('%s')"
+                              % name[1:]])
+            else:
+                lines.append("    text = element.findtext('%s')" % xpath)
+            lines.append('    if text and not text.isspace():')
+            if column == 'attrs':
+                lines.append("        attrs['%s'] = %s" % (path, value))
+            else:
+                lines.append("        values['%s'] = %s" % (column, value))
+        if any(column == 'attrs' for _, column, _ in fields):
+            lines.extend(['    if attrs:',
+                          "        values['attrs'] = attrs"])
+        lines.append('    return values')
+        return '\n'.join(lines)
+
+    def write_loaders(self, outfile):
+        path_index = self.get_mapping(path_index=True)[PATH_INDEX]
+        records = {}
+        fields = {}
+        model_fields = {}
+
+        def push(path, model_name):
+            # Every model is converted the same way wherever it occurs, so
+            # its fields are only collected once
+            if model_name in model_fields:
+                model_name = None
+            else:
+                model_fields[model_name] = []
+            stack.append((path, model_name))
+
+        for root, index in sorted(path_index.items()):
+            records[root] = {}
+            fields[root] = {}
+            stack = []
+            push('', root)
+            for path, (model_name, column, kind) in index.items():
+                while stack[-1][0] and \
+                        not path.startswith(stack[-1][0] + '.'):
+                    stack.pop()
+                record_path, record_model = stack[-1]
+                if kind in RELATION_KINDS:
+                    records[root][path] = [model_name, column, kind]
+                    push(path, model_name)
+                elif kind not in ('drop', 'parent'):
+                    # Paths read by the converters, so that the loader
+                    # drops the other elements as soon as they are parsed
+                    fields[root][path] = [model_name, column, kind]
+                    if record_model:
+                        model_fields[record_model].append((
+                            path[len(record_path) + 1:] if record_path
+                            else path,
+                            column, kind))
+
+        code = '\n\n\n'.join(self.get_converter_code(name, fields)
+                              for name, fields in sorted(model_fields.items()))
+        outfile.write(HEADER)
+        if 'base64.' in code:
+            outfile.write('import base64\n')
+        if 'decimal.' in code:
+            outfile.write('import decimal\n')
+        helpers = [name for name in ('iter_texts', 'to_date', 'to_datetime')
+                   if name + '(' in code]
+        if helpers:
+            outfile.write('\nfrom xsd_to_django_model.loader import %s\n'
+                          % ', '.join(helpers))
+        def paths_code(paths):
+            return ''.join("    %r: {\n%s    },\n"
+                           % (root, ''.join('        %r: %r,\n' % item
+                                            for item in entries.items()))
+                           for root, entries in sorted(paths.items()))
+
+        outfile.write('\n\n%s\n\n\nCONVERTERS = {\n%s}\n\nRECORDS = {\n%s}\n'
+                      '\nFIELDS = {\n%s}\n'
+                      % (code,
+                         ''.join("    '%s': convert_%s,\n" % (name, name)
+                                 for name in sorted(model_fields)),
+                         paths_code(records), paths_code(fields)))
+
+    def get_mapping(self, path_index=False):
         mapping = {}
         for m in self.models.values():
             model_mapping = {}
@@ -2241,33 +3693,228 @@ class XSDModelBuilder:
                         'match_fields',
                         'number_field'):
                 value = getattr(m, key)
+                if key == 'fields' and not path_index:
+                    # The item element names only serve the path index
+                    value = [{k: v for k, v in f.items() if k != 'item'}
+                             if 'item' in f else f
+                             for f in value]
                 if not (value is None or (key == 'parent' and not value)):
                     model_mapping[key] = value
             if m.mapping_extra:
                 mapping.update(m.mapping_extra)
             mapping[m.model_name] = model_mapping
-        json.dump(mapping, map_file, ensure_ascii=False, indent=4)
+        if path_index:
+            mapping[PATH_INDEX] = self.get_path_index(mapping)
+        return mapping
+
+    def write_mapping(self, map_file, mapping_format='indented',
+                      path_index=False):
+        _, dump = MAPPING_FORMATS[mapping_format]
+        dump(self.get_mapping(path_index), map_file)
+
+    def write_mapping_shards(self, dirname, mapping_format='indented',
+                             path_index=False):
+        self.activate()
+        ext, dump = MAPPING_FORMATS[mapping_format]
+        mode, encoding = (('wb', None) if mapping_format in BINARY_MAPPING_FORMATS
+                          else ('w', 'utf-8'))
+        mapping = self.get_mapping(path_index)
+        index = {}
+        filenames = {MAPPING_INDEX + ext}
+        for key in sorted(mapping):
+            base = RE_FIELD_CLASS_FILTER.sub('_', key)
+            filename = base + ext
+            n = 1
+            while filename in filenames:
+                n += 1
+                filename = '%s_%d%s' % (base, n, ext)
+            filenames.add(filename)
+            index[key] = filename
+
+        os.makedirs(dirname, exist_ok=True)
+        for filename in get_mapping_shards(dirname):
+            # Remove shards of models which do not exist anymore
+            if filename not in filenames:
+                os.remove(os.path.join(dirname, filename))
+        for key, filename in chain(index.items(), [(None, MAPPING_INDEX + ext)]):
+            with open(os.path.join(dirname, filename), mode,
+                      encoding=encoding) as f:
+                dump(index if key is None else mapping[key], f)
+
+    def write_graph(self, filename):
+        model_names = self.get_code_model_names()
+        with open(filename, 'w', encoding='utf-8') as f:
+            if filename.endswith('.dot'):
+                self.get_graph().write_dot(f, model_names)
+            else:
+                json.dump(self.get_graph().get_report(model_names), f,
+                          indent=4)
+
+    def write(self, models_file, fields_file, map_file,
+              models_package=None, grouping='namespace',
+              mapping_format='indented', path_index=False,
+              migration_file=None, app_label=None, loaders_file=None):
+        self.activate()
+        if fields_file:
+            self.write_fields(fields_file)
+        if models_package:
+            self.write_models_package(models_package, grouping,
+                                      bool(fields_file))
+        else:
+            self.write_models(models_file, bool(fields_file))
+        if map_file is not None:
+            self.write_mapping(map_file, mapping_format, path_index)
+        if migration_file:
+            self.write_migration(migration_file, app_label)
+        if loaders_file:
+            self.write_loaders(loaders_file)
+
+
+def generate(xsd_filename, typenames, settings=None, custom_fields=False,
+             path_index=False, app_label=None, loaders=False,
+             keep_going=False, share_anonymous=False, models_package=None,
+             grouping='namespace'):
+    # Generates the models in memory, returning the models and fields code,
+    # the mapping and, if asked for, the migration and loaders code. Parsed
+    # schemas are kept between calls, and so are memoized results as long
+    # as the settings stay the same. With keep_going, the types which failed
+    # are listed in errors. With models_package, the models are written to
+    # that directory as a package (see -p and -g) instead
+    builder = XSDModelBuilder(xsd_filename, custom_fields, settings=settings,
+                              string_refs=bool(models_package),
+                              cache_schema=True, keep_going=keep_going,
+                              share_anonymous=share_anonymous)
+    builder.make_models(list(typenames))
+    builder.merge_models()
+    models_file = None if models_package else io.StringIO()
+    fields_file = io.StringIO() if custom_fields else None
+    migration_file = io.StringIO() if app_label else None
+    loaders_file = io.StringIO() if loaders else None
+    builder.write(models_file, fields_file, None,
+                  models_package=models_package, grouping=grouping,
+                  migration_file=migration_file, app_label=app_label,
+                  loaders_file=loaders_file)
+    return {
+        'models': models_file.getvalue() if models_file else None,
+        'fields': fields_file.getvalue() if fields_file else None,
+        'mapping': builder.get_mapping(path_index),
+        'migration': migration_file.getvalue() if migration_file else None,
+        'loaders': loaders_file.getvalue() if loaders_file else None,
+        'errors': builder.errors,
+    }
 
 
 def main():
+    global events, memory, profiler
+    from docopt import docopt
+    args = None
     try:
         args = docopt(__doc__)
-
-        builder = XSDModelBuilder(args['<xsd_filename>'], args['-f'])
-        builder.make_models([(a.decode('UTF-8') if hasattr(a, 'decode') else a)
-                             for a in args['<xsd_type>']])
-        builder.merge_models()
-        builder.write(codecs.open(args['-m'], "w", 'utf-8'),
-                      (codecs.open(args['-f'], "w", 'utf-8')
-                       if args['-f'] else None),
-                      codecs.open(args['-j'], "w", 'utf-8'))
+        if args['--events']:
+            events = EventWriter(sys.stdout if args['--events'] == '-'
+                                 else open(args['--events'], 'w',
+                                           encoding='utf-8'),
+                                 'json')
+        else:
+            events = EventWriter(sys.stderr,
+                                 'quiet' if args['--quiet'] else 'text')
+        # Other libraries (xmlschema) only get their warnings through
+        logging.basicConfig(level=logging.WARNING,
+                            handlers=[EventHandler(events)])
+        logger.setLevel(logging.WARNING if args['--quiet'] else logging.INFO)
+        if args['--profile']:
+            profiler = Profiler()
+        if args['--memory']:
+            memory = MemoryProfiler()
+
+        @contextmanager
+        def phase(name):
+            with ExitStack() as stack:
+                # Memory is measured out of the timed phase
+                for p in (memory, profiler):
+                    if p:
+                        stack.enter_context(p.phase(name))
+                yield
+
+        with phase('load'):
+            builder = XSDModelBuilder(
+                args['<xsd_filename>'], args['-f'],
+                string_refs=bool(args['-p']),
+                settings=(Settings.from_file(args['-s'],
+                                             args['--settings-cache'])
+                          if args['-s'] else None),
+                keep_going=args['--keep-going'],
+                share_anonymous=args['--share-anonymous'])
+            if memory:
+                memory.builder = builder
+        with phase('make_models'):
+            builder.make_models([(a.decode('UTF-8') if hasattr(a, 'decode')
+                                  else a)
+                                 for a in args['<xsd_type>']])
+            if args['--release-schema']:
+                builder.release_schema()
+        with phase('merge_models'):
+            builder.merge_models()
+        mapping_format = args['-J']
+        if mapping_format not in MAPPING_FORMATS:
+            raise ValueError("unknown mapping format: %s" % mapping_format)
+        if args['--mapping-shards']:
+            map_file = None
+        elif mapping_format in BINARY_MAPPING_FORMATS:
+            map_file = open(args['-j'], "wb")
+        else:
+            map_file = codecs.open(args['-j'], "w", 'utf-8')
+        with phase('write'):
+            builder.write((None if args['-p']
+                           else codecs.open(args['-m'], "w", 'utf-8')),
+                          (codecs.open(args['-f'], "w", 'utf-8')
+                           if args['-f'] else None),
+                          map_file,
+                          models_package=args['-p'],
+                          grouping=args['-g'],
+                          mapping_format=mapping_format,
+                          path_index=args['--path-index'],
+                          migration_file=(codecs.open(args['-M'], "w",
+                                                      'utf-8')
+                                          if args['-M'] else None),
+                          app_label=args['-a'] or os.path.basename(
+                              os.path.dirname(os.path.abspath(args['-p'] or
+                                                              args['-m']))),
+                          loaders_file=(codecs.open(args['-l'], "w", 'utf-8')
+                                        if args['-l'] else None))
+            if args['--mapping-shards']:
+                builder.write_mapping_shards(args['-j'], mapping_format,
+                                             args['--path-index'])
+            if args['--graph']:
+                builder.write_graph(args['--graph'])
+        if builder.errors:
+            logger.error('%d type(s) failed: %s', len(builder.errors),
+                         ', '.join(e['type'] for e in builder.errors),
+                         extra={'code': 'errors'})
+        events.flush()
+        if events.outfile not in (sys.stdout, sys.stderr):
+            events.outfile.close()
+        for p, filename in ((profiler, args['--profile']),
+                            (memory, args['--memory'])):
+            if not p:
+                continue
+            if filename == '-':
+                p.write_report(sys.stderr)
+            else:
+                with open(filename, 'w') as f:
+                    json.dump(p.get_report(), f, indent=4)
+        if builder.errors:
+            sys.exit(1)
     except Exception as e:
-        logger.error('EXCEPTION: %s', str(e))
+        logger.error('EXCEPTION: %s', str(e), extra={'code': 'exception'})
+        if events:
+            events.flush()
         type, value, tb = sys.exc_info()
-        import traceback
-        import pdb
         traceback.print_exc()
-        pdb.post_mortem(tb)
+        # No debugger in batch runs, where nobody would attend to it
+        if not (args and args['--keep-going']) and sys.stdin.isatty():
+            import pdb
+            pdb.post_mortem(tb)
         sys.exit(1)
 
 